@@ -0,0 +1,135 @@
+"""
+Latency / CPU benchmark for the FastAPI gateway.
+
+Run the gateway once with GATEWAY_MODE=proxy (plus Django on :8000) and once
+with GATEWAY_MODE=inprocess, then compare the numbers, e.g.:
+
+    python bench_gateway.py --url http://127.0.0.1:8001/receipts/last-month \
+        --requests 500 --concurrency 16 --pid <gateway pid> --pid <django pid>
+
+CPU time and peak memory are read from /proc/<pid>, so they are only
+reported on Linux. Time to first byte and peak RSS show whether a streamed
+listing (?stream=1 over a large range) really streams: a gateway that
+buffered the body would grow with the response size and send it late.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+
+def cpu_seconds(pid):
+    """user + system CPU time of a process in seconds (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process in MB (VmHWM, Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def run(url, total, concurrency):
+    latencies = []
+    first_bytes = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+
+        async def one():
+            nonlocal errors
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    async with client.stream("GET", url) as response:
+                        first_byte = None
+                        async for _ in response.aiter_raw():
+                            if first_byte is None:
+                                first_byte = time.perf_counter() - start
+                        if first_byte is not None:
+                            first_bytes.append(first_byte)
+                        if response.status_code >= 400:
+                            errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        # warm up connections and caches before measuring
+        await asyncio.gather(*(one() for _ in range(min(concurrency, total))))
+        latencies.clear()
+        first_bytes.clear()
+        errors = 0
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, first_bytes, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8001/receipts/last-month")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--pid",
+        type=int,
+        action="append",
+        default=[],
+        help="process to report CPU time for (repeatable)",
+    )
+    args = parser.parse_args()
+
+    cpu_before = {pid: cpu_seconds(pid) for pid in args.pid}
+    latencies, first_bytes, errors, elapsed = asyncio.run(
+        run(args.url, args.requests, args.concurrency)
+    )
+    cpu_after = {pid: cpu_seconds(pid) for pid in args.pid}
+
+    print(f"url:         {args.url}")
+    print(f"requests:    {len(latencies)} ({errors} errors), concurrency {args.concurrency}")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    if first_bytes:
+        print(f"first byte p50: {statistics.median(first_bytes) * 1000:.1f} ms")
+    for pid in args.pid:
+        if cpu_before[pid] is None or cpu_after[pid] is None:
+            print(f"cpu pid {pid}: unavailable")
+            continue
+        spent = cpu_after[pid] - cpu_before[pid]
+        print(
+            f"cpu pid {pid}: {spent:.2f} s total, "
+            f"{spent / max(len(latencies), 1) * 1000:.2f} ms per request"
+        )
+    for pid in args.pid:
+        rss = peak_rss_mb(pid)
+        print(f"peak rss pid {pid}: " + ("unavailable" if rss is None else f"{rss:.0f} MB"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,230 @@
-from fastapi import FastAPI
-import requests
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Request
 from fastapi import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+# "proxy" - Django runs as a separate service and is called over HTTP
+# "inprocess" - Django ASGI app is loaded into this process, no network hop
+GATEWAY_MODES = ("proxy", "inprocess")
+GATEWAY_MODE = os.getenv("GATEWAY_MODE", "proxy")
+if GATEWAY_MODE not in GATEWAY_MODES:
+    raise RuntimeError(
+        f"Unknown GATEWAY_MODE {GATEWAY_MODE!r}, use one of {', '.join(GATEWAY_MODES)}."
+    )
+# response body chunks of the in-process Django app held before it has to
+# wait for the client, keeps streamed responses at flat memory
+GATEWAY_INPROCESS_BUFFER_CHUNKS = int(os.getenv("GATEWAY_INPROCESS_BUFFER_CHUNKS", "16"))
+
+# Gateway -> Django connection settings (all overridable from the environment)
+DJANGO_API_URL = os.getenv("DJANGO_API_URL", "http://127.0.0.1:8000")
+GATEWAY_POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", "100"))
+GATEWAY_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("GATEWAY_KEEPALIVE_CONNECTIONS", str(GATEWAY_POOL_SIZE))
+)
+GATEWAY_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+GATEWAY_MAX_CONCURRENCY = int(os.getenv("GATEWAY_MAX_CONCURRENCY", "64"))
+GATEWAY_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "2"))
+
+# read timeouts per route group, in seconds
+ROUTE_TIMEOUTS = {
+    "rag": float(os.getenv("GATEWAY_RAG_TIMEOUT", "30")),
+    "receipts": float(os.getenv("GATEWAY_RECEIPTS_TIMEOUT", "15")),
+}
+
+# headers that describe the gateway <-> Django connection itself and must not
+# be copied to the client response
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "date",
+    "server",
+}
+
+
+def load_django_app():
+    """Imports the Django ASGI application from src_django/ into this process."""
+    django_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src_django")
+    if django_dir not in sys.path:
+        sys.path.insert(0, django_dir)
+    from src_django.asgi import application
+
+    return application
+
+
+django_app = load_django_app() if GATEWAY_MODE == "inprocess" else None
+
+
+class QueueByteStream(httpx.AsyncByteStream):
+    """Body of an in-process response, read from the queue the app writes to."""
+
+    def __init__(self, chunks, app_task, disconnected, request, read_timeout):
+        self.chunks = chunks
+        self.app_task = app_task
+        self.disconnected = disconnected
+        self.request = request
+        self.read_timeout = read_timeout
+        self.finished = False
+
+    async def __aiter__(self):
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.chunks.get(), self.read_timeout)
+            except asyncio.TimeoutError:
+                raise httpx.ReadTimeout("Django sent no data in time.", request=self.request)
+            if chunk is None:
+                break
+            yield chunk
+        self.finished = True
+
+    async def aclose(self):
+        # a client that went away before the end disconnects and stops the app
+        if not self.finished:
+            self.disconnected.set()
+            self.app_task.cancel()
+        try:
+            await self.app_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    Calls an ASGI app in this process and hands out the response body chunk by
+    chunk while the app is still producing it. httpx.ASGITransport collects
+    the whole body first, which would buffer streamed receipt listings.
+    """
+
+    def __init__(self, app, buffer_chunks):
+        self.app = app
+        self.buffer_chunks = buffer_chunks
+
+    async def handle_async_request(self, request):
+        # request bodies are small JSON documents, only responses are streamed
+        request_body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(name.lower(), value) for name, value in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 0),
+            "root_path": "",
+        }
+        request_sent = False
+        body_done = False
+        disconnected = asyncio.Event()
+        started = asyncio.get_running_loop().create_future()
+        chunks = asyncio.Queue(maxsize=self.buffer_chunks)
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": request_body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal body_done
+            if message["type"] == "http.response.start":
+                # the gateway may already have given up waiting for it
+                if not started.done():
+                    started.set_result(message)
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    # blocks while the client is behind, nothing piles up here
+                    await chunks.put(message["body"])
+                if not message.get("more_body", False):
+                    body_done = True
+                    await chunks.put(None)
+
+        async def run_app():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if not started.done():
+                    started.set_exception(e)
+                    return
+                print(f"Error in in-process response: {e}")
+            if not started.done():
+                started.set_exception(RuntimeError("Django sent no response."))
+                return
+            if not body_done:
+                # a body cut short by an error ends the stream truncated
+                await chunks.put(None)
 
-app = FastAPI()
+        # the per-route timeouts of proxy_backend(), like over the network
+        read_timeout = request.extensions.get("timeout", {}).get("read")
+        app_task = asyncio.create_task(run_app())
+        try:
+            message = await asyncio.wait_for(started, read_timeout)
+        except BaseException as e:
+            disconnected.set()
+            app_task.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise httpx.ReadTimeout("Django sent no response in time.", request=request)
+            if isinstance(e, Exception):
+                # callers handle transport failures, not whatever the app raised
+                raise httpx.TransportError(f"Django failed: {e!r}", request=request) from e
+            raise
+        return httpx.Response(
+            message["status"],
+            headers=message.get("headers", []),
+            stream=QueueByteStream(chunks, app_task, disconnected, request, read_timeout),
+            request=request,
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one pooled client for the whole process, connections are kept alive
+    # between requests instead of opening a new TCP connection every time
+    if django_app is not None:
+        # requests are handed straight to the Django ASGI app, "127.0.0.1"
+        # only has to satisfy ALLOWED_HOSTS
+        transport = StreamingASGITransport(django_app, GATEWAY_INPROCESS_BUFFER_CHUNKS)
+        base_url = "http://127.0.0.1"
+    else:
+        transport = None
+        base_url = DJANGO_API_URL
+    app.state.http = httpx.AsyncClient(
+        base_url=base_url,
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=GATEWAY_POOL_SIZE,
+            max_keepalive_connections=GATEWAY_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GATEWAY_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            ROUTE_TIMEOUTS["receipts"], connect=GATEWAY_CONNECT_TIMEOUT
+        ),
+    )
+    app.state.backend_slots = asyncio.Semaphore(GATEWAY_MAX_CONCURRENCY)
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -18,62 +239,119 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def proxy_backend(method: str, path: str, route: str, service: str, **kwargs):
+    """
+    Sends a request to Django through the shared client and streams the raw
+    upstream body back to the client with its status code and headers, the
+    body is never buffered or decoded in the gateway.
+    """
+    timeout = httpx.Timeout(ROUTE_TIMEOUTS[route], connect=GATEWAY_CONNECT_TIMEOUT)
+    slots = app.state.backend_slots
+    await slots.acquire()
+    try:
+        request = app.state.http.build_request(method, path, timeout=timeout, **kwargs)
+        response = await app.state.http.send(request, stream=True)
+    except httpx.HTTPError as e:
+        slots.release()
+        raise HTTPException(status_code=503, detail=f"Error contacting {service} service: {e}")
+    except BaseException:
+        # anything else (a cancelled request too) must not leak the slot
+        slots.release()
+        raise
+
+    released = False
+
+    async def close_upstream():
+        # the concurrency slot is held until the whole body has been sent
+        nonlocal released
+        if released:
+            return
+        released = True
+        await response.aclose()
+        slots.release()
+
+    async def body():
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await close_upstream()
+
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    }
+    return StreamingResponse(
+        body(),
+        status_code=response.status_code,
+        headers=headers,
+        background=BackgroundTask(close_upstream),
+    )
+
+
+# ?mode=receipts returns distinct receipts with their matching items as JSON,
+# ?mode=products distinct products with their item counts; the other search
+# options (?start_date=&end_date=&org_id=&unit_id=&category=, ?ef_search=,
+# ?iterative_scan=) are forwarded as they are, like on the receipts routes
 @app.get("/similar_receipts/{receipt_count}")
-def get_receipt(receipt_count: int, query: str):
+async def get_receipt(request: Request, receipt_count: int, query: str):
     payload = {
         "query": query,
         "receipts_count" : receipt_count
     }
-    URL = "http://127.0.0.1:8000/api/rag/"
-    try:
-        response = requests.post(URL, json=payload)
+    return await proxy_backend(
+        "POST",
+        "/api/rag/",
+        "rag",
+        "RAG",
+        json=payload,
+        params=request.query_params.multi_items(),
+    )
 
-        response.raise_for_status()
+# query parameters are forwarded as they are, so Django options like
+# ?stream=1 or keyset pagination (?page_size=N&cursor=<next_cursor>) work
+# through the gateway too
+@app.get("/receipts/")
+async def get_receipts_from_day_to_day(request: Request, start_date: str, end_date: str):
+    return await proxy_backend(
+        "GET",
+        "/api/get_receipts_from_day_to_day/",
+        "receipts",
+        "Django",
+        params=request.query_params.multi_items(),
+    )
 
-        return response.json()
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Error contacting RAG service: {e}")
-
-@app.get("/receipts/")
-def get_receipts_from_day_to_day(start_date: str, end_date: str):
-    URL = "http://127.0.0.1:8000/api/get_receipts_from_day_to_day/"
-    try:
-        response = requests.get(URL, params={"start_date": start_date, "end_date": end_date})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Error contacting Django service: {e}")
+@app.get("/receipts/statistics")
+async def get_receipts_statistics(request: Request, start_date: str, end_date: str):
+    # optional top, top_organizations, top_products, top_categories limits
+    return await proxy_backend(
+        "GET",
+        "/api/get_receipts_statistics/",
+        "receipts",
+        "Django",
+        params=request.query_params.multi_items(),
+    )
 
 
 @app.get("/receipts/last-day")
-def get_receipts_last_day():
-    URL = "http://127.0.0.1:8000/api/get_receipts_last_day"
-    try:
-        response = requests.get(URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Error contacting Django service: {e}")
+async def get_receipts_last_day(request: Request):
+    return await proxy_backend(
+        "GET", "/api/get_receipts_last_day/", "receipts", "Django", params=request.query_params.multi_items()
+    )
 
 
 @app.get("/receipts/last-week")
-def get_receipts_last_week():
-    URL = "http://127.0.0.1:8000/api/get_receipts_last_week"
-    try:
-        response = requests.get(URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Error contacting Django service: {e}")
+async def get_receipts_last_week(request: Request):
+    return await proxy_backend(
+        "GET", "/api/get_receipts_last_week/", "receipts", "Django", params=request.query_params.multi_items()
+    )
 
 
 @app.get("/receipts/last-month")
-def get_receipts_last_month():
-    URL = "http://127.0.0.1:8000/api/get_receipts_last_month"
-    try:
-        response = requests.get(URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Error contacting Django service: {e}")
+async def get_receipts_last_month(request: Request):
+    return await proxy_backend(
+        "GET", "/api/get_receipts_last_month/", "receipts", "Django", params=request.query_params.multi_items()
+    )
@@ -0,0 +1,116 @@
+"""
+Stored per-receipt JSON documents (ReceiptDocument).
+
+Triggers from migration 0002_receipt_document_queue put every written or
+changed receipt into receipt_document_queue and NOTIFY the
+"receipt_documents" channel, receipt_document_worker drains the queue with
+process_batch(). Listings first build the still queued receipts of their
+own range with refresh_range(), so they never lag behind the worker (or
+behind the backfill right after migrating) and always agree with the
+statistics of the same range.
+"""
+
+from db.queues import claim_batch_sql, claimed
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ReceiptDocument, ReceiptDocumentQueue
+from .pagination import decode_cursor, encode_cursor
+from .receipts import receipts_queryset, serialize_receipt
+from .renderers import dumps
+
+# same order as the live queries, served by receipt_document_issue_idx
+DOCUMENT_ORDERING = ("-issue_date", "-transaction_id")
+
+CHANNEL = "receipt_documents"
+
+# queued receipts now or before their last change inside a range, waits for
+# a worker that is building one of them right now instead of skipping it
+CLAIM_RANGE = """
+SELECT q.transaction_id FROM receipt_document_queue q
+LEFT JOIN transaction t ON t.id = q.transaction_id
+LEFT JOIN receipt_document d ON d.transaction_id = q.transaction_id
+WHERE t.issue_date BETWEEN %s AND %s OR d.issue_date BETWEEN %s AND %s
+FOR UPDATE OF q
+"""
+
+
+def build_documents(transaction_ids):
+    """Serializes the given receipts and stores or replaces their documents, returns how many."""
+    documents = [
+        ReceiptDocument(
+            transaction_id=receipt.id,
+            issue_date=receipt.issue_date,
+            body=dumps(serialize_receipt(receipt)).decode(),
+        )
+        for receipt in receipts_queryset().filter(id__in=transaction_ids)
+    ]
+    ReceiptDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=["transaction"],
+        update_fields=["issue_date", "body"],
+    )
+    return len(documents)
+
+
+def build_claimed(claim_sql, params):
+    """
+    (Re)builds the documents of the queued receipts claim_sql locks and
+    removes them from the queue. Returns the number handled.
+    """
+    with claimed(ReceiptDocumentQueue, claim_sql, params) as queued_ids:
+        # receipts deleted since they were queued have no transaction row
+        # anymore, build_documents() just skips them
+        if queued_ids:
+            build_documents(queued_ids)
+    return len(queued_ids)
+
+
+CLAIM_BATCH = claim_batch_sql(ReceiptDocumentQueue)
+
+
+def process_batch(batch_size):
+    """
+    Builds up to batch_size queued receipts, oldest first. Returns the number
+    handled, 0 when the queue is empty.
+    """
+    return build_claimed(CLAIM_BATCH, [batch_size])
+
+
+def refresh_range(start_date, end_date):
+    """Builds the queued receipts of a date range, returns how many."""
+    return build_claimed(CLAIM_RANGE, [start_date, end_date, start_date, end_date])
+
+
+def documents_in_range(start_date, end_date):
+    return ReceiptDocument.objects.filter(
+        issue_date__gte=start_date, issue_date__lte=end_date
+    ).order_by(*DOCUMENT_ORDERING)
+
+
+def document_bodies(start_date, end_date):
+    """Stored JSON of the receipts of a range, newest first, as bytes."""
+    bodies = documents_in_range(start_date, end_date).values_list("body", flat=True)
+    for body in bodies.iterator(chunk_size=settings.RECEIPTS_STREAM_CHUNK_SIZE):
+        yield body.encode()
+
+
+def documents_page(start_date, end_date, cursor, page_size):
+    """Keyset page of stored receipts, same contract as pagination.keyset_page."""
+    documents = documents_in_range(start_date, end_date)
+    if cursor:
+        issue_date, pk = decode_cursor(cursor)
+        documents = documents.filter(issue_date__lte=issue_date).filter(
+            Q(issue_date__lt=issue_date) | Q(transaction_id__lt=pk)
+        )
+
+    rows = list(
+        documents.values_list("transaction_id", "issue_date", "body")[: page_size + 1]
+    )
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        pk, issue_date, _ = rows[-1]
+        next_cursor = encode_cursor(issue_date, pk)
+    return [body.encode() for _, _, body in rows], next_cursor
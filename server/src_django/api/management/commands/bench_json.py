@@ -0,0 +1,98 @@
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from api.renderers import FastJsonResponse, orjson
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.test import override_settings
+
+
+def synthetic_payload(receipts, items_per_receipt):
+    """Receipts range response shaped like the real one, no database needed."""
+    start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    data = []
+    for n in range(receipts):
+        products = [
+            {
+                "name": f"Produkt {n % 300 + k}",
+                "quantity": float(1 + k % 3),
+                "price": round(0.35 + (n * 7 + k) % 900 / 100, 2),
+                "category": f"Category {k % 12}",
+            }
+            for k in range(items_per_receipt)
+        ]
+        data.append(
+            {
+                "receipt_id": n,
+                "issue_date": start + timedelta(minutes=17 * n),
+                "organization": {
+                    "organization_name": f"Organization {n % 8}",
+                    "organization_address": "Hlavna 1, 81101 Bratislava, Slovensko",
+                },
+                "products": products,
+                "total_price": sum(p["quantity"] * p["price"] for p in products),
+            }
+        )
+    data.append(
+        {
+            "organizations": {f"Organization {k}": 100 for k in range(8)},
+            "products": {f"Produkt {k}": 10 for k in range(300)},
+            "categories": {f"Category {k}": 50 for k in range(12)},
+        }
+    )
+    return data
+
+
+def measure(encode, runs):
+    """Best wall time over runs and peak traced memory of one run."""
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        encode()
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    encode()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+class Command(BaseCommand):
+    """Compares JsonResponse with FastJsonResponse on a receipts payload"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receipts", type=int, default=10000)
+        parser.add_argument("--items", type=int, default=6, help="items per receipt")
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        data = synthetic_payload(options["receipts"], options["items"])
+        self.stdout.write(
+            f"Payload: {options['receipts']} receipts x {options['items']} items"
+        )
+
+        candidates = [
+            ("JsonResponse (DjangoJSONEncoder)", lambda: JsonResponse(data, safe=False)),
+        ]
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed, skipping it."))
+        else:
+            candidates.append(
+                ("FastJsonResponse (orjson)", lambda: FastJsonResponse(data, safe=False))
+            )
+
+        baseline = None
+        with override_settings(API_JSON_ENCODER="orjson"):
+            for name, encode in candidates:
+                size = len(encode().content)
+                seconds, peak = measure(encode, options["runs"])
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f"{name:36} {seconds * 1000:9.1f} ms  "
+                    f"peak {peak / 2**20:7.1f} MiB  "
+                    f"body {size / 2**20:6.1f} MiB  "
+                    f"x{baseline / seconds:.1f}"
+                )
@@ -0,0 +1,51 @@
+from api.documents import build_documents
+from api.models import ReceiptDocument
+from db.models import Transaction
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Builds the per-receipt JSON documents of receipts that have none (initial fill, --rebuild)"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Delete all stored documents and build them again.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Receipts serialized and written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            count, _ = ReceiptDocument.objects.all().delete()
+            self.stdout.write(
+                self.style.WARNING(f"Deleted {count} stored receipt documents.")
+            )
+
+        missing = Transaction.objects.filter(document__isnull=True).order_by("id")
+        total = missing.count()
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("All receipts have documents."))
+            return
+
+        self.stdout.write(f"Building documents for {total} receipts...")
+        built = 0
+        last_id = 0
+        while True:
+            ids = list(
+                missing.filter(id__gt=last_id).values_list("id", flat=True)[
+                    : options["chunk_size"]
+                ]
+            )
+            if not ids:
+                break
+            built += build_documents(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"  {built}/{total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} receipt documents."))
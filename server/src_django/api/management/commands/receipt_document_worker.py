@@ -0,0 +1,15 @@
+from api.documents import CHANNEL, process_batch
+from api.models import ReceiptDocumentQueue
+from db.queues import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    """Builds the JSON documents of written and changed receipts as they are queued"""
+
+    channel = CHANNEL
+    queue_model = ReceiptDocumentQueue
+    default_batch_size = 500
+    label = "receipts"
+
+    def process_batch(self, batch_size):
+        return process_batch(batch_size)
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# a document is dropped whenever the receipt it was built from changes;
+# replaced in 0002 by triggers that queue the receipt for a rebuild
+CREATE_TRIGGERS = """
+CREATE FUNCTION receipt_document_drop_by_item() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM receipt_document
+    WHERE transaction_id IN (SELECT transaction_id FROM changed_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_drop_by_transaction() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM receipt_document
+    WHERE transaction_id IN (SELECT id FROM changed_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER item_receipt_document_insert AFTER INSERT ON item
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_item();
+CREATE TRIGGER item_receipt_document_delete AFTER DELETE ON item
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_item();
+CREATE TRIGGER transaction_receipt_document_delete AFTER DELETE ON transaction
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_transaction();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS transaction_receipt_document_delete ON transaction;
+DROP TRIGGER IF EXISTS item_receipt_document_delete ON item;
+DROP TRIGGER IF EXISTS item_receipt_document_insert ON item;
+DROP FUNCTION IF EXISTS receipt_document_drop_by_transaction();
+DROP FUNCTION IF EXISTS receipt_document_drop_by_item();
+"""
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('db', '0003_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptDocument',
+            fields=[
+                ('transaction', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='db.transaction')),
+                ('issue_date', models.DateTimeField(verbose_name='copy of transaction.issue_date')),
+                ('body', models.TextField(verbose_name='serialized receipt JSON')),
+            ],
+            options={
+                'verbose_name': 'receipt document',
+                'verbose_name_plural': 'receipt documents',
+                'db_table': 'receipt_document',
+                'indexes': [models.Index(fields=['-issue_date', '-transaction'], name='receipt_document_issue_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
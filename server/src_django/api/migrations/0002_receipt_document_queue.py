@@ -0,0 +1,190 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Documents are built at write time instead of on the first read: every
+# statement that writes a receipt or anything its JSON shows queues the
+# receipt in the same transaction and NOTIFYs receipt_document_worker.
+# Updates only queue rows whose serialized columns really changed.
+CREATE_TRIGGERS = """
+DROP TRIGGER IF EXISTS transaction_receipt_document_delete ON transaction;
+DROP TRIGGER IF EXISTS item_receipt_document_delete ON item;
+DROP TRIGGER IF EXISTS item_receipt_document_insert ON item;
+DROP FUNCTION IF EXISTS receipt_document_drop_by_transaction();
+DROP FUNCTION IF EXISTS receipt_document_drop_by_item();
+
+CREATE FUNCTION receipt_document_enqueue_items() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+    SELECT DISTINCT transaction_id, now() FROM changed_rows
+    ON CONFLICT (transaction_id) DO NOTHING;
+    PERFORM pg_notify('receipt_documents', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_enqueue_item_update() RETURNS trigger AS $$
+BEGIN
+    -- both receipts when an item moved to another one
+    INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+    SELECT DISTINCT changed.transaction_id, now()
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    CROSS JOIN LATERAL (VALUES (o.transaction_id), (n.transaction_id))
+        AS changed (transaction_id)
+    WHERE (o.name, o.quantity, o.price, o.ai_category, o.transaction_id)
+        IS DISTINCT FROM (n.name, n.quantity, n.price, n.ai_category, n.transaction_id)
+    ON CONFLICT (transaction_id) DO NOTHING;
+    IF FOUND THEN
+        PERFORM pg_notify('receipt_documents', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_enqueue_transactions() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+    SELECT id, now() FROM changed_rows
+    ON CONFLICT (transaction_id) DO NOTHING;
+    PERFORM pg_notify('receipt_documents', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_enqueue_transaction_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+    SELECT n.id, now()
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    WHERE (o.issue_date, o.org_id) IS DISTINCT FROM (n.issue_date, n.org_id)
+    ON CONFLICT (transaction_id) DO NOTHING;
+    IF FOUND THEN
+        PERFORM pg_notify('receipt_documents', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_drop_by_transaction() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM receipt_document
+    WHERE transaction_id IN (SELECT id FROM changed_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_enqueue_organization_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+    SELECT t.id, now()
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    JOIN transaction t ON t.org_id = n.id
+    WHERE (o.name, o.street_name, o.building_number, o.postal_code, o.municipality, o.country)
+        IS DISTINCT FROM
+          (n.name, n.street_name, n.building_number, n.postal_code, n.municipality, n.country)
+    ON CONFLICT (transaction_id) DO NOTHING;
+    IF FOUND THEN
+        PERFORM pg_notify('receipt_documents', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER item_receipt_document_insert AFTER INSERT ON item
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_items();
+CREATE TRIGGER item_receipt_document_delete AFTER DELETE ON item
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_items();
+CREATE TRIGGER item_receipt_document_update AFTER UPDATE ON item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_item_update();
+CREATE TRIGGER transaction_receipt_document_insert AFTER INSERT ON transaction
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_transactions();
+CREATE TRIGGER transaction_receipt_document_update AFTER UPDATE ON transaction
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_transaction_update();
+CREATE TRIGGER transaction_receipt_document_delete AFTER DELETE ON transaction
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_transaction();
+CREATE TRIGGER organization_receipt_document_update AFTER UPDATE ON organization
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_enqueue_organization_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS organization_receipt_document_update ON organization;
+DROP TRIGGER IF EXISTS transaction_receipt_document_delete ON transaction;
+DROP TRIGGER IF EXISTS transaction_receipt_document_update ON transaction;
+DROP TRIGGER IF EXISTS transaction_receipt_document_insert ON transaction;
+DROP TRIGGER IF EXISTS item_receipt_document_update ON item;
+DROP TRIGGER IF EXISTS item_receipt_document_delete ON item;
+DROP TRIGGER IF EXISTS item_receipt_document_insert ON item;
+DROP FUNCTION IF EXISTS receipt_document_enqueue_organization_update();
+DROP FUNCTION IF EXISTS receipt_document_drop_by_transaction();
+DROP FUNCTION IF EXISTS receipt_document_enqueue_transaction_update();
+DROP FUNCTION IF EXISTS receipt_document_enqueue_transactions();
+DROP FUNCTION IF EXISTS receipt_document_enqueue_item_update();
+DROP FUNCTION IF EXISTS receipt_document_enqueue_items();
+
+CREATE FUNCTION receipt_document_drop_by_item() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM receipt_document
+    WHERE transaction_id IN (SELECT transaction_id FROM changed_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION receipt_document_drop_by_transaction() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM receipt_document
+    WHERE transaction_id IN (SELECT id FROM changed_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER item_receipt_document_insert AFTER INSERT ON item
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_item();
+CREATE TRIGGER item_receipt_document_delete AFTER DELETE ON item
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_item();
+CREATE TRIGGER transaction_receipt_document_delete AFTER DELETE ON transaction
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION receipt_document_drop_by_transaction();
+"""
+
+# receipts written before this migration that have no document yet
+ENQUEUE_MISSING = """
+INSERT INTO receipt_document_queue (transaction_id, enqueued_at)
+SELECT t.id, now() FROM transaction t
+WHERE NOT EXISTS (SELECT 1 FROM receipt_document d WHERE d.transaction_id = t.id)
+ON CONFLICT (transaction_id) DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_receipt_document'),
+        ('db', '0004_rollup_update_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptDocumentQueue',
+            fields=[
+                ('transaction', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='db.transaction')),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'receipt_document_queue',
+                'indexes': [models.Index(fields=['enqueued_at'], name='receipt_document_queue_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(ENQUEUE_MISSING, reverse_sql=migrations.RunSQL.noop),
+    ]
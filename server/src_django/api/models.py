@@ -1,3 +1,58 @@
+from db.models import Transaction
 from django.db import models
 
-# Create your models here.
+
+# -- ======================================
+# -- RECEIPT DOCUMENT (denormalized API output)
+# -- ======================================
+# Exact JSON of one receipt as the receipts endpoints return it, so range
+# listings only concatenate stored text. Triggers from migration
+# 0002_receipt_document_queue queue a receipt whenever it is written or
+# anything its JSON shows changes (items, the receipt, its organization),
+# receipt_document_worker builds the documents right after the write.
+class ReceiptDocument(models.Model):
+    transaction = models.OneToOneField(
+        Transaction,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,  # external deletes are handled by a trigger
+        related_name="document",
+    )
+    issue_date = models.DateTimeField(verbose_name="copy of transaction.issue_date")
+    body = models.TextField(verbose_name="serialized receipt JSON")
+
+    class Meta:
+        db_table = "receipt_document"
+        verbose_name = "receipt document"
+        verbose_name_plural = "receipt documents"
+        indexes = [
+            models.Index(
+                fields=["-issue_date", "-transaction"],
+                name="receipt_document_issue_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return "receipt document model"
+
+
+class ReceiptDocumentQueue(models.Model):
+    """Receipts whose document has to be (re)built, filled by triggers."""
+
+    transaction = models.OneToOneField(
+        Transaction,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,  # the worker skips receipts deleted in the meantime
+        related_name="+",
+    )
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "receipt_document_queue"
+        indexes = [
+            models.Index(fields=["enqueued_at"], name="receipt_document_queue_idx"),
+        ]
+
+    def __str__(self):
+        return "receipt document queue model"
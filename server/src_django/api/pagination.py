@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+# receipts are listed newest first, id breaks ties between equal issue dates
+KEYSET_ORDERING = ("-issue_date", "-id")
+
+
+def encode_cursor(issue_date, pk):
+    """Opaque cursor pointing at the last receipt of a page."""
+    raw = json.dumps([issue_date.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns (issue_date, id) of a cursor, raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        issue_date, pk = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(issue_date), int(pk)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    One page of a Transaction queryset ordered by (issue_date, id) descending.
+    Rows after the cursor are selected with a WHERE condition instead of
+    OFFSET, so every page costs the same no matter how deep it is.
+    Returns (rows, next_cursor), next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*KEYSET_ORDERING)
+    if cursor:
+        issue_date, pk = decode_cursor(cursor)
+        # issue_date <= x bounds the index range scan, the OR picks the exact spot
+        queryset = queryset.filter(issue_date__lte=issue_date).filter(
+            Q(issue_date__lt=issue_date) | Q(id__lt=pk)
+        )
+
+    rows = list(queryset[: page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(last.issue_date, last.id)
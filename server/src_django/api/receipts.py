@@ -0,0 +1,75 @@
+from db.models import Transaction
+
+from .pagination import KEYSET_ORDERING
+from .statistics import receipt_total_price
+
+
+def get_organization_info(org):
+    org_street_name = ""
+    org_building_number = ""
+    org_postal_code = ""
+    org_municipality = ""
+    org_country = ""
+    if org.street_name:
+        org_street_name = org.street_name
+    if org.building_number:
+        org_building_number = org.building_number
+    if org.postal_code:
+        org_postal_code = org.postal_code
+    if org.municipality:
+        org_municipality = org.municipality
+    if org.country:
+        org_country = org.country
+
+    org_address = (
+        f"{org_street_name} {org_building_number}, "
+        f"{org_postal_code} {org_municipality}, {org_country}"
+    )
+    return org_address
+
+
+def serialize_receipt(receipt):
+    """Builds the API dict of one receipt, total_price comes from the database."""
+    org = receipt.org
+
+    org_address = get_organization_info(org)
+
+    items_list = []
+    for item in receipt.item_set.all():
+        items_list.append(
+            {
+                "name": item.name,
+                "quantity": float(item.quantity or 0),
+                "price": float(item.price or 0),
+                "category": item.ai_category,
+            }
+        )
+
+    return {
+        "receipt_id": receipt.id,
+        "issue_date": receipt.issue_date,
+        "organization": {
+            "organization_name": org.name,
+            "organization_address": org_address,
+        },
+        "products": items_list,
+        "total_price": receipt.total_price,
+    }
+
+
+def receipts_queryset():
+    """Transactions with everything a receipt dict needs."""
+    return (
+        Transaction.objects.select_related("org", "unit")
+        .prefetch_related("item_set")
+        .annotate(total_price=receipt_total_price())
+        .order_by(*KEYSET_ORDERING)
+    )
+
+
+def receipts_in_range(start_date, end_date):
+    """Transactions of a date range with everything a receipt dict needs."""
+    return receipts_queryset().filter(
+        issue_date__gte=start_date, issue_date__lte=end_date
+    )
+
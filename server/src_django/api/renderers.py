@@ -0,0 +1,106 @@
+"""
+Fast JSON output for the receipts and RAG endpoints.
+
+orjson is used when it is installed and API_JSON_ENCODER is "orjson": it
+serializes datetimes natively and writes bytes directly, Decimals fall back
+to str() like DjangoJSONEncoder does. Without it everything goes through the
+standard json module with ApiJSONEncoder, set up to write the very same
+bytes: compact separators, raw UTF-8 and datetimes with microseconds. Live
+responses and stored ReceiptDocuments therefore look the same whichever
+encoder wrote them.
+
+StreamingJsonResponse keeps ?stream=1 responses streamed under ASGI too.
+"""
+
+import json
+from datetime import datetime, time
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if orjson is not None:
+    # UTC datetimes end with "Z" like DjangoJSONEncoder output, statistics
+    # can have None keys (items without a category)
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class ApiJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its cut to milliseconds, like orjson."""
+
+    def default(self, o):
+        if isinstance(o, (datetime, time)):
+            value = o.isoformat()
+            if value.endswith("+00:00"):
+                value = value.removesuffix("+00:00") + "Z"
+            return value
+        return super().default(o)
+
+
+def orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def use_orjson():
+    return orjson is not None and settings.API_JSON_ENCODER == "orjson"
+
+
+def dumps(data):
+    """JSON bytes of data with the configured encoder."""
+    if use_orjson():
+        return orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        data, cls=ApiJSONEncoder, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """Drop-in JsonResponse replacement encoding with dumps()."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    StreamingHttpResponse of a sync iterator that is also streamed under ASGI.
+    Django's ASGI handler would consume the whole iterator with
+    sync_to_async(list) first, here it is read a few parts per thread hop.
+    """
+
+    parts_per_hop = 32
+
+    def __init__(self, streaming_content=(), **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(streaming_content, **kwargs)
+
+    def next_parts(self):
+        return list(islice(self.streaming_content, self.parts_per_hop))
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in super().__aiter__():
+                yield part
+            return
+        # thread_sensitive: the same thread (and DB connection) as the view,
+        # a server-side cursor stays usable between the hops
+        next_parts = sync_to_async(self.next_parts, thread_sensitive=True)
+        while parts := await next_parts():
+            for part in parts:
+                yield part
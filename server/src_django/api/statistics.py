@@ -0,0 +1,173 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+from db.models import DailyProductRollup, DailyUnitRollup, Item, Transaction
+from django.conf import settings
+from django.db.models import (
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
+
+
+def receipt_total_price():
+    """
+    Annotation for Transaction querysets: SUM(quantity * price) of its items,
+    computed by PostgreSQL as double precision. A correlated subquery, not a
+    JOIN + GROUP BY, so ordered and LIMITed listings only sum the receipts
+    they return instead of aggregating the whole range first.
+    """
+    totals = (
+        Item.objects.filter(transaction=OuterRef("pk"))
+        .order_by()
+        .values("transaction")
+        .annotate(
+            total=Sum(
+                ExpressionWrapper(F("quantity") * F("price"), output_field=FloatField())
+            )
+        )
+        .values("total")
+    )
+    return Coalesce(Subquery(totals), 0.0, output_field=FloatField())
+
+
+def count_by(queryset, field, limit=None):
+    """{value: count} grouped by field, most frequent first, optionally top-K."""
+    rows = (
+        queryset.order_by()
+        .values_list(field)
+        .annotate(count=Count("id"))
+        .order_by("-count", field)
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return {value: count for value, count in rows}
+
+
+def sum_by(queryset, field, counter_field):
+    """{value: SUM(counter_field)} grouped by field."""
+    rows = (
+        queryset.order_by()
+        .values_list(field)
+        .annotate(count=Sum(counter_field))
+    )
+    return {value: count for value, count in rows}
+
+
+def top(counts, limit=None):
+    """Same ordering as count_by() for counts merged in Python."""
+    rows = sorted(
+        ((value, count) for value, count in counts.items() if count),
+        key=lambda row: (-row[1], row[0] is None, row[0] or ""),
+    )
+    return dict(rows[:limit] if limit is not None else rows)
+
+
+def full_day_span(start_date, end_date):
+    """
+    (first_day, last_day) of the whole UTC days inside the window, the part
+    the rollups can answer, or None if the window has no whole day.
+    """
+    start = start_date.astimezone(dt_timezone.utc)
+    end = end_date.astimezone(dt_timezone.utc)
+    first_day = start.date()
+    if start.time() != time.min:
+        first_day += timedelta(days=1)
+    last_day = end.date()
+    if end.time() != time.max:
+        last_day -= timedelta(days=1)
+    if first_day > last_day:
+        return None
+    return first_day, last_day
+
+
+def day_start(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def raw_statistics(**issue_date_filters):
+    """Counts of one piece of the window computed from the raw rows."""
+    transactions = Transaction.objects.filter(
+        **{f"issue_date__{lookup}": value for lookup, value in issue_date_filters.items()}
+    )
+    items = Item.objects.filter(
+        **{
+            f"transaction__issue_date__{lookup}": value
+            for lookup, value in issue_date_filters.items()
+        }
+    )
+    return {
+        "organizations": count_by(transactions, "org__name"),
+        "products": count_by(items, "name"),
+        "categories": count_by(items, "ai_category"),
+    }
+
+
+def rollup_statistics(first_day, last_day):
+    """Counts of whole days summed from the daily rollup tables."""
+    units = DailyUnitRollup.objects.filter(day__gte=first_day, day__lte=last_day)
+    products = DailyProductRollup.objects.filter(day__gte=first_day, day__lte=last_day)
+    return {
+        "organizations": sum_by(units, "org__name", "receipt_count"),
+        "products": sum_by(products, "product", "item_count"),
+        "categories": sum_by(products, "category", "item_count"),
+    }
+
+
+def get_range_statistics(
+    start_date,
+    end_date,
+    top_organizations=None,
+    top_products=None,
+    top_categories=None,
+):
+    """
+    Statistics block of the receipts endpoints aggregated in the database:
+    receipts per organization and items per product and category.
+
+    With RECEIPTS_STATISTICS_FROM_ROLLUPS whole days of the window are read
+    from the daily rollups and only the partial days at its edges are
+    aggregated from the raw item rows.
+    """
+    span = None
+    if settings.RECEIPTS_STATISTICS_FROM_ROLLUPS:
+        span = full_day_span(start_date, end_date)
+
+    if span is None:
+        transactions = Transaction.objects.filter(
+            issue_date__gte=start_date, issue_date__lte=end_date
+        )
+        items = Item.objects.filter(
+            transaction__issue_date__gte=start_date,
+            transaction__issue_date__lte=end_date,
+        )
+        return {
+            "organizations": count_by(transactions, "org__name", top_organizations),
+            "products": count_by(items, "name", top_products),
+            "categories": count_by(items, "ai_category", top_categories),
+        }
+
+    first_day, last_day = span
+    parts = [rollup_statistics(first_day, last_day)]
+    if start_date < day_start(first_day):
+        parts.append(raw_statistics(gte=start_date, lt=day_start(first_day)))
+    after_last_day = day_start(last_day + timedelta(days=1))
+    if end_date >= after_last_day:
+        parts.append(raw_statistics(gte=after_last_day, lte=end_date))
+
+    merged = {"organizations": Counter(), "products": Counter(), "categories": Counter()}
+    for part in parts:
+        for name, counts in part.items():
+            merged[name].update(counts)
+
+    return {
+        "organizations": top(merged["organizations"], top_organizations),
+        "products": top(merged["products"], top_products),
+        "categories": top(merged["categories"], top_categories),
+    }
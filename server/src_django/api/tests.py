@@ -1,3 +1,474 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.documents import (
+    build_documents,
+    document_bodies,
+    documents_page,
+    process_batch,
+)
+from api.models import ReceiptDocument, ReceiptDocumentQueue
+from api.pagination import decode_cursor, encode_cursor, keyset_page
+from api.receipts import receipts_in_range
+from api.renderers import StreamingJsonResponse
+from api.statistics import get_range_statistics
+from db.models import Item, Organization, Transaction, Unit
+from db.rollups import rebuild_rollups, verify_rollups
+
+# big enough for the planner to prefer the indexes over sequential scans
+SEED_TRANSACTIONS = 20000
+ITEMS_PER_TRANSACTION = 3
+SEED_PRODUCTS = 400
+BIG_TABLES = {"transaction", "item", "receipt_document"}
+
+
+def seq_scans(plan):
+    """Relation names of all Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def outer_node_types(plan):
+    """Node types of a plan outside its correlated subplans (run per row)."""
+    found = [plan.get("Node Type")]
+    for child in plan.get("Plans", []):
+        if child.get("Parent Relationship") != "SubPlan":
+            found.extend(outer_node_types(child))
+    return found
+
+
+def create_shop():
+    """An organization with one unit for the receipts of a test."""
+    org = Organization.objects.create(
+        ico="1", dic="1", ic_dph="SK1", name="Lidl", building_number="1",
+        country="Slovensko", municipality="Bratislava", postal_code="81101",
+        street_name="Hlavna",
+    )
+    unit = Unit.objects.create(
+        org=org, name="Lidl Ruzinov", country="Slovensko",
+        municipality="Bratislava", postal_code="82101", building_number="2",
+        property_registration_number="1", street_name="Ruzinovska",
+        latitude=48.15, longitude=17.15,
+    )
+    return org, unit
+
+
+class QueryPlanTests(TestCase):
+    """Range queries and common generated-SQL shapes must use the indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        org, unit = create_shop()
+
+        cls.start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        Transaction.objects.bulk_create(
+            Transaction(
+                issue_date=cls.start + timedelta(minutes=53 * n), org=org, unit=unit
+            )
+            for n in range(SEED_TRANSACTIONS)
+        )
+
+        items = []
+        n = 0
+        for transaction_id in Transaction.objects.values_list("id", flat=True):
+            for _ in range(ITEMS_PER_TRANSACTION):
+                product = n % SEED_PRODUCTS
+                items.append(
+                    Item(
+                        transaction_id=transaction_id,
+                        quantity=1,
+                        name=f"Produkt {product}",
+                        price="1.50",
+                        ai_name_without_brand_and_quantity=f"produkt {product}",
+                        ai_name_in_english_without_brand_and_quantity=f"product {product}",
+                        ai_brand=f"Brand {product % 50}",
+                        # one rare category, like the ones the prompts filter on
+                        ai_category="Beer" if product == 7 else f"Category {product % 40}",
+                        ai_quantity_value=1,
+                        ai_quantity_unit="pcs",
+                    )
+                )
+                n += 1
+        Item.objects.bulk_create(items, batch_size=5000)
+
+        # the plans only depend on the table size, not on the stored JSON
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO receipt_document (transaction_id, issue_date, body) "
+                "SELECT id, issue_date, '{}' FROM transaction"
+            )
+            cursor.execute("TRUNCATE receipt_document_queue")
+            cursor.execute(
+                "ANALYZE organization, unit, transaction, item, receipt_document"
+            )
+
+    def plan(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            raw = cursor.fetchone()[0]
+        return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+    def assertNoSeqScans(self, sql, params=None):
+        plan = self.plan(sql, params)
+        scanned = [name for name in seq_scans(plan) if name in BIG_TABLES]
+        self.assertEqual(scanned, [], f"Sequential scan on {scanned} for:\n{sql}")
+
+    def week(self):
+        start = self.start + timedelta(days=200)
+        return start, start + timedelta(days=7)
+
+    def test_range_query(self):
+        start, end = self.week()
+        sql, params = receipts_in_range(start, end).query.sql_with_params()
+        self.assertNoSeqScans(sql, params)
+
+    def test_keyset_page_sums_only_the_returned_receipts(self):
+        # the whole seeded year, a range-wide GROUP BY would show up as an
+        # Aggregate node under the Limit
+        end = self.start + timedelta(days=400)
+        first, cursor = keyset_page(receipts_in_range(self.start, end), None, 50)
+        self.assertEqual(first[0].total_price, 4.5)
+        for page_cursor in (None, cursor):
+            with CaptureQueriesContext(connection) as queries:
+                keyset_page(receipts_in_range(self.start, end), page_cursor, 50)
+            plan = self.plan(queries.captured_queries[0]["sql"])
+            self.assertEqual(plan["Node Type"], "Limit")
+            self.assertNotIn("Aggregate", outer_node_types(plan))
+
+    def test_document_bodies(self):
+        start, end = self.week()
+        with CaptureQueriesContext(connection) as queries:
+            bodies = list(document_bodies(start, end))
+        self.assertTrue(bodies)
+        plan = self.plan(queries.captured_queries[0]["sql"])
+        self.assertEqual(seq_scans(plan), [])
+        self.assertNotIn("Sort", outer_node_types(plan))
+
+    def test_documents_page(self):
+        # the whole seeded year, only a page worth of index entries is read
+        end = self.start + timedelta(days=400)
+        first, cursor = documents_page(self.start, end, None, 50)
+        self.assertEqual(len(first), 50)
+        for page_cursor in (None, cursor):
+            with CaptureQueriesContext(connection) as queries:
+                documents_page(self.start, end, page_cursor, 50)
+            plan = self.plan(queries.captured_queries[0]["sql"])
+            self.assertEqual(plan["Node Type"], "Limit")
+            self.assertEqual(seq_scans(plan), [])
+            self.assertNotIn("Sort", outer_node_types(plan))
+
+    def test_range_items_prefetch(self):
+        start, end = self.week()
+        ids = list(receipts_in_range(start, end).values_list("id", flat=True))
+        sql, params = (
+            Item.objects.filter(transaction_id__in=ids).query.sql_with_params()
+        )
+        self.assertNoSeqScans(sql, params)
+
+    def test_range_statistics(self):
+        # mid-day bounds, the rollup mode also queries the raw rows of both edges
+        start, end = self.week()
+        start, end = start + timedelta(hours=5), end + timedelta(hours=5)
+        for from_rollups in (False, True):
+            with override_settings(RECEIPTS_STATISTICS_FROM_ROLLUPS=from_rollups):
+                with CaptureQueriesContext(connection) as queries:
+                    get_range_statistics(start, end)
+            self.assertTrue(queries.captured_queries)
+            for query in queries.captured_queries:
+                self.assertNoSeqScans(query["sql"])
+
+    def test_generated_sql_spent_in_range(self):
+        start, end = self.week()
+        self.assertNoSeqScans(
+            "SELECT COALESCE(SUM(i.price), 0) AS total_spent FROM item i "
+            "JOIN transaction t ON i.transaction_id = t.id "
+            "WHERE t.issue_date >= %s AND t.issue_date < %s",
+            (start, end),
+        )
+
+    def test_generated_sql_last_purchases(self):
+        self.assertNoSeqScans(
+            "SELECT t.id, t.issue_date FROM transaction t "
+            "ORDER BY t.issue_date DESC LIMIT 10"
+        )
+
+    def test_generated_sql_item_name_pattern(self):
+        start, end = self.week()
+        self.assertNoSeqScans(
+            "SELECT COALESCE(SUM(i.quantity), 0) AS total_items FROM item i "
+            "JOIN transaction t ON i.transaction_id = t.id "
+            "WHERE i.ai_name_in_english_without_brand_and_quantity ILIKE %s "
+            "AND t.issue_date >= %s AND t.issue_date < %s",
+            ("%product 123%", start, end),
+        )
+
+    def test_generated_sql_category_top_brands(self):
+        self.assertNoSeqScans(
+            "SELECT i.ai_brand, SUM(i.price) AS spent FROM item i "
+            "WHERE i.ai_category ILIKE %s "
+            "GROUP BY i.ai_brand ORDER BY spent DESC LIMIT 5",
+            ("Beer%",),
+        )
+
+
+class RollupStatisticsTests(TestCase):
+    """Trigger-maintained rollups must give the same statistics as raw rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        org, unit = create_shop()
+        start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        for n in range(40):
+            transaction = Transaction.objects.create(
+                issue_date=start + timedelta(hours=7 * n), org=org, unit=unit
+            )
+            Item.objects.bulk_create(
+                Item(
+                    transaction=transaction,
+                    quantity=1 + k,
+                    name=f"Rozok {(n + k) % 5}",
+                    price="0.12",
+                    ai_name_without_brand_and_quantity="rozok",
+                    ai_name_in_english_without_brand_and_quantity="roll",
+                    ai_brand="Billa",
+                    ai_category=f"Bakery {k}",
+                    ai_quantity_value=1,
+                    ai_quantity_unit="pcs",
+                )
+                for k in range(3)
+            )
+        Transaction.objects.filter(id=transaction.id).delete()
+
+    def test_rollups_are_in_sync(self):
+        self.assertEqual(verify_rollups(), {"unit": 0, "product": 0})
+        rebuild_rollups()
+        self.assertEqual(verify_rollups(), {"unit": 0, "product": 0})
+
+    def test_corrections_keep_rollups_in_sync(self):
+        item = Item.objects.order_by("id").first()
+        item.ai_category = "Bakery corrected"
+        item.price = "0.15"
+        item.save()
+        Item.objects.filter(id=item.id + 1).update(quantity=7, name="Rozok velky")
+        moved = Transaction.objects.order_by("id")[3]
+        moved.issue_date += timedelta(days=2, hours=3)
+        moved.save()
+        # same day, shop and unit
+        Transaction.objects.filter(id=moved.id).update(
+            issue_date=moved.issue_date + timedelta(minutes=1)
+        )
+        # an item moved to another receipt
+        Item.objects.filter(id=item.id + 2).update(transaction=moved)
+        self.assertEqual(verify_rollups(), {"unit": 0, "product": 0})
+
+    def test_rollup_statistics_match_raw(self):
+        # whole days in the middle, partial days at both edges
+        start = datetime(2024, 3, 1, 5, 30, tzinfo=timezone.utc)
+        end = datetime(2024, 3, 10, 13, 0, tzinfo=timezone.utc)
+        with override_settings(RECEIPTS_STATISTICS_FROM_ROLLUPS=True):
+            from_rollups = get_range_statistics(start, end, top_products=3)
+        with override_settings(RECEIPTS_STATISTICS_FROM_ROLLUPS=False):
+            from_raw = get_range_statistics(start, end, top_products=3)
+        self.assertEqual(from_rollups, from_raw)
+
+
+class StreamingJsonResponseTests(SimpleTestCase):
+    def test_asgi_iteration_does_not_consume_everything_first(self):
+        produced = []
+
+        def parts():
+            for n in range(1000):
+                produced.append(n)
+                yield b"x"
+
+        async def first_part():
+            response = StreamingJsonResponse(parts())
+            async for part in response:
+                return part, len(produced)
+
+        part, produced_before_first = async_to_sync(first_part)()
+        self.assertEqual(part, b"x")
+        self.assertLessEqual(produced_before_first, StreamingJsonResponse.parts_per_hop)
+
+
+class KeysetPaginationTests(TestCase):
+    URL = "/api/get_receipts_from_day_to_day/"
+
+    @classmethod
+    def setUpTestData(cls):
+        org, unit = create_shop()
+        start = datetime(2024, 6, 1, 8, 0, tzinfo=timezone.utc)
+        # pairs of receipts issued at the same second, the id breaks the tie
+        Transaction.objects.bulk_create(
+            Transaction(issue_date=start + timedelta(hours=n // 2), org=org, unit=unit)
+            for n in range(12)
+        )
+        cls.expected = list(
+            Transaction.objects.order_by("-issue_date", "-id").values_list("id", flat=True)
+        )
+
+    def get(self, **params):
+        return self.client.get(
+            self.URL, {"start_date": "2024-06-01", "end_date": "2024-06-02", **params}
+        )
+
+    def walk(self, page_size):
+        ids = []
+        cursor = None
+        while True:
+            params = {"page_size": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            page = self.get(**params).json()
+            self.assertLessEqual(len(page["receipts"]), page_size)
+            ids.extend(receipt["receipt_id"] for receipt in page["receipts"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_the_range_without_duplicates_or_gaps(self):
+        for from_documents in (True, False):
+            with override_settings(RECEIPTS_FROM_DOCUMENTS=from_documents):
+                # page size 3 ends pages inside pairs with equal issue_date
+                for page_size in (2, 3, 20):
+                    self.assertEqual(self.walk(page_size), self.expected)
+
+    def test_equal_issue_dates_are_ordered_by_id_descending(self):
+        first = self.get(page_size=1).json()
+        issue_date, pk = decode_cursor(first["next_cursor"])
+        tied = Transaction.objects.filter(issue_date=issue_date).order_by("-id")
+        self.assertEqual(len(tied), 2)
+        self.assertEqual(pk, tied[0].id)
+        second = self.get(page_size=1, cursor=first["next_cursor"]).json()
+        self.assertEqual(second["receipts"][0]["receipt_id"], tied[1].id)
+
+    def test_cursor_round_trip(self):
+        issue_date = datetime(2024, 6, 1, 8, 0, 0, 123456, tzinfo=timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(issue_date, 42)), (issue_date, 42))
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ("not-a-cursor", encode_cursor(datetime.now(timezone.utc), 1)[:-3]):
+            response = self.get(cursor=cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.json())
+
+    @override_settings(RECEIPTS_PAGE_SIZE_MAX=4)
+    def test_page_size_bounds(self):
+        self.assertEqual(self.get(page_size=0).status_code, 400)
+        self.assertEqual(self.get(page_size=-3).status_code, 400)
+        self.assertEqual(self.get(page_size="ten").status_code, 400)
+        # too large sizes are clamped, not rejected
+        self.assertEqual(len(self.get(page_size=1000).json()["receipts"]), 4)
+        with override_settings(RECEIPTS_PAGE_SIZE_DEFAULT=3):
+            self.assertEqual(len(self.get(cursor="").json()["receipts"]), 3)
+
+
+@override_settings(RECEIPTS_FROM_DOCUMENTS=True)
+class ReceiptDocumentTests(TestCase):
+    URL = "/api/get_receipts_from_day_to_day/"
+
+    def setUp(self):
+        self.org, unit = create_shop()
+        self.receipt = Transaction.objects.create(
+            issue_date=datetime(2024, 7, 1, 9, 0, tzinfo=timezone.utc),
+            org=self.org, unit=unit,
+        )
+        self.item = Item.objects.create(
+            transaction=self.receipt, quantity=2, name="Mlieko", price="0.99",
+            ai_name_without_brand_and_quantity="mlieko",
+            ai_name_in_english_without_brand_and_quantity="milk",
+            ai_brand="Rajo", ai_category="Dairy", ai_quantity_value=1,
+            ai_quantity_unit="l",
+        )
+
+    def listing(self):
+        response = self.client.get(
+            self.URL, {"start_date": "2024-07-01", "end_date": "2024-07-01", "page_size": 10}
+        )
+        return response.json()["receipts"]
+
+    def test_documents_are_built_at_write_time_and_follow_updates(self):
+        self.assertEqual(ReceiptDocumentQueue.objects.count(), 1)
+        self.assertEqual(process_batch(10), 1)
+        self.assertEqual(self.listing()[0]["products"][0]["category"], "Dairy")
+
+        # corrections of an item and of the shop queue the receipt again
+        Item.objects.filter(id=self.item.id).update(ai_category="Milk", price="1.09")
+        Organization.objects.filter(id=self.org.id).update(name="Coop Jednota")
+        # fields the document doesn't show don't
+        Item.objects.filter(id=self.item.id).update(ai_brand="Tami")
+        self.assertEqual(ReceiptDocumentQueue.objects.count(), 1)
+        process_batch(10)
+
+        receipt = self.listing()[0]
+        self.assertEqual(receipt["products"][0]["category"], "Milk")
+        self.assertEqual(receipt["products"][0]["price"], 1.09)
+        self.assertEqual(receipt["organization"]["organization_name"], "Coop Jednota")
+
+    def test_worker_drains_the_queue(self):
+        out = StringIO()
+        call_command("receipt_document_worker", "--once", stdout=out)
+        self.assertIn("Processed 1 receipts", out.getvalue())
+        self.assertFalse(ReceiptDocumentQueue.objects.exists())
+        self.assertTrue(ReceiptDocument.objects.filter(transaction=self.receipt).exists())
+
+    def test_listings_do_not_wait_for_the_worker(self):
+        # nothing drained the queue, the listing builds its own range
+        self.assertEqual(self.listing()[0]["receipt_id"], self.receipt.id)
+        self.assertFalse(ReceiptDocumentQueue.objects.exists())
+
+        # a receipt moved out of the range disappears from it right away
+        Transaction.objects.filter(id=self.receipt.id).update(
+            issue_date=datetime(2024, 7, 3, 9, 0, tzinfo=timezone.utc)
+        )
+        self.assertEqual(self.listing(), [])
+        self.assertEqual(process_batch(10), 0)
+
+    def test_deleted_receipts_lose_their_document(self):
+        process_batch(10)
+        self.receipt.delete()
+        self.assertFalse(ReceiptDocument.objects.exists())
+        # the cascaded item delete queued the receipt, nothing is built for it
+        process_batch(10)
+        self.assertFalse(ReceiptDocument.objects.exists())
+        self.assertFalse(ReceiptDocumentQueue.objects.exists())
+        self.assertEqual(self.listing(), [])
+
+    def test_stored_documents_do_not_depend_on_the_api_encoder(self):
+        # DjangoJSONEncoder alone would cut the microseconds orjson writes
+        Transaction.objects.filter(id=self.receipt.id).update(
+            issue_date=datetime(2024, 7, 1, 9, 0, 0, 123456, tzinfo=timezone.utc)
+        )
+        bodies = []
+        for encoder in ("orjson", "django"):
+            with override_settings(API_JSON_ENCODER=encoder):
+                build_documents([self.receipt.id])
+            bodies.append(ReceiptDocument.objects.get(transaction=self.receipt).body)
+        self.assertEqual(bodies[0], bodies[1])
+
+    def test_documents_match_the_live_listing(self):
+        Transaction.objects.filter(id=self.receipt.id).update(
+            issue_date=datetime(2024, 7, 1, 9, 0, 0, 123456, tzinfo=timezone.utc)
+        )
+        listings = []
+        for encoder in ("orjson", "django"):
+            for from_documents in (True, False):
+                with override_settings(
+                    API_JSON_ENCODER=encoder, RECEIPTS_FROM_DOCUMENTS=from_documents
+                ):
+                    build_documents([self.receipt.id])
+                    listings.append(self.listing())
+        self.assertEqual(listings[0][0]["issue_date"], "2024-07-01T09:00:00.123456Z")
+        for listing in listings[1:]:
+            self.assertEqual(listing, listings[0])
@@ -13,126 +13,174 @@
 import json
 from datetime import datetime, time, timedelta
 
-from db.models import Transaction
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from embeddings.models import ItemEmbedding
-from pgvector.django import CosineDistance
-from sentence_transformers import SentenceTransformer
-
-print("Loading Embedding model...")
-EMBEDDING_MODEL = SentenceTransformer(
-    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+from embeddings.provider import encode_query, get_embedding_model, get_query_cache
+from embeddings.search import (
+    FILTERS,
+    search_items,
+    search_params,
+    similar_products,
+    similar_receipts,
 )
 
+from .documents import document_bodies, documents_page, refresh_range
+from .pagination import decode_cursor, keyset_page
+from .receipts import receipts_in_range, serialize_receipt
+from .renderers import FastJsonResponse, StreamingJsonResponse, dumps
+from .statistics import get_range_statistics
+
+def stream_receipts(encoded_receipts, start_date, end_date):
+    """
+    Yields the same JSON array as the buffered response piece by piece:
+    every receipt is written out as soon as it is encoded, statistics go last.
+    """
+    yield b"["
+    try:
+        for body in encoded_receipts:
+            yield body + b", "
+        statistics = get_range_statistics(start_date, end_date)
+    except Exception as e:
+        # headers are already sent, the truncated array tells the client it failed
+        print(f"Error in stream_receipts: {e}")
+        return
+    yield dumps(statistics) + b"]"
+
+
+def get_receipts_from_documents(start_date, end_date, stream=False, page=None):
+    """
+    Same responses as get_receipts_in_range, built by concatenating the
+    stored per-receipt JSON documents instead of querying and serializing
+    every transaction with its items.
+    """
+    refresh_range(start_date, end_date)
+
+    if page:
+        cursor, page_size = page
+        bodies, next_cursor = documents_page(start_date, end_date, cursor, page_size)
+        return HttpResponse(
+            b'{"receipts": ['
+            + b", ".join(bodies)
+            + b'], "next_cursor": '
+            + dumps(next_cursor)
+            + b"}",
+            content_type="application/json",
+        )
 
-def get_organization_info(org):
-    org_street_name = ""
-    org_building_number = ""
-    org_postal_code = ""
-    org_municipality = ""
-    org_country = ""
-    if org.street_name:
-        org_street_name = org.street_name
-    if org.building_number:
-        org_building_number = org.building_number
-    if org.postal_code:
-        org_postal_code = org.postal_code
-    if org.municipality:
-        org_municipality = org.municipality
-    if org.country:
-        org_country = org.country
-
-    org_address = (
-        f"{org_street_name} {org_building_number}, "
-        f"{org_postal_code} {org_municipality}, {org_country}"
-    )
-    return org_address
+    if stream:
+        return StreamingJsonResponse(
+            stream_receipts(document_bodies(start_date, end_date), start_date, end_date)
+        )
 
+    parts = list(document_bodies(start_date, end_date))
+    parts.append(dumps(get_range_statistics(start_date, end_date)))
+    return HttpResponse(b"[" + b", ".join(parts) + b"]", content_type="application/json")
 
-def get_receipts_in_range(start_date, end_date):
-    try:
-        receipts = (
-            Transaction.objects.filter(
-                issue_date__gte=start_date, issue_date__lte=end_date
-            )
-            .select_related("org", "unit")
-            .prefetch_related("item_set")
-            .order_by("-issue_date")
-        )
 
-        data = []
-        statistics = {"organizations": {}, "products": {}, "categories": {}}
-        for receipt in receipts:
-            org = receipt.org
+def get_receipts_in_range(start_date, end_date, stream=False, page=None):
+    """
+    Receipts of a date range. By default a JSON array of all receipts followed
+    by the statistics dict; with page=(cursor, page_size) one keyset page
+    {"receipts": [...], "next_cursor": ...} without statistics.
+    """
+    try:
+        if settings.RECEIPTS_FROM_DOCUMENTS:
+            return get_receipts_from_documents(start_date, end_date, stream, page)
 
-            org_address = get_organization_info(org)
+        receipts = receipts_in_range(start_date, end_date)
 
-            statistics["organizations"][org.name] = (
-                statistics["organizations"].get(org.name, 0) + 1
+        if page:
+            cursor, page_size = page
+            rows, next_cursor = keyset_page(receipts, cursor, page_size)
+            return FastJsonResponse(
+                {
+                    "receipts": [serialize_receipt(receipt) for receipt in rows],
+                    "next_cursor": next_cursor,
+                }
             )
-            items_list = []
-            receipt_total_price = 0
-
-            for item in receipt.item_set.all():
-                category = item.ai_category
-                quantity = float(item.quantity or 0)
-                price = float(item.price or 0)
-                total_line_price = quantity * price
-
-                receipt_total_price += total_line_price
-
-                items_list.append(
-                    {
-                        "name": item.name,
-                        "quantity": quantity,
-                        "price": price,
-                        "category": category,
-                    }
-                )
-                statistics["products"][item.name] = (
-                    statistics["products"].get(item.name, 0) + 1
-                )
-                statistics["categories"][category] = (
-                    statistics["categories"].get(category, 0) + 1
+
+        if stream:
+            # server-side cursor, items are prefetched per chunk
+            encoded_receipts = (
+                dumps(serialize_receipt(receipt))
+                for receipt in receipts.iterator(
+                    chunk_size=settings.RECEIPTS_STREAM_CHUNK_SIZE
                 )
+            )
+            return StreamingJsonResponse(
+                stream_receipts(encoded_receipts, start_date, end_date)
+            )
 
-            receipt_data = {
-                "receipt_id": receipt.id,
-                "issue_date": receipt.issue_date,
-                "organization": {
-                    "organization_name": org.name,
-                    "organization_address": org_address,
-                },
-                "products": items_list,
-                "total_price": receipt_total_price,
-            }
-            data.append(receipt_data)
+        data = [serialize_receipt(receipt) for receipt in receipts]
         # print(data)
         # renderStatistics({
         #   shops: [],
         #   products: [],
         #   categories: []
         # }, [receiptData]);
-        data.append(statistics)
-        return JsonResponse(data, safe=False)
+        data.append(get_range_statistics(start_date, end_date))
+        return FastJsonResponse(data, safe=False)
 
     except Exception as e:
         print(f"Error in get_receipts_in_range: {e}")
-        return JsonResponse({"error": f"An internal error occurred: {e}"}, status=500)
+        return FastJsonResponse({"error": f"An internal error occurred: {e}"}, status=500)
 
 
-@csrf_exempt
-def get_receipts_from_day_to_day(request):
-    if request.method != "GET":
-        return JsonResponse({"error": "Only GET method is allowed."}, status=405)
+def is_stream_requested(request):
+    value = request.GET.get("stream")
+    if value is None:
+        return settings.RECEIPTS_STREAM_BY_DEFAULT
+    return value.lower() in ("1", "true", "yes")
+
+
+def parse_page(request):
+    """
+    (cursor, page_size) when the client asked for keyset pagination with
+    'cursor' and/or 'page_size', otherwise None. Raises ValueError.
+    """
+    cursor = request.GET.get("cursor")
+    page_size = request.GET.get("page_size")
+    if cursor is None and page_size is None:
+        return None
+
+    if page_size is None:
+        page_size = settings.RECEIPTS_PAGE_SIZE_DEFAULT
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise ValueError("'page_size' must be an integer.")
+    if page_size < 1:
+        raise ValueError("'page_size' must be a positive integer.")
+    page_size = min(page_size, settings.RECEIPTS_PAGE_SIZE_MAX)
+    if cursor:
+        decode_cursor(cursor)
+    return cursor, page_size
+
 
+def receipts_response(request, start_date, end_date):
+    """Range response in the mode the query string asks for."""
+    try:
+        page = parse_page(request)
+    except ValueError as e:
+        return FastJsonResponse({"error": str(e)}, status=400)
+
+    return get_receipts_in_range(
+        start_date, end_date, is_stream_requested(request), page
+    )
+
+
+def parse_date_range(request):
+    """
+    Reads 'start_date' and 'end_date' (YYYY-MM-DD) from the query string.
+    Returns (start_date, end_date, None) or (None, None, error response).
+    """
     start_date_str = request.GET.get("start_date")
     end_date_str = request.GET.get("end_date")
 
     if not start_date_str or not end_date_str:
-        return JsonResponse(
+        return None, None, FastJsonResponse(
             {
                 "error": "Missing parameters. Both 'start_date' and 'end_date' are required (YYYY-MM-DD)."
             },
@@ -147,77 +195,162 @@ def get_receipts_from_day_to_day(request):
         end_date = timezone.make_aware(datetime.combine(end_date_obj, time.max))
 
     except ValueError:
-        return JsonResponse(
+        return None, None, FastJsonResponse(
             {"error": "Invalid date format. Please use YYYY-MM-DD."}, status=400
         )
 
-    return get_receipts_in_range(start_date, end_date)
+    return start_date, end_date, None
+
+
+def parse_top_limit(request, name):
+    """Optional positive integer top-K limit, falls back to the common 'top'."""
+    value = request.GET.get(name, request.GET.get("top"))
+    if value is None:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"'{name}' must be a positive integer.")
+    return limit
+
+
+@csrf_exempt
+def get_receipts_from_day_to_day(request):
+    if request.method != "GET":
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
+
+    start_date, end_date, error = parse_date_range(request)
+    if error:
+        return error
+
+    return receipts_response(request, start_date, end_date)
+
+
+@csrf_exempt
+def get_receipts_statistics(request):
+    """Only the statistics block of a date range, without the receipts."""
+    if request.method != "GET":
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
+
+    start_date, end_date, error = parse_date_range(request)
+    if error:
+        return error
+
+    try:
+        limits = {
+            name: parse_top_limit(request, name)
+            for name in ("top_organizations", "top_products", "top_categories")
+        }
+    except ValueError:
+        return FastJsonResponse(
+            {"error": "Top limits must be positive integers."}, status=400
+        )
+
+    try:
+        return FastJsonResponse(get_range_statistics(start_date, end_date, **limits))
+    except Exception as e:
+        print(f"Error in get_receipts_statistics: {e}")
+        return FastJsonResponse({"error": f"An internal error occurred: {e}"}, status=500)
 
 
 @csrf_exempt
 def get_receipts_last_day(request):
     if request.method != "GET":
-        return JsonResponse({"error": "Only GET method is allowed."}, status=405)
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
 
     end_date = timezone.now()
     start_date = end_date - timedelta(days=1)
 
-    return get_receipts_in_range(start_date, end_date)
+    return receipts_response(request, start_date, end_date)
 
 
 @csrf_exempt
 def get_receipts_last_week(request):
     if request.method != "GET":
-        return JsonResponse({"error": "Only GET method is allowed."}, status=405)
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
 
     end_date = timezone.now()
     start_date = end_date - timedelta(weeks=1)
 
-    return get_receipts_in_range(start_date, end_date)
+    return receipts_response(request, start_date, end_date)
 
 
 @csrf_exempt
 def get_receipts_last_month(request):
     if request.method != "GET":
-        return JsonResponse({"error": "Only GET method is allowed."}, status=405)
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
 
     end_date = timezone.now()
     start_date = end_date - timedelta(days=30)
 
-    return get_receipts_in_range(start_date, end_date)
+    return receipts_response(request, start_date, end_date)
+
+
+def rag_option(request, data, name):
+    """A search option of the JSON body, else of the query string (the gateway forwards it)."""
+    value = data.get(name)
+    return request.GET.get(name) if value is None else value
+
+
+def rag_filters(request, data):
+    if "filters" in data:
+        return data["filters"]
+    filters = {name: request.GET[name] for name in FILTERS if name in request.GET}
+    return filters or None
 
 
 @csrf_exempt
 def ask_rag_question(request):
     if request.method != "POST":
-        return JsonResponse({"error": "Only POST method is allowed."}, status=405)
+        return FastJsonResponse({"error": "Only POST method is allowed."}, status=405)
 
-    if not EMBEDDING_MODEL:
-        return JsonResponse({"error": "Backend models is not initialized."}, status=503)
+    try:
+        get_embedding_model()
+    except Exception as e:
+        print(f"Failed to load embedding model: {e}")
+        return FastJsonResponse({"error": "Backend models is not initialized."}, status=503)
 
     try:
         data = json.loads(request.body)
         query = data.get("query")
         number_of_similar_receipts = data.get("receipts_count")
+        params = search_params(
+            rag_option(request, data, "ef_search"),
+            rag_option(request, data, "iterative_scan"),
+            rag_option(request, data, "mode"),
+            rag_filters(request, data),
+        )
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+        return FastJsonResponse({"error": "Invalid JSON body."}, status=400)
+    except ValueError as e:
+        return FastJsonResponse({"error": str(e)}, status=400)
 
     if not query:
-        return JsonResponse({"error": "No 'query' provided in JSON body."}, status=400)
+        return FastJsonResponse({"error": "No 'query' provided in JSON body."}, status=400)
     if not number_of_similar_receipts:
-        return JsonResponse(
+        return FastJsonResponse(
             {"error": "No 'receipts_count' provided in JSON body."}, status=400
         )
 
     try:
-        query_embedding = EMBEDDING_MODEL.encode(query)
+        query_embedding = encode_query(query)
 
-        similar_items = ItemEmbedding.objects.annotate(
-            distance=CosineDistance("embedding", query_embedding)
-        ).order_by("distance")[:number_of_similar_receipts]
+        if params["mode"] == "receipts":
+            receipts = similar_receipts(
+                query_embedding, number_of_similar_receipts, params
+            )
+            return FastJsonResponse({"receipts": receipts})
+        if params["mode"] == "products":
+            products = similar_products(
+                query_embedding, number_of_similar_receipts, params
+            )
+            return FastJsonResponse({"products": products})
+
+        similar_items = search_items(
+            query, query_embedding, number_of_similar_receipts, params
+        )
 
         if not similar_items:
-            return JsonResponse(
+            return FastJsonResponse(
                 {
                     "answer": "I could not find any relevant items in the database for your query.",
                     "context": "",
@@ -226,7 +359,7 @@ def ask_rag_question(request):
         context = "Similar items: \n\n"
         for item in similar_items:
             context += item.text_content + "\n\n"
-        return JsonResponse(context, safe=False)
+        return FastJsonResponse(context, safe=False)
     #     context_items = [item.text_content for item in similar_items]
     #     context = "\n\n".join(context_items)
 
@@ -252,4 +385,13 @@ def ask_rag_question(request):
 
     except Exception as e:
         print(f"Error during RAG execution: {e}")
-        return JsonResponse({"error": f"An internal error occurred: {e}"}, status=500)
+        return FastJsonResponse({"error": f"An internal error occurred: {e}"}, status=500)
+
+
+@csrf_exempt
+def get_rag_cache_stats(request):
+    """Hit/miss counters of this worker's query embedding cache."""
+    if request.method != "GET":
+        return FastJsonResponse({"error": "Only GET method is allowed."}, status=405)
+
+    return FastJsonResponse(get_query_cache().stats())
@@ -0,0 +1,41 @@
+from db.rollups import rebuild_rollups, verify_rollups
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Rebuilds and/or verifies the daily rollup tables"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute all rollups from the transaction and item tables.",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Compare rollups with a fresh aggregation of the raw rows.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["rebuild"] and not options["verify"]:
+            raise CommandError("Nothing to do, pass --rebuild and/or --verify.")
+
+        if options["rebuild"]:
+            self.stdout.write("Rebuilding daily rollups...")
+            unit_rows, product_rows = rebuild_rollups()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Rollups rebuilt: {unit_rows} unit rows, {product_rows} product rows."
+                )
+            )
+
+        if options["verify"]:
+            self.stdout.write("Verifying daily rollups...")
+            mismatches = verify_rollups()
+            if any(mismatches.values()):
+                raise CommandError(
+                    f"Rollups are out of sync: {mismatches['unit']} unit rows and "
+                    f"{mismatches['product']} product rows differ. Run with --rebuild."
+                )
+            self.stdout.write(self.style.SUCCESS("Rollups match the raw data."))
@@ -0,0 +1,40 @@
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-issue_date', '-id'], name='transaction_issue_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['transaction'], include=('quantity', 'price'), name='item_transaction_cover_idx'),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='transaction',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='db.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ai_category'], name='item_ai_category_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ai_brand'], name='item_ai_brand_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ai_name_in_english_without_brand_and_quantity'], name='item_ai_name_en_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,155 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Statement-level triggers with transition tables: one INSERT/DELETE
+# statement on transaction or item updates the rollups with a single
+# grouped upsert, whatever the number of rows. Both triggers of a table
+# name their transition table "changed_rows" so they can share a function.
+CREATE_TRIGGERS = """
+CREATE FUNCTION rollup_transaction_change() RETURNS trigger AS $$
+DECLARE
+    delta integer := CASE WHEN TG_OP = 'DELETE' THEN -1 ELSE 1 END;
+BEGIN
+    INSERT INTO daily_unit_rollup
+        (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+    SELECT (t.issue_date AT TIME ZONE 'UTC')::date, t.org_id, t.unit_id,
+           delta * COUNT(*), 0, 0, 0
+    FROM changed_rows t
+    GROUP BY 1, 2, 3
+    ON CONFLICT ON CONSTRAINT daily_unit_rollup_key DO UPDATE SET
+        receipt_count = daily_unit_rollup.receipt_count + EXCLUDED.receipt_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION rollup_item_change() RETURNS trigger AS $$
+DECLARE
+    delta integer := CASE WHEN TG_OP = 'DELETE' THEN -1 ELSE 1 END;
+BEGIN
+    INSERT INTO daily_product_rollup
+        (day, org_id, unit_id, category, product, item_count, quantity, spend)
+    SELECT (t.issue_date AT TIME ZONE 'UTC')::date, t.org_id, t.unit_id,
+           i.ai_category, i.name,
+           delta * COUNT(*),
+           delta * COALESCE(SUM(i.quantity), 0),
+           delta * COALESCE(SUM(i.quantity * i.price), 0)
+    FROM changed_rows i
+    JOIN transaction t ON t.id = i.transaction_id
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT ON CONSTRAINT daily_product_rollup_key DO UPDATE SET
+        item_count = daily_product_rollup.item_count + EXCLUDED.item_count,
+        quantity = daily_product_rollup.quantity + EXCLUDED.quantity,
+        spend = daily_product_rollup.spend + EXCLUDED.spend;
+
+    INSERT INTO daily_unit_rollup
+        (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+    SELECT (t.issue_date AT TIME ZONE 'UTC')::date, t.org_id, t.unit_id, 0,
+           delta * COUNT(*),
+           delta * COALESCE(SUM(i.quantity), 0),
+           delta * COALESCE(SUM(i.quantity * i.price), 0)
+    FROM changed_rows i
+    JOIN transaction t ON t.id = i.transaction_id
+    GROUP BY 1, 2, 3
+    ON CONFLICT ON CONSTRAINT daily_unit_rollup_key DO UPDATE SET
+        item_count = daily_unit_rollup.item_count + EXCLUDED.item_count,
+        quantity = daily_unit_rollup.quantity + EXCLUDED.quantity,
+        spend = daily_unit_rollup.spend + EXCLUDED.spend;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transaction_rollup_insert AFTER INSERT ON transaction
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_transaction_change();
+CREATE TRIGGER transaction_rollup_delete AFTER DELETE ON transaction
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_transaction_change();
+CREATE TRIGGER item_rollup_insert AFTER INSERT ON item
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_item_change();
+CREATE TRIGGER item_rollup_delete AFTER DELETE ON item
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_item_change();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS item_rollup_delete ON item;
+DROP TRIGGER IF EXISTS item_rollup_insert ON item;
+DROP TRIGGER IF EXISTS transaction_rollup_delete ON transaction;
+DROP TRIGGER IF EXISTS transaction_rollup_insert ON transaction;
+DROP FUNCTION IF EXISTS rollup_item_change();
+DROP FUNCTION IF EXISTS rollup_transaction_change();
+"""
+
+BACKFILL = """
+INSERT INTO daily_unit_rollup
+    (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+SELECT (t.issue_date AT TIME ZONE 'UTC')::date, t.org_id, t.unit_id,
+       COUNT(DISTINCT t.id), COUNT(i.id),
+       COALESCE(SUM(i.quantity), 0), COALESCE(SUM(i.quantity * i.price), 0)
+FROM transaction t
+LEFT JOIN item i ON i.transaction_id = t.id
+GROUP BY 1, 2, 3;
+
+INSERT INTO daily_product_rollup
+    (day, org_id, unit_id, category, product, item_count, quantity, spend)
+SELECT (t.issue_date AT TIME ZONE 'UTC')::date, t.org_id, t.unit_id,
+       i.ai_category, i.name,
+       COUNT(*), COALESCE(SUM(i.quantity), 0), COALESCE(SUM(i.quantity * i.price), 0)
+FROM item i
+JOIN transaction t ON t.id = i.transaction_id
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0002_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUnitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='UTC day of issue_date')),
+                ('receipt_count', models.BigIntegerField(default=0, verbose_name='receipts')),
+                ('item_count', models.BigIntegerField(default=0, verbose_name='line items')),
+                ('quantity', models.FloatField(default=0, verbose_name='sum of item quantities')),
+                ('spend', models.FloatField(default=0, verbose_name='sum of quantity * price')),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.organization')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.unit')),
+            ],
+            options={
+                'verbose_name': 'daily unit rollup',
+                'verbose_name_plural': 'daily unit rollups',
+                'db_table': 'daily_unit_rollup',
+                'constraints': [models.UniqueConstraint(fields=('day', 'org', 'unit'), name='daily_unit_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='UTC day of issue_date')),
+                ('category', models.TextField(null=True, verbose_name='item.ai_category')),
+                ('product', models.TextField(null=True, verbose_name='item.name')),
+                ('item_count', models.BigIntegerField(default=0, verbose_name='line items')),
+                ('quantity', models.FloatField(default=0, verbose_name='sum of item quantities')),
+                ('spend', models.FloatField(default=0, verbose_name='sum of quantity * price')),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.organization')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.unit')),
+            ],
+            options={
+                'verbose_name': 'daily product rollup',
+                'verbose_name_plural': 'daily product rollups',
+                'db_table': 'daily_product_rollup',
+                'constraints': [models.UniqueConstraint(fields=('day', 'org', 'unit', 'category', 'product'), name='daily_product_rollup_key', nulls_distinct=False)],
+            },
+        ),
+        # triggers first: they lock out writers until the migration commits,
+        # so the backfill sees every row and no insert is counted twice
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
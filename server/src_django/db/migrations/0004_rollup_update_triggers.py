@@ -0,0 +1,124 @@
+from django.db import migrations
+
+# Corrections of already stored rows move their share of the rollups: the
+# old values are subtracted, the new ones added. Transition tables can't be
+# combined with a column list, so these are row-level triggers that only
+# fire when a column the rollups are keyed or summed by really changes.
+CREATE_TRIGGERS = """
+CREATE FUNCTION rollup_item_delta(
+    t_day date, t_org_id bigint, t_unit_id bigint, i_category text, i_product text,
+    d_items bigint, d_quantity double precision, d_spend double precision
+) RETURNS void AS $$
+BEGIN
+    INSERT INTO daily_product_rollup
+        (day, org_id, unit_id, category, product, item_count, quantity, spend)
+    VALUES (t_day, t_org_id, t_unit_id, i_category, i_product, d_items, d_quantity, d_spend)
+    ON CONFLICT ON CONSTRAINT daily_product_rollup_key DO UPDATE SET
+        item_count = daily_product_rollup.item_count + EXCLUDED.item_count,
+        quantity = daily_product_rollup.quantity + EXCLUDED.quantity,
+        spend = daily_product_rollup.spend + EXCLUDED.spend;
+
+    INSERT INTO daily_unit_rollup
+        (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+    VALUES (t_day, t_org_id, t_unit_id, 0, d_items, d_quantity, d_spend)
+    ON CONFLICT ON CONSTRAINT daily_unit_rollup_key DO UPDATE SET
+        item_count = daily_unit_rollup.item_count + EXCLUDED.item_count,
+        quantity = daily_unit_rollup.quantity + EXCLUDED.quantity,
+        spend = daily_unit_rollup.spend + EXCLUDED.spend;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION rollup_item_update() RETURNS trigger AS $$
+DECLARE
+    old_t transaction%ROWTYPE;
+    new_t transaction%ROWTYPE;
+BEGIN
+    SELECT * INTO old_t FROM transaction WHERE id = OLD.transaction_id;
+    SELECT * INTO new_t FROM transaction WHERE id = NEW.transaction_id;
+    PERFORM rollup_item_delta(
+        (old_t.issue_date AT TIME ZONE 'UTC')::date, old_t.org_id, old_t.unit_id,
+        OLD.ai_category, OLD.name, -1, -OLD.quantity, -(OLD.quantity * OLD.price)
+    );
+    PERFORM rollup_item_delta(
+        (new_t.issue_date AT TIME ZONE 'UTC')::date, new_t.org_id, new_t.unit_id,
+        NEW.ai_category, NEW.name, 1, NEW.quantity, NEW.quantity * NEW.price
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION rollup_transaction_update() RETURNS trigger AS $$
+DECLARE
+    old_day date := (OLD.issue_date AT TIME ZONE 'UTC')::date;
+    new_day date := (NEW.issue_date AT TIME ZONE 'UTC')::date;
+    r record;
+BEGIN
+    -- two statements, a time change within the same day hits one row twice
+    INSERT INTO daily_unit_rollup
+        (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+    VALUES (old_day, OLD.org_id, OLD.unit_id, -1, 0, 0, 0)
+    ON CONFLICT ON CONSTRAINT daily_unit_rollup_key DO UPDATE SET
+        receipt_count = daily_unit_rollup.receipt_count + EXCLUDED.receipt_count;
+    INSERT INTO daily_unit_rollup
+        (day, org_id, unit_id, receipt_count, item_count, quantity, spend)
+    VALUES (new_day, NEW.org_id, NEW.unit_id, 1, 0, 0, 0)
+    ON CONFLICT ON CONSTRAINT daily_unit_rollup_key DO UPDATE SET
+        receipt_count = daily_unit_rollup.receipt_count + EXCLUDED.receipt_count;
+
+    FOR r IN
+        SELECT ai_category, name, COUNT(*) AS items,
+               SUM(quantity) AS quantity, SUM(quantity * price) AS spend
+        FROM item WHERE transaction_id = NEW.id
+        GROUP BY 1, 2
+    LOOP
+        PERFORM rollup_item_delta(
+            old_day, OLD.org_id, OLD.unit_id, r.ai_category, r.name,
+            -r.items, -r.quantity, -r.spend
+        );
+        PERFORM rollup_item_delta(
+            new_day, NEW.org_id, NEW.unit_id, r.ai_category, r.name,
+            r.items, r.quantity, r.spend
+        );
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER item_rollup_update
+    AFTER UPDATE OF ai_category, name, quantity, price, transaction_id ON item
+    FOR EACH ROW
+    WHEN (OLD.ai_category IS DISTINCT FROM NEW.ai_category
+          OR OLD.name IS DISTINCT FROM NEW.name
+          OR OLD.quantity IS DISTINCT FROM NEW.quantity
+          OR OLD.price IS DISTINCT FROM NEW.price
+          OR OLD.transaction_id IS DISTINCT FROM NEW.transaction_id)
+    EXECUTE FUNCTION rollup_item_update();
+CREATE TRIGGER transaction_rollup_update
+    AFTER UPDATE OF issue_date, org_id, unit_id ON transaction
+    FOR EACH ROW
+    WHEN (OLD.issue_date IS DISTINCT FROM NEW.issue_date
+          OR OLD.org_id IS DISTINCT FROM NEW.org_id
+          OR OLD.unit_id IS DISTINCT FROM NEW.unit_id)
+    EXECUTE FUNCTION rollup_transaction_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS transaction_rollup_update ON transaction;
+DROP TRIGGER IF EXISTS item_rollup_update ON item;
+DROP FUNCTION IF EXISTS rollup_transaction_update();
+DROP FUNCTION IF EXISTS rollup_item_update();
+DROP FUNCTION IF EXISTS rollup_item_delta(
+    date, bigint, bigint, text, text, bigint, double precision, double precision
+);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0003_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
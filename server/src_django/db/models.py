@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 # -- ======================================
@@ -124,6 +125,12 @@ class Transaction(models.Model):
         verbose_name = "transaction"
         verbose_name_plural = "transactions"
         ordering = ["id"]
+        indexes = [
+            # range queries filter and sort on issue_date, newest first
+            models.Index(
+                fields=["-issue_date", "-id"], name="transaction_issue_date_id_idx"
+            ),
+        ]
 
     def __str__(self):
         return "transaction model"
@@ -153,6 +160,7 @@ class Item(models.Model):
     transaction = models.ForeignKey(
         Transaction,
         on_delete=models.CASCADE,
+        db_index=False,  # covered by item_transaction_cover_idx
     )
     quantity = models.FloatField(verbose_name="item quantity")
     name = models.TextField(verbose_name="item's name")
@@ -177,6 +185,86 @@ class Item(models.Model):
         verbose_name = "item"
         verbose_name_plural = "items"
         ordering = ["id"]
+        indexes = [
+            # items of a receipt with what totals need, without touching the heap
+            models.Index(
+                fields=["transaction"],
+                include=["quantity", "price"],
+                name="item_transaction_cover_idx",
+            ),
+            # ILIKE '%...%' filters generated by the text-to-SQL prompts
+            GinIndex(
+                fields=["ai_category"],
+                name="item_ai_category_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["ai_brand"],
+                name="item_ai_brand_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["ai_name_in_english_without_brand_and_quantity"],
+                name="item_ai_name_en_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self):
         return "item model"
+
+
+# -- ======================================
+# -- DAILY ROLLUPS (spending analytics)
+# -- ======================================
+# Maintained incrementally by triggers on transaction and item (see
+# migrations 0003_daily_rollups and 0004_rollup_update_triggers, which also
+# follow corrections of stored rows), days are UTC calendar days of issue_date.
+# Rebuild / verify with `python manage.py rollups --rebuild / --verify`.
+class DailyUnitRollup(models.Model):
+    day = models.DateField(verbose_name="UTC day of issue_date")
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE)
+    receipt_count = models.BigIntegerField(default=0, verbose_name="receipts")
+    item_count = models.BigIntegerField(default=0, verbose_name="line items")
+    quantity = models.FloatField(default=0, verbose_name="sum of item quantities")
+    spend = models.FloatField(default=0, verbose_name="sum of quantity * price")
+
+    class Meta:
+        db_table = "daily_unit_rollup"
+        verbose_name = "daily unit rollup"
+        verbose_name_plural = "daily unit rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "org", "unit"], name="daily_unit_rollup_key"
+            ),
+        ]
+
+    def __str__(self):
+        return "daily unit rollup model"
+
+
+class DailyProductRollup(models.Model):
+    day = models.DateField(verbose_name="UTC day of issue_date")
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE)
+    category = models.TextField(null=True, verbose_name="item.ai_category")
+    product = models.TextField(null=True, verbose_name="item.name")
+    item_count = models.BigIntegerField(default=0, verbose_name="line items")
+    quantity = models.FloatField(default=0, verbose_name="sum of item quantities")
+    spend = models.FloatField(default=0, verbose_name="sum of quantity * price")
+
+    class Meta:
+        db_table = "daily_product_rollup"
+        verbose_name = "daily product rollup"
+        verbose_name_plural = "daily product rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "org", "unit", "category", "product"],
+                name="daily_product_rollup_key",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return "daily product rollup model"
@@ -0,0 +1,115 @@
+"""
+Write-time work queues drained by LISTEN/NOTIFY workers.
+
+A queue is a table keyed by the queued row's id with an enqueued_at column,
+filled by triggers that also NOTIFY the queue's channel (receipt documents,
+item embeddings). Workers claim batches with FOR UPDATE SKIP LOCKED, so
+several of them never handle the same row and a crashed batch simply stays
+queued. QueueWorkerCommand is the management command loop around that, the
+queue modules only say what to do with a claimed batch.
+"""
+
+import select
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+
+def claim_batch_sql(queue_model):
+    """Locks up to %s queue rows nobody else holds, oldest first."""
+    return (
+        f"SELECT {queue_model._meta.pk.column} FROM {queue_model._meta.db_table} "
+        "ORDER BY enqueued_at LIMIT %s FOR UPDATE SKIP LOCKED"
+    )
+
+
+@contextmanager
+def claimed(queue_model, claim_sql, params):
+    """
+    Runs claim_sql in a transaction and yields the locked keys, they are
+    removed from the queue together with the work done in the block.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(claim_sql, params)
+        keys = [row[0] for row in cursor.fetchall()]
+        yield keys
+        if keys:
+            queue_model.objects.filter(pk__in=keys).delete()
+
+
+def queue_length(queue_model):
+    return queue_model.objects.count()
+
+
+class QueueWorkerCommand(BaseCommand):
+    """Drains a queue, then sleeps until its channel is notified."""
+
+    channel = None
+    queue_model = None
+    default_batch_size = 100
+    label = "rows"  # what process_batch() handles, for the log lines
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=self.default_batch_size)
+        parser.add_argument(
+            "--idle-timeout",
+            type=float,
+            default=30,
+            help="Seconds to wait for a notification before checking the queue anyway.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue and exit."
+        )
+
+    def prepare(self, options):
+        """Called once before listening, e.g. to load a model."""
+
+    def process_batch(self, batch_size):
+        """Handles one claimed batch, returns its size, 0 when the queue is empty."""
+        raise NotImplementedError
+
+    def listen(self):
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return connection.connection
+
+    def wait_for_notification(self, raw_connection, timeout):
+        # notifications that arrived while a batch was processed are already
+        # read from the socket, select() would not see them
+        if not raw_connection.notifies:
+            select.select([raw_connection], [], [], timeout)
+            raw_connection.poll()
+        raw_connection.notifies.clear()
+
+    def handle(self, *args, **options):
+        self.prepare(options)
+        raw_connection = self.listen()
+        self.stdout.write(
+            f"Listening on '{self.channel}', "
+            f"{queue_length(self.queue_model)} {self.label} queued."
+        )
+
+        while True:
+            try:
+                started = time.perf_counter()
+                processed = self.process_batch(options["batch_size"])
+            except Exception as e:
+                self.stderr.write(f"Batch of {self.label} failed, retrying: {e}")
+                connection.close()
+                time.sleep(5)
+                raw_connection = self.listen()
+                continue
+
+            if processed:
+                self.stdout.write(
+                    f"Processed {processed} {self.label} in "
+                    f"{time.perf_counter() - started:.2f} s."
+                )
+                continue
+            if options["once"]:
+                self.stdout.write(self.style.SUCCESS("Queue is empty."))
+                return
+            self.wait_for_notification(raw_connection, options["idle_timeout"])
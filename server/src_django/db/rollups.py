@@ -0,0 +1,87 @@
+"""
+Maintenance of the daily rollup tables (DailyUnitRollup, DailyProductRollup).
+
+Day to day the rollups are kept up to date by the triggers from migrations
+0003_daily_rollups (inserts, deletes) and 0004_rollup_update_triggers
+(corrections of stored rows), this module rebuilds them from scratch and checks that
+they still match the raw transaction/item rows.
+"""
+
+from django.db import connection, transaction
+
+# fresh aggregation of the raw rows, same shape as the rollup tables
+UNIT_AGGREGATE = """
+SELECT (t.issue_date AT TIME ZONE 'UTC')::date AS day, t.org_id, t.unit_id,
+       COUNT(DISTINCT t.id) AS receipt_count, COUNT(i.id) AS item_count,
+       COALESCE(SUM(i.quantity), 0) AS quantity,
+       COALESCE(SUM(i.quantity * i.price), 0) AS spend
+FROM transaction t
+LEFT JOIN item i ON i.transaction_id = t.id
+GROUP BY 1, 2, 3
+"""
+
+PRODUCT_AGGREGATE = """
+SELECT (t.issue_date AT TIME ZONE 'UTC')::date AS day, t.org_id, t.unit_id,
+       i.ai_category AS category, i.name AS product,
+       COUNT(*) AS item_count, COALESCE(SUM(i.quantity), 0) AS quantity,
+       COALESCE(SUM(i.quantity * i.price), 0) AS spend
+FROM item i
+JOIN transaction t ON t.id = i.transaction_id
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+# rows that differ between the rollup table and the fresh aggregation,
+# rows whose counters went down to zero count as missing
+UNIT_MISMATCHES = f"""
+SELECT COUNT(*) FROM (SELECT * FROM daily_unit_rollup WHERE receipt_count <> 0 OR item_count <> 0) r
+FULL OUTER JOIN ({UNIT_AGGREGATE}) a
+    ON r.day = a.day AND r.org_id = a.org_id AND r.unit_id = a.unit_id
+WHERE r.id IS NULL OR a.day IS NULL
+   OR r.receipt_count <> a.receipt_count OR r.item_count <> a.item_count
+   OR abs(r.quantity - a.quantity) > 1e-6 OR abs(r.spend - a.spend) > 1e-6
+"""
+
+PRODUCT_MISMATCHES = f"""
+SELECT COUNT(*) FROM (SELECT * FROM daily_product_rollup WHERE item_count <> 0) r
+FULL OUTER JOIN ({PRODUCT_AGGREGATE}) a
+    ON r.day = a.day AND r.org_id = a.org_id AND r.unit_id = a.unit_id
+   AND r.category IS NOT DISTINCT FROM a.category
+   AND r.product IS NOT DISTINCT FROM a.product
+WHERE r.id IS NULL OR a.day IS NULL
+   OR r.item_count <> a.item_count
+   OR abs(r.quantity - a.quantity) > 1e-6 OR abs(r.spend - a.spend) > 1e-6
+"""
+
+
+def rebuild_rollups():
+    """
+    Recomputes both rollup tables from transaction and item. Writers are
+    blocked for the duration so no row is missed or counted twice.
+    Returns (unit rows, product rows) written.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE transaction, item IN SHARE MODE")
+        cursor.execute("DELETE FROM daily_unit_rollup")
+        cursor.execute("DELETE FROM daily_product_rollup")
+        cursor.execute(
+            "INSERT INTO daily_unit_rollup "
+            "(day, org_id, unit_id, receipt_count, item_count, quantity, spend) "
+            + UNIT_AGGREGATE
+        )
+        unit_rows = cursor.rowcount
+        cursor.execute(
+            "INSERT INTO daily_product_rollup "
+            "(day, org_id, unit_id, category, product, item_count, quantity, spend) "
+            + PRODUCT_AGGREGATE
+        )
+        product_rows = cursor.rowcount
+    return unit_rows, product_rows
+
+
+def verify_rollups():
+    """Returns {"unit": mismatches, "product": mismatches}, zeros mean in sync."""
+    with connection.cursor() as cursor:
+        # one statement, so both checks see the same snapshot
+        cursor.execute(f"SELECT ({UNIT_MISMATCHES}), ({PRODUCT_MISMATCHES})")
+        unit, product = cursor.fetchone()
+    return {"unit": unit, "product": product}
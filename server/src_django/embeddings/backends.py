@@ -0,0 +1,58 @@
+"""
+Inference backends of the embedding model.
+
+"torch" is the plain SentenceTransformer. "onnx" runs the same model through
+ONNX Runtime (pip install "sentence-transformers[onnx]"), optionally an int8
+quantized file of it, which is usually a lot faster on CPU-only nodes.
+`manage.py bench_embedding_backend` measures the speed-up and how close
+the vectors stay to the torch ones before switching.
+
+No Django imports here, the module is also used by the spawned
+generate_embedding worker processes.
+"""
+
+BACKENDS = ("torch", "onnx")
+
+
+def load_model(model_name, backend="torch", onnx_file="", threads=0):
+    """
+    SentenceTransformer on the given backend. onnx_file picks a file inside
+    the model repo/dir (e.g. onnx/model_qint8_avx2.onnx), threads=0 keeps the
+    library default of one thread per core.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+
+    if backend == "onnx":
+        import onnxruntime
+
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        if threads:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = options
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    raise ValueError(f"Unknown embedding backend {backend!r}, use one of {', '.join(BACKENDS)}.")
+
+
+def export_quantized(model_name, output_dir, config="avx2"):
+    """
+    Exports the model to ONNX in output_dir and adds an int8 dynamically
+    quantized copy, returns its file name relative to output_dir.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(model_name, backend="onnx")
+    model.save_pretrained(output_dir)
+    export_dynamic_quantized_onnx_model(model, config, output_dir)
+    return f"onnx/model_qint8_{config}.onnx"
@@ -0,0 +1,112 @@
+"""
+Synthetic data and measurements for the embedding benchmark commands.
+
+Vectors are drawn around random cluster centres, which is closer to real
+sentence embeddings than uniform noise (uniform data makes HNSW look
+either perfect or hopeless). Ground truth comes from numpy brute force.
+Texts for the model benchmarks mimic RAG questions and embedded item texts.
+"""
+
+import io
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from .search import vector_literal
+from .text import item_text
+
+
+def synthetic_vectors(rows, queries, dims, clusters, seed=0):
+    """(data, queries), both L2-normalized float32 matrices."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dims))
+
+    def around_centres(count):
+        points = centres[rng.integers(clusters, size=count)]
+        points = points + rng.normal(size=(count, dims))
+        return (points / np.linalg.norm(points, axis=1, keepdims=True)).astype(np.float32)
+
+    return around_centres(rows), around_centres(queries)
+
+
+def exact_neighbours(data, queries, k):
+    """Row numbers of the k nearest rows by cosine distance, per query."""
+    similarity = queries @ data.T
+    top = np.argpartition(-similarity, k, axis=1)[:, :k]
+    order = np.take_along_axis(-similarity, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def copy_vectors(cursor, table, data, chunk_rows=5000):
+    """COPYs data into table (id, embedding) with ids 0..len-1."""
+    for start in range(0, len(data), chunk_rows):
+        buffer = io.StringIO()
+        for offset, vector in enumerate(data[start : start + chunk_rows]):
+            buffer.write(f"{start + offset}\t{vector_literal(vector)}\n")
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} (id, embedding) FROM STDIN", buffer)
+
+
+def run_queries(cursor, sql, queries, params):
+    """Latencies in seconds and result ids of sql per query, params(vector) gives its parameters."""
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        cursor.execute(sql, params(vector_literal(query)))
+        results.append([row[0] for row in cursor.fetchall()])
+        latencies.append(time.perf_counter() - started)
+    return latencies, results
+
+
+def recall_at_k(results, truth, k):
+    hits = sum(len(set(found[:k]) & set(expected[:k])) for found, expected in zip(results, truth))
+    return hits / (k * len(truth))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+QUESTIONS = [
+    "How much did I spend on beer in {month}?",
+    "Which brand of coffee do I buy most often? ({n})",
+    "What did I buy at Lidl on {month} {day}?",
+    "Show me my most expensive dairy purchases #{n}",
+    "Kolko som minul za pecivo v {month}?",
+]
+MONTHS = ["January", "February", "March", "April", "May", "June"]
+
+
+def synthetic_queries(count):
+    """Distinct questions, so nothing can be served from a cache."""
+    return [
+        QUESTIONS[n % len(QUESTIONS)].format(
+            month=MONTHS[n % len(MONTHS)], day=n % 28 + 1, n=n
+        )
+        for n in range(count)
+    ]
+
+
+def synthetic_item_texts(count):
+    """Embedded item texts shaped like the real ones."""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        item_text(
+            {
+                "id": n,
+                "name": f"Produkt {n % 700}",
+                "price": f"{0.35 + n % 900 / 100:.2f}",
+                "quantity": 1 + n % 3,
+                "ai_brand": f"Brand {n % 90}",
+                "ai_category": f"Category {n % 40}",
+                "ai_quantity_value": 100 * (1 + n % 5),
+                "ai_quantity_unit": "g",
+                "transaction_id": n // 6,
+                "transaction__issue_date": start + timedelta(minutes=17 * n),
+            }
+        )
+        for n in range(count)
+    ]
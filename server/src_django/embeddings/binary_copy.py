@@ -0,0 +1,42 @@
+"""
+ItemEmbedding rows in PostgreSQL's binary COPY format.
+
+bulk_create() sends every vector as a '[0.0123, ...]' text literal that the
+server parses back into floats. With COPY ... (FORMAT binary) vectors travel
+as the 4 + 4 * 384 bytes pgvector stores anyway (vector_recv format), which
+is what `generate_embedding --copy` streams.
+
+No Django imports here, like backends.py and text.py.
+"""
+
+import io
+import struct
+
+from pgvector import Vector
+
+from .text import TEMPLATE_VERSION, content_hash
+
+COLUMNS = ("item_id", "text_content", "content_hash", "template_version", "embedding")
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+
+
+def _field(data):
+    return struct.pack(">i", len(data)) + data
+
+
+def encode_rows(item_ids, texts, vectors):
+    """Binary COPY stream of COLUMNS for the given items."""
+    buffer = io.BytesIO()
+    buffer.write(HEADER)
+    for item_id, text, vector in zip(item_ids, texts, vectors):
+        buffer.write(struct.pack(">h", len(COLUMNS)))
+        buffer.write(struct.pack(">iq", 8, item_id))
+        buffer.write(_field(text.encode()))
+        buffer.write(_field(content_hash(text).encode()))
+        buffer.write(struct.pack(">ih", 2, TEMPLATE_VERSION))
+        buffer.write(_field(Vector(vector).to_binary()))
+    buffer.write(TRAILER)
+    buffer.seek(0)
+    return buffer
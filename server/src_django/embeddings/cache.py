@@ -0,0 +1,109 @@
+"""
+Cache of query vectors for the RAG endpoint.
+
+The dashboard chat sends the same few questions over and over, a hit here
+skips the transformer forward pass completely. Entries live in a bounded
+in-process LRU with a TTL; with a shared Django cache alias configured
+(e.g. Redis or memcached in CACHES) vectors are also stored there, so all
+workers benefit from a query any of them has already encoded.
+"""
+
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """Cache key text: Unicode NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size, ttl, shared_cache=None, namespace=""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_cache = shared_cache
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def shared_key(self, key):
+        digest = hashlib.sha1(f"{self.namespace}\0{key}".encode()).hexdigest()
+        return f"query-embedding:{digest}"
+
+    def get(self, text):
+        """Cached vector of a query or None."""
+        key = normalize_query(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, vector = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        if self.shared_cache is not None:
+            try:
+                raw = self.shared_cache.get(self.shared_key(key))
+            except Exception as e:
+                print(f"Shared query embedding cache is unavailable: {e}")
+                raw = None
+            if raw is not None:
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self._remember(key, vector, now)
+                with self._lock:
+                    self.shared_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, text, vector):
+        key = normalize_query(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector, time.monotonic())
+        if self.shared_cache is not None:
+            try:
+                self.shared_cache.set(self.shared_key(key), vector.tobytes(), self.ttl)
+            except Exception as e:
+                print(f"Shared query embedding cache is unavailable: {e}")
+
+    def _remember(self, key, vector, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "shared": self.shared_cache is not None,
+            }
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from embeddings.backends import BACKENDS, load_model
+from embeddings.benchmarks import percentile, synthetic_item_texts, synthetic_queries
+
+
+def cosine_agreement(reference, vectors):
+    """Cosine similarity of each vector with its torch counterpart."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (reference * vectors).sum(axis=1)
+
+
+class Command(BaseCommand):
+    """Query latency, batch throughput and vector agreement of an embedding backend vs torch"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", choices=BACKENDS, default="onnx")
+        parser.add_argument(
+            "--onnx-file", default=settings.EMBEDDING_ONNX_FILE,
+            help="e.g. onnx/model_qint8_avx2.onnx for the int8 model.",
+        )
+        parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+        parser.add_argument("--threads", type=int, default=settings.EMBEDDING_THREADS)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--texts", type=int, default=2000)
+        parser.add_argument("--batch-size", type=int, default=64)
+
+    def measure(self, name, model, queries, texts, batch_size):
+        model.encode("warm up")
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            model.encode(query)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        vectors = model.encode(texts, batch_size=batch_size)
+        throughput = len(texts) / (time.perf_counter() - started)
+
+        self.stdout.write(
+            f"{name:40} query p50 {percentile(latencies, 0.50) * 1000:6.1f} ms  "
+            f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  "
+            f"batch {throughput:7.1f} texts/s"
+        )
+        return vectors
+
+    def handle(self, *args, **options):
+        queries = synthetic_queries(options["queries"])
+        texts = synthetic_item_texts(options["texts"])
+        threads = options["threads"]
+
+        self.stdout.write("Loading torch model...")
+        reference = self.measure(
+            "torch",
+            load_model(options["model"], threads=threads),
+            queries,
+            texts,
+            options["batch_size"],
+        )
+
+        name = options["backend"]
+        if options["onnx_file"] and name == "onnx":
+            name = f"onnx ({options['onnx_file']})"
+        self.stdout.write(f"Loading {name} model...")
+        candidate = load_model(
+            options["model"],
+            backend=options["backend"],
+            onnx_file=options["onnx_file"],
+            threads=threads,
+        )
+        vectors = self.measure(name, candidate, queries, texts, options["batch_size"])
+
+        agreement = cosine_agreement(np.asarray(reference), np.asarray(vectors))
+        self.stdout.write(
+            f"cosine agreement with torch: mean {agreement.mean():.5f}  "
+            f"p1 {np.percentile(agreement, 1):.5f}  min {agreement.min():.5f}"
+        )
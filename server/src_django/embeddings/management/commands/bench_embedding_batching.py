@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from embeddings.batching import EmbeddingBatcher
+from embeddings.benchmarks import percentile, synthetic_queries
+from embeddings.provider import encode, get_embedding_model
+
+
+def run_load(encode_one, queries, concurrency):
+    """Wall time and per-query latencies of encoding queries from N threads."""
+
+    def timed(query):
+        started = time.perf_counter()
+        encode_one(query)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, queries))
+    return time.perf_counter() - started, latencies
+
+
+class Command(BaseCommand):
+    """Load test of per-request query encoding vs the micro-batching worker"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.EMBEDDING_BATCH_MAX_SIZE
+        )
+        parser.add_argument(
+            "--wait-ms", type=float, default=settings.EMBEDDING_BATCH_WAIT_MS
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Loading embedding model...")
+        get_embedding_model()
+        encode("warm up")
+
+        queries = synthetic_queries(options["requests"])
+        batcher = EmbeddingBatcher(
+            encode, max_batch_size=options["batch_size"], max_wait_ms=options["wait_ms"]
+        )
+        self.stdout.write(
+            f"{options['requests']} queries, {options['concurrency']} concurrent clients"
+        )
+
+        candidates = [
+            ("per-request encode", encode),
+            (
+                f"batched (max {options['batch_size']}, wait {options['wait_ms']} ms)",
+                batcher.encode,
+            ),
+        ]
+        for name, encode_one in candidates:
+            seconds, latencies = run_load(encode_one, queries, options["concurrency"])
+            self.stdout.write(
+                f"{name:36} {len(queries) / seconds:8.1f} req/s  "
+                f"p50 {percentile(latencies, 0.50) * 1000:7.1f} ms  "
+                f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+            )
+
+        stats = batcher.stats()
+        self.stdout.write(
+            f"batches: {stats['batches']}, average size {stats['average_batch']:.1f}, "
+            f"largest {stats['largest_batch']}"
+        )
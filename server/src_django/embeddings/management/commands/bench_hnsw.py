@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from embeddings.benchmarks import (
+    copy_vectors,
+    exact_neighbours,
+    percentile,
+    recall_at_k,
+    run_queries,
+    synthetic_vectors,
+)
+from embeddings.search import hnsw_session, search_params
+
+TABLE = "bench_hnsw_vectors"
+SEARCH = f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s"
+
+
+def int_list(value):
+    return [int(part) for part in value.split(",")]
+
+
+class Command(BaseCommand):
+    """Recall@k and latency of HNSW search vs an exact scan on synthetic vectors"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--dims", type=int, default=384)
+        parser.add_argument("--clusters", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--m", type=int, default=16)
+        parser.add_argument("--ef-construction", type=int, default=64)
+        parser.add_argument(
+            "--ef-search", type=int_list, default=[10, 20, 40, 80, 160, 320],
+            help="Comma separated hnsw.ef_search values to try.",
+        )
+        parser.add_argument(
+            "--iterative-scan", default="off",
+            help="Comma separated hnsw.iterative_scan modes to try (pgvector >= 0.8).",
+        )
+
+    def report(self, name, latencies, results, truth, k):
+        self.stdout.write(
+            f"{name:40} recall@{k} {recall_at_k(results, truth, k):6.3f}  "
+            f"p50 {percentile(latencies, 0.50) * 1000:7.2f} ms  "
+            f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        data, queries = synthetic_vectors(
+            options["rows"], options["queries"], options["dims"], options["clusters"]
+        )
+        truth = exact_neighbours(data, queries, k).tolist()
+
+        def knn_params(query):
+            return [query, k]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {TABLE} "
+                f"(id integer PRIMARY KEY, embedding vector({options['dims']}))"
+            )
+            try:
+                self.stdout.write(f"Loading {options['rows']} synthetic vectors...")
+                copy_vectors(cursor, TABLE, data)
+
+                started = time.perf_counter()
+                cursor.execute(
+                    f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_cosine_ops) "
+                    f"WITH (m = {options['m']}, ef_construction = {options['ef_construction']})"
+                )
+                self.stdout.write(
+                    f"HNSW index (m={options['m']}, ef_construction="
+                    f"{options['ef_construction']}) built in {time.perf_counter() - started:.1f} s"
+                )
+                cursor.execute(f"ANALYZE {TABLE}")
+
+                with transaction.atomic():
+                    cursor.execute("SET LOCAL enable_indexscan = off")
+                    latencies, results = run_queries(cursor, SEARCH, queries, knn_params)
+                self.report("exact scan", latencies, results, truth, k)
+
+                for mode in options["iterative_scan"].split(","):
+                    for ef_search in options["ef_search"]:
+                        params = search_params(ef_search, mode)
+                        with hnsw_session(params):
+                            latencies, results = run_queries(cursor, SEARCH, queries, knn_params)
+                        self.report(
+                            f"hnsw ef_search={ef_search} iterative_scan={mode}",
+                            latencies, results, truth, k,
+                        )
+            finally:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
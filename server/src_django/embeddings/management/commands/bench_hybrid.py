@@ -0,0 +1,87 @@
+import random
+import time
+from itertools import cycle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from embeddings.benchmarks import percentile
+from embeddings.models import ItemEmbedding
+from embeddings.provider import encode
+from embeddings.search import search_items, search_params
+
+
+# the shape of real questions, the full-text arm must not need every word
+QUESTIONS = (
+    "How much did I spend on {name}?",
+    "When did I last buy {name}?",
+    "Which store sells {name} the cheapest?",
+    "Show me my purchases of {name} this year",
+)
+
+
+# a random share of the embedded rows without sorting the whole table like
+# ORDER BY random() would, params: percent of rows, row limit
+SAMPLE_NAMES = f"""
+SELECT i.name
+FROM {ItemEmbedding._meta.db_table} e TABLESAMPLE BERNOULLI (%s)
+JOIN item i ON i.id = e.item_id
+LIMIT %s
+"""
+
+
+def sample_names(count):
+    """About count random names of embedded items."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE relname = %s",
+            [ItemEmbedding._meta.db_table],
+        )
+        rows = cursor.fetchone()[0]
+        # twice the rows needed, the estimate is rough; never analyzed: all
+        percent = min(100.0, 200.0 * count / rows) if rows > 0 else 100.0
+        cursor.execute(SAMPLE_NAMES, [percent, 2 * count])
+        names = [row[0] for row in cursor.fetchall()]
+    # the sample comes in table order, LIMIT alone would favour its start
+    return random.sample(names, min(count, len(names)))
+
+
+def timed_search(query, vector, k, params):
+    started = time.perf_counter()
+    hits = search_items(query, vector, k, params)
+    return time.perf_counter() - started, hits
+
+
+class Command(BaseCommand):
+    """Hit rate and latency of vector vs hybrid RAG search on questions about products"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        # questions naming receipt items ("Kofola 2L", "Rajo mlieko 1,5%") are
+        # the kind of exact-name questions the full-text arm is meant for
+        names = sample_names(options["queries"])
+        if not names:
+            raise CommandError("No embedded items, run generate_embedding first.")
+        questions = [
+            question.format(name=name) for name, question in zip(names, cycle(QUESTIONS))
+        ]
+        self.stdout.write(f"Encoding {len(questions)} questions...")
+        vectors = encode(questions, batch_size=64)
+        for mode in ("vector", "hybrid"):
+            params = search_params(mode=mode)
+            latencies = []
+            hits = 0
+            for name, question, vector in zip(names, questions, vectors):
+                seconds, results = timed_search(question, vector, k, params)
+                latencies.append(seconds)
+                # a hit is any item of the same product, not only the sampled row
+                if any(f"Item purchased: {name} (" in hit.text_content for hit in results):
+                    hits += 1
+            self.stdout.write(
+                f"{mode:8} hit rate@{k} {hits / len(names):6.3f}  "
+                f"p50 {percentile(latencies, 0.50) * 1000:7.2f} ms  "
+                f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+            )
@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from embeddings.benchmarks import (
+    copy_vectors,
+    exact_neighbours,
+    percentile,
+    recall_at_k,
+    run_queries,
+    synthetic_vectors,
+)
+from embeddings.search import (
+    DIMENSIONS,
+    STORAGE_INDEXES,
+    create_index_sql,
+    hnsw_session,
+    reranked_search_sql,
+    search_params,
+)
+
+TABLE = "bench_quantization_vectors"
+SEARCH = f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s"
+
+
+class Command(BaseCommand):
+    """Index size, build time, latency and recall of full, halfvec and binary HNSW indexes"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--clusters", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--ef-search", type=int, default=40)
+        parser.add_argument(
+            "--rerank-factor", type=int, default=4,
+            help="Candidates fetched from a compact index per requested row.",
+        )
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        candidates = k * options["rerank_factor"]
+        data, queries = synthetic_vectors(
+            options["rows"], options["queries"], DIMENSIONS, options["clusters"]
+        )
+        truth = exact_neighbours(data, queries, k).tolist()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {TABLE} "
+                f"(id integer PRIMARY KEY, embedding vector({DIMENSIONS}))"
+            )
+            try:
+                self.stdout.write(f"Loading {options['rows']} synthetic vectors...")
+                copy_vectors(cursor, TABLE, data)
+                cursor.execute(f"SELECT pg_size_pretty(pg_table_size('{TABLE}'))")
+                self.stdout.write(f"Table size: {cursor.fetchone()[0]}")
+
+                for storage in STORAGE_INDEXES:
+                    index = f"{TABLE}_{storage}_idx"
+                    started = time.perf_counter()
+                    cursor.execute(create_index_sql(storage, table=TABLE, name=index))
+                    build_seconds = time.perf_counter() - started
+                    cursor.execute(f"ANALYZE {TABLE}")
+                    cursor.execute(f"SELECT pg_relation_size('{index}')")
+                    index_bytes = cursor.fetchone()[0]
+
+                    if storage == "vector":
+                        sql = SEARCH
+                        ef_search = options["ef_search"]
+
+                        def params(query):
+                            return [query, k]
+                    else:
+                        sql = reranked_search_sql(storage, table=TABLE, columns="id")
+                        ef_search = max(options["ef_search"], candidates)
+
+                        def params(query):
+                            return [query, query, candidates, k]
+
+                    with hnsw_session(search_params(ef_search, "off")):
+                        latencies, results = run_queries(cursor, sql, queries, params)
+                    cursor.execute(f"DROP INDEX {index}")
+
+                    self.stdout.write(
+                        f"{storage:8} index {index_bytes / 2**20:8.1f} MiB  "
+                        f"build {build_seconds:6.1f} s  "
+                        f"recall@{k} {recall_at_k(results, truth, k):6.3f}  "
+                        f"p50 {percentile(latencies, 0.50) * 1000:7.2f} ms  "
+                        f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+                    )
+            finally:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
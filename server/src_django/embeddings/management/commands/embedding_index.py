@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from embeddings.models import ItemEmbedding
+from embeddings.search import STORAGE_INDEXES, create_index_sql
+
+
+class Command(BaseCommand):
+    """Builds the HNSW index for EMBEDDING_SEARCH_STORAGE and optionally drops the others"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--storage", choices=STORAGE_INDEXES, required=True)
+        parser.add_argument(
+            "--drop-others",
+            action="store_true",
+            help="Drop the indexes of the other storage modes once this one exists "
+            "(indexes declared on the ItemEmbedding model are kept).",
+        )
+        parser.add_argument("--m", type=int, default=16)
+        parser.add_argument("--ef-construction", type=int, default=64)
+
+    def index_sizes(self, cursor):
+        names = [name for name, *_ in STORAGE_INDEXES.values()]
+        cursor.execute(
+            "SELECT c.relname, pg_size_pretty(pg_relation_size(c.oid)) FROM pg_class c "
+            "WHERE c.relkind = 'i' AND c.relname = ANY(%s) ORDER BY c.relname",
+            [names],
+        )
+        return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        storage = options["storage"]
+        name = STORAGE_INDEXES[storage][0]
+
+        with connection.cursor() as cursor:
+            self.stdout.write(f"Building {name} (existing index is kept)...")
+            started = time.perf_counter()
+            # CONCURRENTLY keeps the table writable while the graph is built
+            cursor.execute(
+                create_index_sql(
+                    storage,
+                    m=options["m"],
+                    ef_construction=options["ef_construction"],
+                    concurrently=True,
+                )
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"{name} ready in {time.perf_counter() - started:.1f} s.")
+            )
+
+            if options["drop_others"]:
+                # dropping a Meta.indexes index would leave the migrations
+                # describing a schema the database no longer has
+                declared = {index.name for index in ItemEmbedding._meta.indexes}
+                for other, (other_name, *_) in STORAGE_INDEXES.items():
+                    if other == storage:
+                        continue
+                    if other_name in declared:
+                        self.stdout.write(
+                            f"Kept {other_name}, it is declared on the model "
+                            "(remove it there and migrate to drop it)."
+                        )
+                        continue
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other_name}")
+                    self.stdout.write(f"Dropped {other_name}.")
+
+            for index, size in self.index_sizes(cursor):
+                self.stdout.write(f"{index:32} {size}")
+
+        self.stdout.write(
+            f"Search uses this index with EMBEDDING_SEARCH_STORAGE={storage}."
+        )
@@ -0,0 +1,24 @@
+from db.queues import QueueWorkerCommand
+from embeddings.models import EmbeddingQueue
+from embeddings.provider import encode, get_embedding_model
+from embeddings.queue import CHANNEL, process_batch
+
+
+class Command(QueueWorkerCommand):
+    """Embeds newly written items as they arrive in the embedding queue"""
+
+    channel = CHANNEL
+    queue_model = EmbeddingQueue
+    default_batch_size = 64
+    label = "items"
+
+    def prepare(self, options):
+        self.stdout.write("Loading embedding model...")
+        get_embedding_model()
+        self.stdout.write(self.style.SUCCESS("Embedding model loaded."))
+
+    def encode_batch(self, texts):
+        return encode(texts, batch_size=len(texts))
+
+    def process_batch(self, batch_size):
+        return process_batch(self.encode_batch, batch_size)
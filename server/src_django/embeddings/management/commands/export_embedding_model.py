@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from embeddings.backends import export_quantized
+
+
+class Command(BaseCommand):
+    """Exports the embedding model to ONNX with an int8 quantized copy"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir")
+        parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+        parser.add_argument(
+            "--quantization",
+            choices=["arm64", "avx2", "avx512", "avx512_vnni"],
+            default="avx2",
+            help="Instruction set the int8 model is tuned for.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Exporting {options['model']} to {options['output_dir']}...")
+        onnx_file = export_quantized(
+            options["model"], options["output_dir"], options["quantization"]
+        )
+        self.stdout.write(self.style.SUCCESS("Model exported, to use it set:"))
+        self.stdout.write(f"EMBEDDING_MODEL_NAME={options['output_dir']}")
+        self.stdout.write("EMBEDDING_BACKEND=onnx")
+        self.stdout.write(f"EMBEDDING_ONNX_FILE={onnx_file}")
@@ -1,7 +1,33 @@
-from db.models import Item
+import multiprocessing
+import os
+import time
+from collections import deque
+from itertools import chain
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection
 from embeddings.models import ItemEmbedding
-from sentence_transformers import SentenceTransformer
+from embeddings.pipeline import (
+    copy_chunk,
+    embedded_chunks,
+    last_embedded_item_id,
+    mark_current,
+    pending_chunks,
+    pending_items,
+    reset_checkpoint,
+    save_chunk,
+    update_chunk,
+)
+from embeddings.provider import get_embedding_model
+from embeddings.search import (
+    STORAGE_INDEXES,
+    create_index_sql,
+    existing_index_storages,
+    index_build_settings,
+)
+from embeddings.text import content_hash, item_text
+from embeddings.workers import encode_chunk, init_worker
 
 
 class Command(BaseCommand):
@@ -13,17 +39,174 @@ class Command(BaseCommand):
             action="store_true",
             help="Force re-generation of embeddings for ALL items, deleting old ones.",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Items read, encoded and written per step.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=64,
+            help="Batch size of the model forward passes.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Encoding processes, each with its own model copy.",
+        )
+        parser.add_argument(
+            "--changed",
+            action="store_true",
+            help="Also re-encode embedded items whose text changed (AI fields, template).",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Write new embeddings with binary COPY instead of INSERTs.",
+        )
+        parser.add_argument(
+            "--rebuild-index",
+            action="store_true",
+            help="Drop the HNSW indexes during the run and build them once at the end "
+            "(search is slow until then, use for large backfills).",
+        )
+        parser.add_argument(
+            "--maintenance-work-mem",
+            default="1GB",
+            help="maintenance_work_mem of the index rebuild.",
+        )
+        parser.add_argument(
+            "--parallel-workers",
+            type=int,
+            default=max(1, min(7, (os.cpu_count() or 1) - 1)),
+            help="max_parallel_maintenance_workers of the index rebuild.",
+        )
 
-    def handle(self, *args, **options):
-        self.stdout.write("Loading embedding model...")
+    def textualize(self, row):
         try:
-            EMBEDDING_MODEL = SentenceTransformer(
-                "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-            )
-            self.stdout.write(self.style.SUCCESS("Embedding model loaded."))
+            return item_text(row)
         except Exception as e:
-            self.stderr.write(f"Failed to load SentenceTransformer model: {e}")
-            return
+            self.stderr.write(f"Error processing item {row['id']}: {e}")
+
+    def new_chunks(self, after_id, chunk_size):
+        """("new", last item id, item ids, texts) of items without embedding."""
+        for rows in pending_chunks(after_id, chunk_size):
+            item_ids = []
+            texts = []
+            for row in rows:
+                text = self.textualize(row)
+                if text is not None:
+                    texts.append(text)
+                    item_ids.append(row["id"])
+            yield "new", rows[-1]["id"], item_ids, texts
+
+    def changed_chunks(self, chunk_size):
+        """("changed", last item id, embedding ids, texts) of outdated embeddings."""
+        for rows in embedded_chunks(0, chunk_size):
+            embedding_ids = []
+            texts = []
+            unchanged_ids = []
+            for row in rows:
+                text = self.textualize(row)
+                if text is None:
+                    continue
+                if content_hash(text) == row["embedding__content_hash"]:
+                    unchanged_ids.append(row["embedding__id"])
+                else:
+                    texts.append(text)
+                    embedding_ids.append(row["embedding__id"])
+            mark_current(unchanged_ids)
+            if texts:
+                yield "changed", rows[-1]["id"], embedding_ids, texts
+
+    def encode_in_process(self, model, chunks, batch_size):
+        for chunk in chunks:
+            yield (*chunk, model.encode(chunk[-1], batch_size=batch_size))
+
+    def encode_in_pool(self, chunks, workers, batch_size):
+        """Encodes chunks in worker processes, yields them in the original order."""
+        threads = settings.EMBEDDING_THREADS or max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+            workers,
+            initializer=init_worker,
+            initargs=(
+                settings.EMBEDDING_MODEL_NAME,
+                settings.EMBEDDING_BACKEND,
+                settings.EMBEDDING_ONNX_FILE,
+                threads,
+            ),
+        ) as pool:
+            # a couple of chunks per worker in flight, not the whole table
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(
+                    (chunk, pool.apply_async(encode_chunk, (chunk[-1], batch_size)))
+                )
+                if len(in_flight) >= 2 * workers:
+                    chunk, result = in_flight.popleft()
+                    yield (*chunk, result.get())
+            while in_flight:
+                chunk, result = in_flight.popleft()
+                yield (*chunk, result.get())
+
+    def drop_indexes(self):
+        """Drops the HNSW indexes, returns the storage modes to rebuild."""
+        with connection.cursor() as cursor:
+            storages = existing_index_storages(cursor)
+            # an earlier run that died before rebuilding left no index behind
+            if settings.EMBEDDING_SEARCH_STORAGE not in storages:
+                storages.append(settings.EMBEDDING_SEARCH_STORAGE)
+            for storage in storages:
+                cursor.execute(f"DROP INDEX IF EXISTS {STORAGE_INDEXES[storage][0]}")
+        self.stdout.write(
+            f"Dropped HNSW indexes ({', '.join(storages)}), rebuilt after the backfill."
+        )
+        return storages
+
+    def build_indexes(self, storages, maintenance_work_mem, parallel_workers):
+        with connection.cursor() as cursor:
+            index_build_settings(cursor, maintenance_work_mem, parallel_workers)
+            for storage in storages:
+                name = STORAGE_INDEXES[storage][0]
+                self.stdout.write(
+                    f"Building {name} ({parallel_workers} parallel workers, "
+                    f"maintenance_work_mem {maintenance_work_mem})..."
+                )
+                started = time.perf_counter()
+                cursor.execute(create_index_sql(storage))
+                self.stdout.write(
+                    self.style.SUCCESS(f"{name} ready in {time.perf_counter() - started:.1f} s.")
+                )
+
+    def handle(self, *args, **options):
+        self.rebuild_storages = []
+        try:
+            self.embed(options)
+        finally:
+            # also when the run fails, search must not stay without an index
+            if self.rebuild_storages:
+                self.build_indexes(
+                    self.rebuild_storages,
+                    options["maintenance_work_mem"],
+                    options["parallel_workers"],
+                )
+
+    def embed(self, options):
+        workers = options["workers"]
+        if workers > 1:
+            self.stdout.write(f"Encoding with {workers} worker processes.")
+        else:
+            self.stdout.write("Loading embedding model...")
+            try:
+                EMBEDDING_MODEL = get_embedding_model()
+                self.stdout.write(self.style.SUCCESS("Embedding model loaded."))
+            except Exception as e:
+                self.stderr.write(f"Failed to load SentenceTransformer model: {e}")
+                return
         rebuild_all = options["rebuild"]
 
         if rebuild_all:
@@ -33,87 +216,72 @@ class Command(BaseCommand):
                 )
             )
             count, _ = ItemEmbedding.objects.all().delete()
+            reset_checkpoint()
             self.stdout.write(
                 self.style.SUCCESS(f"Successfully deleted {count} old embeddings.")
             )
 
         self.stdout.write("Querying database for items to index...")
 
-        items_to_process = Item.objects.select_related(
-            "transaction",
-            "transaction__unit",
-            "transaction__org",
-        ).filter(embedding__isnull=True)
+        # only an interrupted run leaves a checkpoint behind
+        after_id = last_embedded_item_id()
+        if after_id:
+            self.stdout.write(f"Resuming an interrupted run after item {after_id}.")
 
-        count = items_to_process.count()
-        if count == 0:
+        count = pending_items(after_id).count()
+        if count == 0 and after_id:
+            # the rest was embedded meanwhile, look below the checkpoint too
+            reset_checkpoint()
+            after_id = 0
+            count = pending_items().count()
+        if count == 0 and not options["changed"]:
             self.stdout.write(self.style.SUCCESS("No new items to embed. Exiting."))
             return
 
         self.stdout.write(f"Found {count} items to textualize and embed...")
 
-        embeddings_to_create = []
-        texts_to_encode = []
-        items_to_process_list = []
+        if options["rebuild_index"]:
+            self.rebuild_storages = self.drop_indexes()
 
-        for item in items_to_process:
-            try:
-                transaction = item.transaction
-                # unit = transaction.unit
-                # org = transaction.org
-
-                item_text = (
-                    f"Item purchased: {item.name} (ID: {item.id}). "
-                    f"Price: {item.price} euros for {item.quantity} units. "
-                    # f"AI analysis: [Product Name: {item.ai_name_without_brand_and_quantity}, "
-                    f"Brand: {item.ai_brand}, Category: {item.ai_category}, "
-                    f"Quantity Value: {item.ai_quantity_value}, Unit: {item.ai_quantity_unit}]."
-                )
-
-                trans_text = (
-                    f"Receipt (Transaction) ID: {transaction.id}. "
-                    f"Date: {transaction.issue_date.strftime('%Y-%m-%d %H:%M:%S')}."
-                )
-
-                # unit_text = (
-                #     f"Store (Unit) Details: {unit.name} (ID: {unit.id}). "
-                #     f"Address: {unit.street_name} {unit.building_number} (Reg Num: {unit.property_registration_number}), "
-                #     f"{unit.postal_code} {unit.municipality}, {unit.country}. "
-                #     f"Coordinates: (Lat: {unit.latitude}, Lon: {unit.longitude})."
-                # )
-
-                # org_text = (
-                #     f"Company (Organization) Details: {org.name} (ID: {org.id}). "
-                #     f"Company Identifiers: [ICO: {org.ico}, DIC: {org.dic}, IC DPH: {org.ic_dph}]. "
-                #     f"Address: {org.street_name} {org.building_number}, {org.postal_code} {org.municipality}, {org.country}."
-                # )
-
-                text_content = f"{item_text} Part of: {trans_text}"  #  Purchased at: {unit_text} Owned by: {org_text}
-
-                texts_to_encode.append(text_content)
-                items_to_process_list.append(item)
-            except Exception as e:
-                self.stderr.write(f"Error processing item {item.id}: {e}")
+        chunks = self.new_chunks(after_id, options["chunk_size"])
+        if options["changed"]:
+            chunks = chain(chunks, self.changed_chunks(options["chunk_size"]))
+        if workers > 1:
+            encoded = self.encode_in_pool(chunks, workers, options["batch_size"])
+        else:
+            encoded = self.encode_in_process(
+                EMBEDDING_MODEL, chunks, options["batch_size"]
+            )
 
-        self.stdout.write("Generating all embeddings in a single batch...")
-        all_vectors = EMBEDDING_MODEL.encode(texts_to_encode, show_progress_bar=True)
+        write_chunk = copy_chunk if options["copy"] else save_chunk
+        created = 0
+        updated = 0
+        started = time.perf_counter()
+        # single writer: chunks are saved in item.id order, so the checkpoint
+        # never moves past an item that wasn't written
+        for kind, last_id, ids, texts, vectors in encoded:
+            if kind == "new":
+                write_chunk(last_id, ids, texts, vectors)
+                created += len(ids)
+                progress = f"{created}/{count} embeddings saved"
+            else:
+                update_chunk(ids, texts, vectors)
+                updated += len(ids)
+                progress = f"{updated} changed embeddings updated"
 
-        self.stdout.write("Creating objects for database...")
+            rate = (created + updated) / (time.perf_counter() - started)
+            self.stdout.write(f"{progress}, up to item {last_id} ({rate:.0f} items/s)")
 
-        embeddings_to_create = []
+        # finished: the next run checks every item without an embedding again,
+        # also ones below this run's last id (failed texts, deleted embeddings,
+        # items committed out of id order by concurrent ingest)
+        reset_checkpoint()
 
-        for item, text, vector in zip(
-            items_to_process_list, texts_to_encode, all_vectors
-        ):
-            embeddings_to_create.append(
-                ItemEmbedding(item=item, text_content=text, embedding=vector)
-            )
-        self.stdout.write(
-            f"Saving {len(embeddings_to_create)} new embeddings to the database..."
-        )
-        ItemEmbedding.objects.bulk_create(embeddings_to_create, ignore_conflicts=True)
+        elapsed = time.perf_counter() - started
         self.stdout.write(
             self.style.SUCCESS(
-                f"Successfully created {len(embeddings_to_create)} new embeddings."
+                f"Successfully created {created} new and updated {updated} changed "
+                f"embeddings in {elapsed:.1f} s "
+                f"({(created + updated) / elapsed:.0f} items/s with {workers} worker(s))."
             )
         )
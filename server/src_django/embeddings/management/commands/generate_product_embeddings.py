@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from embeddings.models import ProductEmbedding
+from embeddings.products import (
+    link_chunk,
+    prune_products,
+    relink_changed,
+    unlinked_chunks,
+    unlinked_items,
+)
+from embeddings.provider import encode, get_embedding_model
+
+
+class Command(BaseCommand):
+    """Embeds every distinct product once and links the items to it"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Items read and linked per step.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=64,
+            help="Batch size of the model forward passes.",
+        )
+        parser.add_argument(
+            "--relink",
+            action="store_true",
+            help="Re-check linked items whose AI fields may have changed, "
+            "drop products without items.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Loading embedding model...")
+        get_embedding_model()
+        self.stdout.write(self.style.SUCCESS("Embedding model loaded."))
+
+        if options["relink"]:
+            unlinked = relink_changed(options["chunk_size"])
+            self.stdout.write(f"Unlinked {unlinked} items whose product changed.")
+
+        count = unlinked_items().count()
+        self.stdout.write(f"Found {count} items without a product...")
+
+        def encode_products(texts):
+            return encode(texts, batch_size=options["batch_size"])
+
+        linked = 0
+        created = 0
+        started = time.perf_counter()
+        for rows in unlinked_chunks(options["chunk_size"]):
+            created += link_chunk(rows, encode_products)
+            linked += len(rows)
+            self.stdout.write(
+                f"{linked}/{count} items linked, {created} new products encoded"
+            )
+
+        if options["relink"]:
+            self.stdout.write(f"Deleted {prune_products()} products without items.")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Linked {linked} items in {time.perf_counter() - started:.1f} s, "
+                f"{created} new products, {ProductEmbedding.objects.count()} in total."
+            )
+        )
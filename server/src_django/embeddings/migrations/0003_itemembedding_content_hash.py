@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0002_embedding_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemembedding',
+            name='content_hash',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='itemembedding',
+            name='template_version',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        # existing rows were all built with template version 1
+        migrations.RunSQL(
+            sql="UPDATE embeddings_itemembedding "
+            "SET content_hash = encode(sha256(convert_to(text_content, 'UTF8')), 'hex')",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
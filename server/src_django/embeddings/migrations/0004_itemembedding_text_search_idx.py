@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0003_itemembedding_content_hash'),
+    ]
+
+    operations = [
+        # full-text arm of the hybrid RAG search, the expression has to match
+        # the one in embeddings.search.HYBRID_SEARCH
+        migrations.RunSQL(
+            sql="CREATE INDEX embedding_text_fts_idx ON embeddings_itemembedding "
+            "USING gin (to_tsvector('simple', text_content))",
+            reverse_sql="DROP INDEX IF EXISTS embedding_text_fts_idx",
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# New embeddings copy the filter columns from their item and receipt, later
+# changes of the item category or the receipt date/shop are pushed down to
+# the embeddings, so writers of ItemEmbedding never have to care.
+CREATE_TRIGGERS = """
+CREATE FUNCTION embedding_fill_filters() RETURNS trigger AS $$
+BEGIN
+    SELECT t.issue_date, t.org_id, t.unit_id, i.ai_category
+    INTO NEW.issue_date, NEW.org_id, NEW.unit_id, NEW.category
+    FROM item i
+    JOIN transaction t ON t.id = i.transaction_id
+    WHERE i.id = NEW.item_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_fill_filters
+BEFORE INSERT OR UPDATE OF item_id ON embeddings_itemembedding
+FOR EACH ROW EXECUTE FUNCTION embedding_fill_filters();
+
+CREATE FUNCTION embedding_item_category_change() RETURNS trigger AS $$
+BEGIN
+    UPDATE embeddings_itemembedding SET category = NEW.ai_category
+    WHERE item_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_item_category_change
+AFTER UPDATE OF ai_category ON item
+FOR EACH ROW WHEN (OLD.ai_category IS DISTINCT FROM NEW.ai_category)
+EXECUTE FUNCTION embedding_item_category_change();
+
+CREATE FUNCTION embedding_transaction_change() RETURNS trigger AS $$
+BEGIN
+    UPDATE embeddings_itemembedding e
+    SET issue_date = NEW.issue_date, org_id = NEW.org_id, unit_id = NEW.unit_id
+    FROM item i
+    WHERE i.transaction_id = NEW.id AND e.item_id = i.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_transaction_change
+AFTER UPDATE OF issue_date, org_id, unit_id ON transaction
+FOR EACH ROW WHEN (
+    OLD.issue_date IS DISTINCT FROM NEW.issue_date
+    OR OLD.org_id IS DISTINCT FROM NEW.org_id
+    OR OLD.unit_id IS DISTINCT FROM NEW.unit_id
+)
+EXECUTE FUNCTION embedding_transaction_change();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_fill_filters ON embeddings_itemembedding;
+DROP TRIGGER IF EXISTS embedding_item_category_change ON item;
+DROP TRIGGER IF EXISTS embedding_transaction_change ON transaction;
+DROP FUNCTION IF EXISTS embedding_fill_filters();
+DROP FUNCTION IF EXISTS embedding_item_category_change();
+DROP FUNCTION IF EXISTS embedding_transaction_change();
+"""
+
+BACKFILL = """
+UPDATE embeddings_itemembedding e
+SET issue_date = t.issue_date, org_id = t.org_id, unit_id = t.unit_id,
+    category = i.ai_category
+FROM item i
+JOIN transaction t ON t.id = i.transaction_id
+WHERE e.item_id = i.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0003_daily_rollups'),
+        ('embeddings', '0004_itemembedding_text_search_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemembedding',
+            name='category',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemembedding',
+            name='issue_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemembedding',
+            name='org',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='db.organization'),
+        ),
+        migrations.AddField(
+            model_name='itemembedding',
+            name='unit',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='db.unit'),
+        ),
+        migrations.RunSQL(sql=CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(sql=BACKFILL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='itemembedding',
+            index=models.Index(fields=['issue_date'], name='embedding_issue_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemembedding',
+            index=models.Index(fields=['category'], name='embedding_category_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# New items, and items whose embedded fields change, are queued in the same
+# transaction that writes them. One NOTIFY per statement wakes the
+# embedding_worker, which is delivered only after that transaction commits.
+CREATE_TRIGGERS = """
+CREATE FUNCTION embedding_enqueue_inserted() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO embedding_queue (item_id, enqueued_at)
+    SELECT id, now() FROM new_rows
+    ON CONFLICT (item_id) DO NOTHING;
+    PERFORM pg_notify('embedding_queue', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_enqueue_inserted
+AFTER INSERT ON item
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION embedding_enqueue_inserted();
+
+CREATE FUNCTION embedding_enqueue_updated() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO embedding_queue (item_id, enqueued_at)
+    VALUES (NEW.id, now())
+    ON CONFLICT (item_id) DO NOTHING;
+    PERFORM pg_notify('embedding_queue', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_enqueue_updated
+AFTER UPDATE OF name, price, quantity, ai_brand, ai_category,
+    ai_quantity_value, ai_quantity_unit ON item
+FOR EACH ROW WHEN (
+    (OLD.name, OLD.price, OLD.quantity, OLD.ai_brand, OLD.ai_category,
+     OLD.ai_quantity_value, OLD.ai_quantity_unit)
+    IS DISTINCT FROM
+    (NEW.name, NEW.price, NEW.quantity, NEW.ai_brand, NEW.ai_category,
+     NEW.ai_quantity_value, NEW.ai_quantity_unit)
+)
+EXECUTE FUNCTION embedding_enqueue_updated();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_enqueue_inserted ON item;
+DROP TRIGGER IF EXISTS embedding_enqueue_updated ON item;
+DROP FUNCTION IF EXISTS embedding_enqueue_inserted();
+DROP FUNCTION IF EXISTS embedding_enqueue_updated();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0003_daily_rollups'),
+        ('embeddings', '0005_itemembedding_filter_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingQueue',
+            fields=[
+                ('item', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='db.item')),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'embedding_queue',
+                'indexes': [models.Index(fields=['enqueued_at'], name='embedding_queue_order_idx')],
+            },
+        ),
+        migrations.RunSQL(sql=CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
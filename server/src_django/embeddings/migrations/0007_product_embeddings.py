@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:42
+
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0003_daily_rollups'),
+        ('embeddings', '0006_embedding_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_key', models.CharField(max_length=64, unique=True)),
+                ('name', models.TextField()),
+                ('brand', models.TextField()),
+                ('category', models.TextField()),
+                ('text_content', models.TextField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+            ],
+            options={
+                'indexes': [pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='product_embedding_hnsw_idx', opclasses=['vector_cosine_ops'])],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductItem',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='product_link', serialize=False, to='db.item')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='embeddings.productembedding')),
+            ],
+        ),
+    ]
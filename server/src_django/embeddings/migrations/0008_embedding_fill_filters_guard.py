@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# The per-row lookup of migration 0005 ran for every embedding written, also
+# on the bulk paths. Those now fill the filter columns themselves with one
+# join per chunk (embeddings.pipeline), so the lookup only runs for rows that
+# arrive without them, and on UPDATE only when item_id really changes. The
+# function itself is unchanged. org_id and unit_id already have the default
+# foreign key indexes from 0005.
+CREATE_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_fill_filters ON embeddings_itemembedding;
+
+CREATE TRIGGER embedding_fill_filters
+BEFORE INSERT ON embeddings_itemembedding
+FOR EACH ROW WHEN (
+    NEW.issue_date IS NULL AND NEW.org_id IS NULL
+    AND NEW.unit_id IS NULL AND NEW.category IS NULL
+)
+EXECUTE FUNCTION embedding_fill_filters();
+
+CREATE TRIGGER embedding_refill_filters
+BEFORE UPDATE OF item_id ON embeddings_itemembedding
+FOR EACH ROW WHEN (OLD.item_id IS DISTINCT FROM NEW.item_id)
+EXECUTE FUNCTION embedding_fill_filters();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_refill_filters ON embeddings_itemembedding;
+DROP TRIGGER IF EXISTS embedding_fill_filters ON embeddings_itemembedding;
+
+CREATE TRIGGER embedding_fill_filters
+BEFORE INSERT OR UPDATE OF item_id ON embeddings_itemembedding
+FOR EACH ROW EXECUTE FUNCTION embedding_fill_filters();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0007_product_embeddings'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# An item moved to another receipt kept the old receipt's date and shop in
+# its embedding's filter columns, 0005 only followed ai_category. The item
+# trigger now also fires on transaction_id and copies all filter columns
+# from the item's current receipt.
+CREATE_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_item_category_change ON item;
+DROP FUNCTION IF EXISTS embedding_item_category_change();
+
+CREATE FUNCTION embedding_item_filters_change() RETURNS trigger AS $$
+BEGIN
+    UPDATE embeddings_itemembedding e
+    SET issue_date = t.issue_date, org_id = t.org_id, unit_id = t.unit_id,
+        category = NEW.ai_category
+    FROM transaction t
+    WHERE e.item_id = NEW.id AND t.id = NEW.transaction_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_item_filters_change
+AFTER UPDATE OF ai_category, transaction_id ON item
+FOR EACH ROW WHEN (
+    OLD.ai_category IS DISTINCT FROM NEW.ai_category
+    OR OLD.transaction_id IS DISTINCT FROM NEW.transaction_id
+)
+EXECUTE FUNCTION embedding_item_filters_change();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_item_filters_change ON item;
+DROP FUNCTION IF EXISTS embedding_item_filters_change();
+
+CREATE FUNCTION embedding_item_category_change() RETURNS trigger AS $$
+BEGIN
+    UPDATE embeddings_itemembedding SET category = NEW.ai_category
+    WHERE item_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_item_category_change
+AFTER UPDATE OF ai_category ON item
+FOR EACH ROW WHEN (OLD.ai_category IS DISTINCT FROM NEW.ai_category)
+EXECUTE FUNCTION embedding_item_category_change();
+"""
+
+# embeddings of items moved before this migration
+BACKFILL = """
+UPDATE embeddings_itemembedding e
+SET issue_date = t.issue_date, org_id = t.org_id, unit_id = t.unit_id
+FROM item i
+JOIN transaction t ON t.id = i.transaction_id
+WHERE e.item_id = i.id
+  AND (e.issue_date, e.org_id, e.unit_id)
+      IS DISTINCT FROM (t.issue_date, t.org_id, t.unit_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0008_embedding_fill_filters_guard'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(sql=BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# The embedded text names the item's receipt id and date (embeddings.text),
+# so an item moved to another receipt and a receipt whose issue_date changes
+# must be re-embedded too; 0006 only watched the item's own fields.
+CREATE_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_enqueue_updated ON item;
+
+CREATE TRIGGER embedding_enqueue_updated
+AFTER UPDATE OF name, price, quantity, ai_brand, ai_category,
+    ai_quantity_value, ai_quantity_unit, transaction_id ON item
+FOR EACH ROW WHEN (
+    (OLD.name, OLD.price, OLD.quantity, OLD.ai_brand, OLD.ai_category,
+     OLD.ai_quantity_value, OLD.ai_quantity_unit, OLD.transaction_id)
+    IS DISTINCT FROM
+    (NEW.name, NEW.price, NEW.quantity, NEW.ai_brand, NEW.ai_category,
+     NEW.ai_quantity_value, NEW.ai_quantity_unit, NEW.transaction_id)
+)
+EXECUTE FUNCTION embedding_enqueue_updated();
+
+CREATE FUNCTION embedding_enqueue_receipt_items() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO embedding_queue (item_id, enqueued_at)
+    SELECT id, now() FROM item WHERE transaction_id = NEW.id
+    ON CONFLICT (item_id) DO NOTHING;
+    PERFORM pg_notify('embedding_queue', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER embedding_enqueue_receipt_items
+AFTER UPDATE OF issue_date ON transaction
+FOR EACH ROW WHEN (OLD.issue_date IS DISTINCT FROM NEW.issue_date)
+EXECUTE FUNCTION embedding_enqueue_receipt_items();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS embedding_enqueue_receipt_items ON transaction;
+DROP FUNCTION IF EXISTS embedding_enqueue_receipt_items();
+DROP TRIGGER IF EXISTS embedding_enqueue_updated ON item;
+
+CREATE TRIGGER embedding_enqueue_updated
+AFTER UPDATE OF name, price, quantity, ai_brand, ai_category,
+    ai_quantity_value, ai_quantity_unit ON item
+FOR EACH ROW WHEN (
+    (OLD.name, OLD.price, OLD.quantity, OLD.ai_brand, OLD.ai_category,
+     OLD.ai_quantity_value, OLD.ai_quantity_unit)
+    IS DISTINCT FROM
+    (NEW.name, NEW.price, NEW.quantity, NEW.ai_brand, NEW.ai_category,
+     NEW.ai_quantity_value, NEW.ai_quantity_unit)
+)
+EXECUTE FUNCTION embedding_enqueue_updated();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0009_embedding_item_move_filters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
@@ -1,4 +1,4 @@
-from db.models import Item
+from db.models import Item, Organization, Unit
 from django.db import models
 from pgvector.django import HnswIndex, VectorField
 
@@ -9,11 +9,41 @@ class ItemEmbedding(models.Model):
     )
 
     text_content = models.TextField()
+    # sha256 of text_content only, template_version records which
+    # embeddings.text template built it; generate_embedding --changed
+    # re-encodes only rows whose current text hashes differently
+    content_hash = models.CharField(max_length=64, default="")
+    template_version = models.PositiveSmallIntegerField(default=1)
 
     embedding = VectorField(dimensions=384, null=True, blank=True)
 
+    # copies of the item's receipt date, shop and category for filtered RAG
+    # search, written by embeddings.pipeline and kept in sync by triggers
+    # (migrations 0005, 0008, 0009); org and unit get the default foreign key
+    # indexes, selective shop filters are answered from them
+    issue_date = models.DateTimeField(null=True, blank=True)
+    org = models.ForeignKey(
+        Organization,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    unit = models.ForeignKey(
+        Unit,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    category = models.TextField(null=True, blank=True)
+
     class Meta:
         indexes = [
+            models.Index(fields=["issue_date"], name="embedding_issue_date_idx"),
+            models.Index(fields=["category"], name="embedding_category_idx"),
             HnswIndex(
                 name="embedding_hnsw_idx",
                 fields=["embedding"],
@@ -22,3 +52,69 @@ class ItemEmbedding(models.Model):
                 opclasses=["vector_cosine_ops"],
             )
         ]
+
+
+class EmbeddingCheckpoint(models.Model):
+    """Last item id written by a generate_embedding run, reruns continue after it."""
+
+    name = models.CharField(max_length=64, primary_key=True)
+    last_item_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class EmbeddingQueue(models.Model):
+    """Items waiting for embedding_worker, filled by triggers (migrations 0006, 0010)."""
+
+    item = models.OneToOneField(
+        Item,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,  # the worker skips items deleted in the meantime
+        related_name="+",
+    )
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "embedding_queue"
+        indexes = [
+            models.Index(fields=["enqueued_at"], name="embedding_queue_order_idx"),
+        ]
+
+
+class ProductEmbedding(models.Model):
+    """
+    One distinct product (normalized English name + brand + category), embedded
+    once however many times it was bought. Filled by generate_product_embeddings.
+    """
+
+    # sha256 of the normalized name, brand and category (embeddings.text.product_key)
+    product_key = models.CharField(max_length=64, unique=True)
+    # values of the first item seen with this key
+    name = models.TextField()
+    brand = models.TextField()
+    category = models.TextField()
+
+    text_content = models.TextField()
+    embedding = VectorField(dimensions=384)
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="product_embedding_hnsw_idx",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            )
+        ]
+
+
+class ProductItem(models.Model):
+    """Product of an item, items without a row are embedded by the next run."""
+
+    item = models.OneToOneField(
+        Item, on_delete=models.CASCADE, primary_key=True, related_name="product_link"
+    )
+    product = models.ForeignKey(
+        ProductEmbedding, on_delete=models.CASCADE, related_name="items"
+    )
@@ -0,0 +1,185 @@
+"""
+Chunked item -> embedding pipeline used by generate_embedding.
+
+Items are read by keyset on item.id, one chunk of ITEM_COLUMNS rows at a
+time, so memory stays flat however big the item table is. Every chunk is
+written together with the checkpoint in one transaction, a rerun after a
+crash starts right after the last written chunk. A run that finishes
+clears the checkpoint, so the next one again picks up every item without
+an embedding.
+
+Already embedded items are scanned the same way by embedded_chunks(), rows
+whose content_hash no longer matches their current text get re-encoded and
+updated in place by update_chunk().
+
+copy_chunk() is the binary COPY variant of save_chunk() for large backfills.
+
+Every writer fills the denormalized filter columns (receipt date, shop,
+category) with one join per chunk, the row trigger from migration 0005 only
+covers rows written without them.
+"""
+
+from db.models import Item
+from django.db import connection, transaction
+from django.db.models import F
+
+from .binary_copy import COLUMNS, encode_rows
+from .models import EmbeddingCheckpoint, ItemEmbedding
+from .text import ITEM_COLUMNS, TEMPLATE_VERSION, content_hash
+
+CHECKPOINT_NAME = "item_embeddings"
+
+# COPY has no ON CONFLICT, rows land in a session temp table first, so items
+# embedded meanwhile (e.g. by embedding_worker) are skipped like in save_chunk()
+COPY_STAGE_TABLE = "embedding_copy_stage"
+CREATE_COPY_STAGE = f"""
+CREATE TEMP TABLE IF NOT EXISTS {COPY_STAGE_TABLE} (
+    item_id bigint,
+    text_content text,
+    content_hash varchar(64),
+    template_version smallint,
+    embedding vector({ItemEmbedding._meta.get_field("embedding").dimensions})
+) ON COMMIT DELETE ROWS
+"""
+INSERT_FROM_COPY_STAGE = f"""
+INSERT INTO {ItemEmbedding._meta.db_table}
+    ({", ".join(COLUMNS)}, issue_date, org_id, unit_id, category)
+SELECT {", ".join(f"s.{column}" for column in COLUMNS)},
+       t.issue_date, t.org_id, t.unit_id, i.ai_category
+FROM {COPY_STAGE_TABLE} s
+JOIN item i ON i.id = s.item_id
+JOIN transaction t ON t.id = i.transaction_id
+ON CONFLICT (item_id) DO NOTHING
+"""
+FILTER_COLUMNS = {
+    "issue_date": "transaction__issue_date",
+    "org_id": "transaction__org_id",
+    "unit_id": "transaction__unit_id",
+    "category": "ai_category",
+}
+
+
+def last_embedded_item_id():
+    checkpoint = EmbeddingCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    return checkpoint.last_item_id if checkpoint else 0
+
+
+def reset_checkpoint():
+    EmbeddingCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+
+
+def pending_items(after_id=0):
+    """Items without an embedding after the given id."""
+    return Item.objects.filter(id__gt=after_id, embedding__isnull=True)
+
+
+def pending_chunks(after_id, chunk_size):
+    """Yields lists of ITEM_COLUMNS rows in item.id order."""
+    while True:
+        rows = list(
+            pending_items(after_id).order_by("id").values(*ITEM_COLUMNS)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["id"]
+
+
+def embedded_chunks(after_id, chunk_size):
+    """Like pending_chunks() for embedded items, rows also carry the stored hash."""
+    columns = (*ITEM_COLUMNS, "embedding__id", "embedding__content_hash")
+    while True:
+        rows = list(
+            Item.objects.filter(id__gt=after_id, embedding__isnull=False)
+            .order_by("id")
+            .values(*columns)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["id"]
+
+
+def filter_values(item_ids):
+    """item id -> ItemEmbedding filter column values, one query for all items."""
+    return {
+        row.pop("id"): row
+        for row in Item.objects.filter(id__in=item_ids).values(
+            "id", **{field: F(lookup) for field, lookup in FILTER_COLUMNS.items()}
+        )
+    }
+
+
+def new_embeddings(item_ids, texts, vectors):
+    filters = filter_values(item_ids)
+    return [
+        ItemEmbedding(
+            item_id=item_id,
+            text_content=text,
+            embedding=vector,
+            content_hash=content_hash(text),
+            template_version=TEMPLATE_VERSION,
+            **filters.get(item_id, {}),
+        )
+        for item_id, text, vector in zip(item_ids, texts, vectors)
+    ]
+
+
+def save_chunk(last_item_id, item_ids, texts, vectors):
+    """Writes one chunk of embeddings and moves the checkpoint past it."""
+    with transaction.atomic():
+        ItemEmbedding.objects.bulk_create(
+            new_embeddings(item_ids, texts, vectors),
+            ignore_conflicts=True,
+        )
+        EmbeddingCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME, defaults={"last_item_id": last_item_id}
+        )
+
+
+def copy_chunk(last_item_id, item_ids, texts, vectors):
+    """save_chunk() with the rows streamed through binary COPY."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_COPY_STAGE)
+        cursor.copy_expert(
+            f"COPY {COPY_STAGE_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)",
+            encode_rows(item_ids, texts, vectors),
+        )
+        cursor.execute(INSERT_FROM_COPY_STAGE)
+        EmbeddingCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME, defaults={"last_item_id": last_item_id}
+        )
+
+
+def update_chunk(embedding_ids, texts, vectors):
+    """Overwrites text, vector and hash of existing embeddings."""
+    ItemEmbedding.objects.bulk_update(
+        [
+            ItemEmbedding(
+                id=embedding_id,
+                text_content=text,
+                embedding=vector,
+                content_hash=content_hash(text),
+                template_version=TEMPLATE_VERSION,
+            )
+            for embedding_id, text, vector in zip(embedding_ids, texts, vectors)
+        ],
+        ["text_content", "embedding", "content_hash", "template_version"],
+    )
+
+
+def mark_current(embedding_ids):
+    """Unchanged text under a newer template only needs the version bumped."""
+    ItemEmbedding.objects.filter(id__in=embedding_ids).exclude(
+        template_version=TEMPLATE_VERSION
+    ).update(template_version=TEMPLATE_VERSION)
+
+
+def upsert_embeddings(item_ids, texts, vectors):
+    """Creates embeddings or overwrites the existing ones of the same items."""
+    ItemEmbedding.objects.bulk_create(
+        new_embeddings(item_ids, texts, vectors),
+        update_conflicts=True,
+        unique_fields=["item"],
+        update_fields=["text_content", "embedding", "content_hash", "template_version"],
+    )
@@ -0,0 +1,115 @@
+"""
+Product-level embeddings used by generate_product_embeddings.
+
+Items are grouped by product_key() (normalized English name + brand +
+category) and every distinct product is encoded once into ProductEmbedding,
+ProductItem links each item to its product. The item index grows with every
+purchase, this one only with the catalogue, and a run over new receipts only
+encodes products that were never seen before.
+
+Items without a ProductItem row are the work left, so runs are incremental
+and resume after a crash without a checkpoint. relink_changed() unlinks items
+whose AI fields were corrected to another product, the next pass links them
+again.
+"""
+
+from db.models import Item
+from django.db import transaction
+
+from .models import ProductEmbedding, ProductItem
+from .text import PRODUCT_COLUMNS, product_key, product_text
+
+
+def unlinked_items():
+    return Item.objects.filter(product_link__isnull=True)
+
+
+def unlinked_chunks(chunk_size):
+    """PRODUCT_COLUMNS rows of items without a product, chunk by chunk in id order."""
+    after_id = 0
+    while True:
+        rows = list(
+            unlinked_items()
+            .filter(id__gt=after_id)
+            .order_by("id")
+            .values(*PRODUCT_COLUMNS)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["id"]
+
+
+def link_chunk(rows, encode):
+    """
+    Links the items of rows to their products, encodes only products that
+    don't exist yet. Returns the number of new products.
+    """
+    keys = [product_key(row) for row in rows]
+    first_rows = {}
+    for key, row in zip(keys, rows):
+        first_rows.setdefault(key, row)
+    product_ids = dict(
+        ProductEmbedding.objects.filter(product_key__in=first_rows).values_list(
+            "product_key", "id"
+        )
+    )
+    new_keys = [key for key in first_rows if key not in product_ids]
+    texts = [product_text(first_rows[key]) for key in new_keys]
+    vectors = encode(texts) if texts else []
+
+    with transaction.atomic():
+        ProductEmbedding.objects.bulk_create(
+            [
+                ProductEmbedding(
+                    product_key=key,
+                    name=first_rows[key]["ai_name_in_english_without_brand_and_quantity"],
+                    brand=first_rows[key]["ai_brand"],
+                    category=first_rows[key]["ai_category"],
+                    text_content=text,
+                    embedding=vector,
+                )
+                for key, text, vector in zip(new_keys, texts, vectors)
+            ],
+            # another run may have created the same product meanwhile
+            ignore_conflicts=True,
+        )
+        product_ids.update(
+            ProductEmbedding.objects.filter(product_key__in=new_keys).values_list(
+                "product_key", "id"
+            )
+        )
+        ProductItem.objects.bulk_create(
+            [
+                ProductItem(item_id=row["id"], product_id=product_ids[key])
+                for row, key in zip(rows, keys)
+            ],
+            ignore_conflicts=True,
+        )
+    return len(new_keys)
+
+
+def relink_changed(chunk_size):
+    """Unlinks items whose product key changed, returns how many."""
+    unlinked = 0
+    after_id = 0
+    while True:
+        rows = list(
+            Item.objects.filter(product_link__isnull=False, id__gt=after_id)
+            .order_by("id")
+            .values(*PRODUCT_COLUMNS, "product_link__product__product_key")[:chunk_size]
+        )
+        if not rows:
+            return unlinked
+        changed_ids = [
+            row["id"]
+            for row in rows
+            if product_key(row) != row["product_link__product__product_key"]
+        ]
+        unlinked += ProductItem.objects.filter(item_id__in=changed_ids).delete()[0]
+        after_id = rows[-1]["id"]
+
+
+def prune_products():
+    """Deletes products no item links to anymore, returns how many."""
+    return ProductEmbedding.objects.filter(items__isnull=True).delete()[0]
@@ -0,0 +1,107 @@
+"""
+One lazily loaded embedding model shared by the whole Django process.
+
+The SentenceTransformer is only created the first time something actually
+needs a vector, so migrations and commands that never embed don't pay for
+it. Set EMBEDDING_WARMUP=1 to load it when the WSGI/ASGI server starts
+instead of on the first request. EMBEDDING_BACKEND / EMBEDDING_ONNX_FILE /
+EMBEDDING_THREADS select how it runs (see embeddings.backends).
+
+Query vectors of the RAG endpoint go through encode_query(), which serves
+repeated questions from a QueryEmbeddingCache. With EMBEDDING_BATCHING=1
+cache misses are encoded by one EmbeddingBatcher worker thread, which groups
+concurrent queries into a single forward pass.
+"""
+
+import threading
+
+from django.conf import settings
+
+from .backends import load_model
+from .batching import EmbeddingBatcher
+from .cache import QueryEmbeddingCache
+
+_model = None
+_model_lock = threading.Lock()
+_query_cache = None
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """The shared SentenceTransformer, loaded on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print("Loading Embedding model...")
+                _model = load_model(
+                    settings.EMBEDDING_MODEL_NAME,
+                    backend=settings.EMBEDDING_BACKEND,
+                    onnx_file=settings.EMBEDDING_ONNX_FILE,
+                    threads=settings.EMBEDDING_THREADS,
+                )
+    return _model
+
+
+def encode(texts, **kwargs):
+    """SentenceTransformer.encode() of the shared model."""
+    return get_embedding_model().encode(texts, **kwargs)
+
+
+def get_query_cache():
+    """The process-wide query vector cache configured in settings."""
+    global _query_cache
+    if _query_cache is None:
+        shared_cache = None
+        if settings.EMBEDDING_QUERY_CACHE_SHARED_ALIAS:
+            from django.core.cache import caches
+
+            shared_cache = caches[settings.EMBEDDING_QUERY_CACHE_SHARED_ALIAS]
+        _query_cache = QueryEmbeddingCache(
+            max_size=settings.EMBEDDING_QUERY_CACHE_SIZE,
+            ttl=settings.EMBEDDING_QUERY_CACHE_TTL,
+            shared_cache=shared_cache,
+            namespace=settings.EMBEDDING_MODEL_NAME,
+        )
+    return _query_cache
+
+
+def get_batcher():
+    """The process-wide micro-batching worker for query vectors."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(
+                    encode,
+                    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                    max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+                )
+    return _batcher
+
+
+def encode_query(query):
+    """Vector of one search query, cached hits skip the model entirely."""
+    cache = get_query_cache()
+    if cache.enabled:
+        vector = cache.get(query)
+        if vector is not None:
+            return vector
+
+    if settings.EMBEDDING_BATCHING:
+        vector = get_batcher().encode(query)
+    else:
+        vector = encode(query)
+    if cache.enabled:
+        cache.set(query, vector)
+    return vector
+
+
+def warm_up():
+    """Loads the model and runs one forward pass so the first request is fast."""
+    try:
+        encode("warm up")
+        print("Embedding model warmed up.")
+    except Exception as e:
+        print(f"Failed to warm up embedding model: {e}")
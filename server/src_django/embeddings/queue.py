@@ -0,0 +1,42 @@
+"""
+Embed-on-write queue.
+
+Triggers on item and transaction (migrations 0006, 0010) put new and
+changed items, and the items of receipts whose date changed, into
+embedding_queue and NOTIFY the "embedding_queue" channel. embedding_worker
+LISTENs on it and drains the queue with process_batch(), so fresh receipts
+become searchable within seconds without scanning the item table. Claiming
+and the worker loop are shared with the receipt documents (db.queues).
+"""
+
+from db.models import Item
+from db.queues import claim_batch_sql, claimed
+
+from .models import EmbeddingQueue
+from .pipeline import upsert_embeddings
+from .text import ITEM_COLUMNS, item_text
+
+CHANNEL = "embedding_queue"
+
+CLAIM_BATCH = claim_batch_sql(EmbeddingQueue)
+
+
+def process_batch(encode, batch_size):
+    """
+    Embeds up to batch_size queued items and removes them from the queue.
+    Returns the number of queue entries handled, 0 when the queue is empty.
+    """
+    with claimed(EmbeddingQueue, CLAIM_BATCH, [batch_size]) as queued_ids:
+        item_ids = []
+        texts = []
+        # items deleted since they were queued are just dropped from the queue
+        for row in Item.objects.filter(id__in=queued_ids).values(*ITEM_COLUMNS):
+            try:
+                texts.append(item_text(row))
+                item_ids.append(row["id"])
+            except Exception as e:
+                print(f"Error processing item {row['id']}: {e}")
+
+        if texts:
+            upsert_embeddings(item_ids, texts, encode(texts))
+    return len(queued_ids)
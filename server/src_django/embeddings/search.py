@@ -0,0 +1,463 @@
+"""
+Nearest-neighbour search over ItemEmbedding with tunable HNSW parameters.
+
+hnsw.ef_search (candidate list size, pgvector default 40) trades latency
+for recall, hnsw.iterative_scan (pgvector >= 0.8) keeps scanning the graph
+when filters drop too many candidates (older servers skip the setting,
+the extension version is checked once). Deployment defaults come from
+settings (EMBEDDING_HNSW_*), single requests can override them. Values are
+applied with SET LOCAL semantics inside a transaction, so they never leak
+to other queries on a pooled connection.
+
+EMBEDDING_SEARCH_STORAGE picks the index the search runs on: the full
+precision one from the model, or a compact halfvec / binary quantized
+expression index (see the embedding_index command). The table itself keeps
+full precision vectors, compact searches fetch EMBEDDING_RERANK_FACTOR x
+more candidates and re-rank them by exact cosine distance.
+
+The "hybrid" mode adds a full-text arm over text_content (GIN index from
+migration 0004) for questions naming exact products or brands: any word of
+the question matches, except the ones every item text contains. Both ranked
+lists are merged with reciprocal rank fusion in the same SQL statement.
+
+Filters (receipt date range, organization, unit, category) run on columns
+denormalized into ItemEmbedding, inside the ANN query itself. With filters
+the HNSW scan uses EMBEDDING_HNSW_FILTERED_ITERATIVE_SCAN, so it keeps
+walking the graph until enough matching rows are found instead of returning
+whatever survived the first ef_search candidates.
+
+The "receipts" mode over-fetches item candidates and collapses them per
+transaction in SQL (best distance wins), returning distinct receipts.
+
+The "products" mode searches ProductEmbedding, one row per distinct product
+(see embeddings.products), instead of every purchased item.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, time
+from functools import cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from .models import ItemEmbedding, ProductEmbedding, ProductItem
+from .text import TEMPLATE_WORDS
+
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+SEARCH_MODES = ("vector", "hybrid", "receipts", "products")
+RRF_K = 60  # rank offset of reciprocal rank fusion, 60 is the usual choice
+MAX_EF_SEARCH = 1000  # upper limit accepted by pgvector
+DIMENSIONS = ItemEmbedding._meta.get_field("embedding").dimensions
+TABLE = ItemEmbedding._meta.db_table
+TEMPLATE_WORDS_ARRAY = f"ARRAY[{', '.join(repr(word) for word in TEMPLATE_WORDS)}]"
+
+# filter name -> (ORM lookup, SQL condition)
+FILTERS = {
+    "start_date": ("issue_date__gte", "issue_date >= %s"),
+    "end_date": ("issue_date__lte", "issue_date <= %s"),
+    "org_id": ("org_id", "org_id = %s"),
+    "unit_id": ("unit_id", "unit_id = %s"),
+    "category": ("category", "category = %s"),
+}
+
+# storage -> (index name, indexed expression, operator class, distance operator)
+STORAGE_INDEXES = {
+    "vector": ("embedding_hnsw_idx", "embedding", "vector_cosine_ops", "<=>"),
+    "halfvec": (
+        "embedding_halfvec_hnsw_idx",
+        f"(embedding::halfvec({DIMENSIONS}))",
+        "halfvec_cosine_ops",
+        "<=>",
+    ),
+    "binary": (
+        "embedding_binary_hnsw_idx",
+        f"(binary_quantize(embedding)::bit({DIMENSIONS}))",
+        "bit_hamming_ops",
+        "<~>",
+    ),
+}
+
+# the compact expression with the query vector in place of the column
+QUERY_EXPRESSIONS = {
+    "vector": "%s::vector",
+    "halfvec": f"%s::halfvec({DIMENSIONS})",
+    "binary": f"binary_quantize(%s::vector)::bit({DIMENSIONS})",
+}
+
+RERANKED_SEARCH = """
+SELECT {columns}, embedding <=> %s::vector AS distance
+FROM (
+    SELECT {columns}, embedding FROM {table}
+    {where}
+    ORDER BY {expression} {operator} {query_expression}
+    LIMIT %s
+) candidates
+ORDER BY distance
+LIMIT %s
+"""
+
+
+# vector and full-text candidates fused by 1 / (RRF_K + rank), params:
+# query vector, filters, candidates, query text, filters, candidates, limit.
+# The full-text query ORs the words of the question: ANDing them (as
+# websearch_to_tsquery does) matches nothing once a question has a word the
+# item texts don't, like "how much did I spend on Kofola". ts_rank_cd still
+# ranks texts matching more of the words first.
+HYBRID_SEARCH = """
+WITH vector_hits AS (
+    SELECT id, row_number() OVER (ORDER BY distance) AS rank
+    FROM (
+        SELECT id, {expression} {operator} {query_expression} AS distance
+        FROM {table} {where} ORDER BY distance LIMIT %s
+    ) nearest
+),
+lexical_query AS (
+    SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | ')) AS query
+    FROM unnest(to_tsvector('simple', %s))
+    WHERE lexeme <> ALL ({template_words})
+),
+lexical_hits AS (
+    SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+    FROM (
+        SELECT id, ts_rank_cd(to_tsvector('simple', text_content), query) AS score
+        FROM {table}, lexical_query
+        WHERE to_tsvector('simple', text_content) @@ query {and_filters}
+        ORDER BY score DESC LIMIT %s
+    ) matching
+),
+fused AS (
+    SELECT id, SUM(1.0 / ({rrf_k} + rank)) AS score
+    FROM (SELECT * FROM vector_hits UNION ALL SELECT * FROM lexical_hits) hits
+    GROUP BY id
+)
+SELECT e.id, e.item_id, e.text_content, fused.score
+FROM fused JOIN {table} e ON e.id = fused.id
+ORDER BY fused.score DESC
+LIMIT %s
+"""
+
+
+# item candidates (exact distance, vectors never leave the database) grouped
+# by receipt, params: query, filters, query, candidates, limit
+RECEIPT_SEARCH = """
+WITH candidates AS (
+    SELECT item_id, text_content, embedding <=> %s::vector AS distance
+    FROM (
+        SELECT item_id, text_content, embedding FROM {table}
+        {where}
+        ORDER BY {expression} {operator} {query_expression}
+        LIMIT %s
+    ) nearest
+)
+SELECT i.transaction_id,
+       MIN(c.distance) AS distance,
+       array_agg(c.item_id ORDER BY c.distance) AS item_ids,
+       array_agg(c.distance ORDER BY c.distance) AS distances,
+       array_agg(c.text_content ORDER BY c.distance) AS texts
+FROM candidates c
+JOIN item i ON i.id = c.item_id
+GROUP BY i.transaction_id
+ORDER BY distance
+LIMIT %s
+"""
+
+
+def create_index_sql(
+    storage, table=TABLE, name=None, m=16, ef_construction=64, concurrently=False
+):
+    default_name, expression, opclass, _ = STORAGE_INDEXES[storage]
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}"
+        f"IF NOT EXISTS {name or default_name} "
+        f"ON {table} USING hnsw ({expression} {opclass}) "
+        f"WITH (m = {m}, ef_construction = {ef_construction})"
+    )
+
+
+def existing_index_storages(cursor, table=TABLE):
+    """Storage modes whose HNSW index exists on table."""
+    names = {name: storage for storage, (name, *_) in STORAGE_INDEXES.items()}
+    cursor.execute(
+        "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname = ANY(%s)",
+        [table, list(names)],
+    )
+    return [names[row[0]] for row in cursor.fetchall()]
+
+
+def index_build_settings(cursor, maintenance_work_mem, parallel_workers):
+    """Memory and parallel workers of the index builds of this session."""
+    # a graph that fits in maintenance_work_mem builds many times faster
+    cursor.execute(
+        "SELECT set_config('maintenance_work_mem', %s, false), "
+        "set_config('max_parallel_maintenance_workers', %s, false)",
+        [maintenance_work_mem, str(parallel_workers)],
+    )
+
+
+def filter_conditions(filters):
+    """(SQL conditions, params) of parsed filters."""
+    conditions = [FILTERS[name][1] for name in filters]
+    return conditions, list(filters.values())
+
+
+def reranked_search_sql(
+    storage, table=TABLE, columns="id, item_id, text_content", conditions=()
+):
+    """
+    Compact index search + exact re-rank,
+    params: query, filter params, query, candidates, limit.
+    """
+    _, expression, _, operator = STORAGE_INDEXES[storage]
+    return RERANKED_SEARCH.format(
+        columns=columns,
+        table=table,
+        where=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+        expression=expression,
+        operator=operator,
+        query_expression=QUERY_EXPRESSIONS[storage],
+    )
+
+
+def hybrid_search_sql(storage, table=TABLE, conditions=()):
+    _, expression, _, operator = STORAGE_INDEXES[storage]
+    return HYBRID_SEARCH.format(
+        table=table,
+        where=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+        and_filters="".join(f" AND {condition}" for condition in conditions),
+        expression=expression,
+        operator=operator,
+        query_expression=QUERY_EXPRESSIONS[storage],
+        rrf_k=RRF_K,
+        template_words=TEMPLATE_WORDS_ARRAY,
+    )
+
+
+def receipt_search_sql(storage, table=TABLE, conditions=()):
+    _, expression, _, operator = STORAGE_INDEXES[storage]
+    return RECEIPT_SEARCH.format(
+        table=table,
+        where=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+        expression=expression,
+        operator=operator,
+        query_expression=QUERY_EXPRESSIONS[storage],
+    )
+
+
+def parse_day(value, name, day_time):
+    try:
+        day = datetime.fromisoformat(value).date()
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a date (YYYY-MM-DD).")
+    return timezone.make_aware(datetime.combine(day, day_time))
+
+
+def parse_filters(raw):
+    """Validated filters of a RAG request, dates cover whole days like the receipts API."""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("'filters' must be an object.")
+    unknown = set(raw) - set(FILTERS)
+    if unknown:
+        raise ValueError(
+            f"Unknown filters {', '.join(sorted(unknown))}, "
+            f"supported are {', '.join(FILTERS)}."
+        )
+
+    filters = {}
+    if raw.get("start_date") is not None:
+        filters["start_date"] = parse_day(raw["start_date"], "start_date", time.min)
+    if raw.get("end_date") is not None:
+        filters["end_date"] = parse_day(raw["end_date"], "end_date", time.max)
+    for name in ("org_id", "unit_id"):
+        if raw.get(name) is not None:
+            try:
+                filters[name] = int(raw[name])
+            except (TypeError, ValueError):
+                raise ValueError(f"'{name}' must be an integer.")
+    if raw.get("category") is not None:
+        filters["category"] = str(raw["category"])
+    return filters
+
+
+def search_params(ef_search=None, iterative_scan=None, mode=None, filters=None):
+    """Settings defaults with per-request overrides, raises ValueError on bad input."""
+    filters = parse_filters(filters)
+    mode = settings.EMBEDDING_SEARCH_MODE if mode is None else mode
+    ef_search = settings.EMBEDDING_HNSW_EF_SEARCH if ef_search is None else ef_search
+    if iterative_scan is None:
+        iterative_scan = (
+            settings.EMBEDDING_HNSW_FILTERED_ITERATIVE_SCAN
+            if filters
+            else settings.EMBEDDING_HNSW_ITERATIVE_SCAN
+        )
+    try:
+        ef_search = int(ef_search)
+    except (TypeError, ValueError):
+        raise ValueError("'ef_search' must be an integer.")
+    if not 1 <= ef_search <= MAX_EF_SEARCH:
+        raise ValueError(f"'ef_search' must be between 1 and {MAX_EF_SEARCH}.")
+    if iterative_scan not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"'iterative_scan' must be one of {', '.join(ITERATIVE_SCAN_MODES)}.")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"'mode' must be one of {', '.join(SEARCH_MODES)}.")
+    # products aren't tied to a receipt, shop or date
+    if mode == "products" and filters:
+        raise ValueError("'filters' are not supported in the products mode.")
+    return {
+        "ef_search": ef_search,
+        "iterative_scan": iterative_scan,
+        "mode": mode,
+        "filters": filters,
+    }
+
+
+@cache
+def iterative_scan_supported():
+    """Whether the server's pgvector (>= 0.8) has hnsw.iterative_scan, checked once."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    major, minor = (int(part) for part in row[0].split(".")[:2])
+    return (major, minor) >= (0, 8)
+
+
+@contextmanager
+def hnsw_session(params):
+    """Transaction with the HNSW parameters applied to its queries only."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        # set_config(..., true) is SET LOCAL that accepts bind parameters
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true)", [str(params["ef_search"])]
+        )
+        # servers before pgvector 0.8 don't know the setting, their scans stay as they are
+        if params["iterative_scan"] != "off" and iterative_scan_supported():
+            cursor.execute(
+                "SELECT set_config('hnsw.iterative_scan', %s, true)",
+                [params["iterative_scan"]],
+            )
+        yield
+
+
+def nearest_items(query_embedding, limit, params):
+    """The `limit` ItemEmbeddings closest to the query vector, by cosine distance."""
+    storage = settings.EMBEDDING_SEARCH_STORAGE
+    filters = params["filters"]
+    if storage == "vector":
+        lookups = {FILTERS[name][0]: value for name, value in filters.items()}
+        with hnsw_session(params):
+            items = list(
+                ItemEmbedding.objects.only("id", "item_id", "text_content")
+                .filter(**lookups)
+                .annotate(distance=CosineDistance("embedding", query_embedding))
+                .order_by("distance")[:limit]
+            )
+        # relaxed_order iterative scans may return rows slightly out of order
+        return sorted(items, key=lambda item: item.distance)
+
+    candidates = limit * settings.EMBEDDING_RERANK_FACTOR
+    query = vector_literal(query_embedding)
+    conditions, filter_params = filter_conditions(filters)
+    # an HNSW scan returns at most ef_search rows
+    params = {**params, "ef_search": min(MAX_EF_SEARCH, max(params["ef_search"], candidates))}
+    with hnsw_session(params):
+        return list(
+            ItemEmbedding.objects.raw(
+                reranked_search_sql(storage, conditions=conditions),
+                [query, *filter_params, query, candidates, limit],
+            )
+        )
+
+
+def hybrid_items(query, query_embedding, limit, params):
+    """Top `limit` ItemEmbeddings of vector and full-text search fused by RRF."""
+    candidates = limit * settings.EMBEDDING_RERANK_FACTOR
+    conditions, filter_params = filter_conditions(params["filters"])
+    params = {**params, "ef_search": min(MAX_EF_SEARCH, max(params["ef_search"], candidates))}
+    with hnsw_session(params):
+        return list(
+            ItemEmbedding.objects.raw(
+                hybrid_search_sql(settings.EMBEDDING_SEARCH_STORAGE, conditions=conditions),
+                [
+                    vector_literal(query_embedding),
+                    *filter_params,
+                    candidates,
+                    query,
+                    *filter_params,
+                    candidates,
+                    limit,
+                ],
+            )
+        )
+
+
+def similar_receipts(query_embedding, limit, params):
+    """The `limit` receipts with the closest items, best item distance first."""
+    candidates = limit * settings.EMBEDDING_RECEIPT_OVERFETCH
+    query = vector_literal(query_embedding)
+    conditions, filter_params = filter_conditions(params["filters"])
+    params = {**params, "ef_search": min(MAX_EF_SEARCH, max(params["ef_search"], candidates))}
+    with hnsw_session(params), connection.cursor() as cursor:
+        cursor.execute(
+            receipt_search_sql(settings.EMBEDDING_SEARCH_STORAGE, conditions=conditions),
+            [query, *filter_params, query, min(candidates, MAX_EF_SEARCH), limit],
+        )
+        rows = cursor.fetchall()
+
+    return [
+        {
+            "receipt_id": transaction_id,
+            "distance": distance,
+            "items": [
+                {"item_id": item_id, "distance": item_distance, "text": text}
+                for item_id, item_distance, text in zip(item_ids, distances, texts)
+            ],
+        }
+        for transaction_id, distance, item_ids, distances, texts in rows
+    ]
+
+
+def similar_products(query_embedding, limit, params):
+    """The `limit` closest distinct products with the number of their items."""
+    with hnsw_session(params):
+        products = list(
+            ProductEmbedding.objects.annotate(
+                distance=CosineDistance("embedding", query_embedding)
+            )
+            .order_by("distance")
+            .values("id", "name", "brand", "category", "distance")[:limit]
+        )
+    # counted separately, a GROUP BY around the ANN query would skip the index
+    item_counts = dict(
+        ProductItem.objects.filter(product_id__in=[product["id"] for product in products])
+        .values("product")
+        .annotate(count=Count("item"))
+        .values_list("product", "count")
+    )
+    return [
+        {
+            "product_id": product["id"],
+            "name": product["name"],
+            "brand": product["brand"],
+            "category": product["category"],
+            "distance": product["distance"],
+            "item_count": item_counts.get(product["id"], 0),
+        }
+        for product in products
+    ]
+
+
+def search_items(query, query_embedding, limit, params):
+    """Items for a RAG question in the requested search mode."""
+    if params["mode"] == "hybrid":
+        return hybrid_items(query, query_embedding, limit, params)
+    return nearest_items(query_embedding, limit, params)
+
+
+def vector_literal(vector):
+    return "[" + ",".join(str(float(value)) for value in vector) + "]"
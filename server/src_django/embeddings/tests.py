@@ -1,3 +1,454 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from db.models import Item, Organization, Transaction, Unit
+from embeddings.batching import EmbeddingBatcher
+from embeddings.cache import QueryEmbeddingCache
+from embeddings.models import EmbeddingQueue, ItemEmbedding, ProductEmbedding
+from embeddings.pipeline import (
+    copy_chunk,
+    embedded_chunks,
+    last_embedded_item_id,
+    pending_chunks,
+    save_chunk,
+    update_chunk,
+    upsert_embeddings,
+)
+from embeddings.products import link_chunk, prune_products, relink_changed, unlinked_chunks
+from embeddings.queue import process_batch
+from embeddings.search import (
+    search_items,
+    search_params,
+    similar_products,
+    similar_receipts,
+)
+from embeddings.text import content_hash, item_text
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def test_normalized_hit_and_lru_eviction(self):
+        cache = QueryEmbeddingCache(max_size=2, ttl=60)
+        cache.set("How much did I spend on beer?", [1.0, 2.0])
+        cache.set("last purchase", [3.0, 4.0])
+        np.testing.assert_array_equal(
+            cache.get("  how much did I SPEND on beer? "), [1.0, 2.0]
+        )
+        cache.set("top brands", [5.0, 6.0])  # evicts "last purchase"
+        self.assertIsNone(cache.get("last purchase"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_expired_entries_are_missed(self):
+        cache = QueryEmbeddingCache(max_size=10, ttl=60)
+        with mock.patch("embeddings.cache.time.monotonic", return_value=100.0):
+            cache.set("beer", [1.0])
+        with mock.patch("embeddings.cache.time.monotonic", return_value=161.0):
+            self.assertIsNone(cache.get("beer"))
+
+    def test_shared_store_is_used_by_other_workers(self):
+        shared = LocMemCache("query-embeddings-test", {})
+        QueryEmbeddingCache(10, 60, shared, "model").set("beer", [1.0, 2.0])
+        other_worker = QueryEmbeddingCache(10, 60, shared, "model")
+        np.testing.assert_array_equal(other_worker.get("beer"), [1.0, 2.0])
+        self.assertEqual(other_worker.stats()["shared_hits"], 1)
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    def test_concurrent_queries_share_batches(self):
+        batch_sizes = []
+
+        def fake_encode(texts):
+            batch_sizes.append(len(texts))
+            return [np.array([len(text)], dtype=np.float32) for text in texts]
+
+        batcher = EmbeddingBatcher(fake_encode, max_batch_size=8, max_wait_ms=50)
+        texts = ["x" * n for n in range(1, 33)]
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            vectors = list(pool.map(lambda text: batcher.encode(text, timeout=5), texts))
+
+        self.assertEqual([int(v[0]) for v in vectors], list(range(1, 33)))
+        self.assertEqual(sum(batch_sizes), 32)
+        self.assertLessEqual(max(batch_sizes), 8)
+        self.assertLess(len(batch_sizes), 32)
+
+    def test_encode_errors_reach_the_caller(self):
+        def failing_encode(texts):
+            raise RuntimeError("model is gone")
+
+        batcher = EmbeddingBatcher(failing_encode, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            batcher.encode("beer", timeout=5)
+
+
+def create_items(
+    names, brand="Rajo", issue_date=datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+):
+    org = Organization.objects.create(
+        ico="3", dic="3", ic_dph="SK3", name="Tesco", building_number="5",
+        country="Slovensko", municipality="Zilina", postal_code="01001",
+        street_name="Hlavna",
+    )
+    unit = Unit.objects.create(
+        org=org, name="Tesco Zilina", country="Slovensko",
+        municipality="Zilina", postal_code="01001", building_number="5",
+        property_registration_number="3", street_name="Hlavna",
+        latitude=49.22, longitude=18.74,
+    )
+    transaction = Transaction.objects.create(
+        issue_date=issue_date, org=org, unit=unit
+    )
+    return Item.objects.bulk_create(
+        Item(
+            transaction=transaction, quantity=1, name=name, price="0.59",
+            ai_name_without_brand_and_quantity="jogurt",
+            ai_name_in_english_without_brand_and_quantity="yogurt",
+            ai_brand=brand, ai_category="Dairy", ai_quantity_value=150,
+            ai_quantity_unit="g",
+        )
+        for name in names
+    )
+
+
+class EmbeddingPipelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_items([f"Jogurt {n}" for n in range(5)])
+
+    def write(self, rows):
+        texts = [item_text(row) for row in rows]
+        vectors = [np.full(384, 0.1, dtype=np.float32) for _ in rows]
+        save_chunk(rows[-1]["id"], [row["id"] for row in rows], texts, vectors)
+
+    def test_rerun_resumes_after_the_last_written_chunk(self):
+        chunks = pending_chunks(last_embedded_item_id(), chunk_size=2)
+        first = next(chunks)
+        self.write(first)
+        # the run dies here, the next one must continue after the first chunk
+
+        after_id = last_embedded_item_id()
+        self.assertEqual(after_id, first[-1]["id"])
+        rest = [row for rows in pending_chunks(after_id, chunk_size=2) for row in rows]
+        self.assertEqual(len(rest), 3)
+        self.assertGreater(rest[0]["id"], after_id)
+
+        self.write(rest)
+        self.assertEqual(ItemEmbedding.objects.count(), 5)
+        self.assertEqual(list(pending_chunks(last_embedded_item_id(), 2)), [])
+
+    def test_finished_run_also_embeds_items_below_the_checkpoint(self):
+        rows = [row for rows in pending_chunks(0, chunk_size=10) for row in rows]
+        # an interrupted run wrote items 0-2 except item 1 (its text failed)
+        self.write([rows[0], rows[2]])
+        self.assertEqual(last_embedded_item_id(), rows[2]["id"])
+
+        model = mock.Mock()
+        model.encode.side_effect = lambda texts, batch_size: np.full(
+            (len(texts), 384), 0.1, dtype=np.float32
+        )
+        command = "embeddings.management.commands.generate_embedding.get_embedding_model"
+        with mock.patch(command, return_value=model):
+            call_command("generate_embedding", stdout=StringIO())
+            self.assertEqual(last_embedded_item_id(), 0)
+            self.assertEqual(ItemEmbedding.objects.count(), 4)
+
+            call_command("generate_embedding", stdout=StringIO())
+        self.assertEqual(ItemEmbedding.objects.count(), 5)
+        self.assertEqual(last_embedded_item_id(), 0)
+
+    def test_only_changed_texts_are_reencoded(self):
+        self.write([row for rows in pending_chunks(0, chunk_size=10) for row in rows])
+        changed_item = Item.objects.order_by("id")[2]
+        changed_item.ai_brand = "Tami"
+        changed_item.save()
+
+        changed = [
+            row
+            for rows in embedded_chunks(0, chunk_size=2)
+            for row in rows
+            if content_hash(item_text(row)) != row["embedding__content_hash"]
+        ]
+        self.assertEqual([row["id"] for row in changed], [changed_item.id])
+
+        text = item_text(changed[0])
+        update_chunk([changed[0]["embedding__id"]], [text], [np.zeros(384)])
+        embedding = ItemEmbedding.objects.get(item=changed_item)
+        self.assertIn("Brand: Tami", embedding.text_content)
+        self.assertEqual(embedding.content_hash, content_hash(text))
+
+    def test_writers_fill_the_filter_columns_themselves(self):
+        rows = [row for rows in pending_chunks(0, chunk_size=10) for row in rows]
+        texts = [item_text(row) for row in rows]
+        # distinct vectors: piles of identical ones left in the HNSW graph by
+        # this rolled back test make later small-table searches come back empty
+        vectors = [np.random.default_rng(n).random(384) for n in range(len(rows))]
+        ids = [row["id"] for row in rows]
+        with connection.cursor() as cursor:
+            # rolled back with the test, the bulk paths must not rely on it
+            cursor.execute(
+                "ALTER TABLE embeddings_itemembedding DISABLE TRIGGER embedding_fill_filters"
+            )
+        save_chunk(ids[1], ids[:2], texts[:2], vectors[:2])
+        copy_chunk(ids[3], ids[2:4], texts[2:4], vectors[2:4])
+        upsert_embeddings(ids[4:], texts[4:], vectors[4:])
+
+        item = Item.objects.select_related("transaction").get(id=ids[0])
+        self.assertEqual(
+            set(ItemEmbedding.objects.values_list("issue_date", "org_id", "unit_id", "category")),
+            {
+                (
+                    item.transaction.issue_date,
+                    item.transaction.org_id,
+                    item.transaction.unit_id,
+                    "Dairy",
+                )
+            },
+        )
+
+    def test_binary_copy_writes_the_same_rows(self):
+        rows = [row for rows in pending_chunks(0, chunk_size=10) for row in rows]
+        self.write(rows[:1])
+        texts = [item_text(row) for row in rows]
+        vectors = [np.arange(384, dtype=np.float32) / (n + 1) for n in range(len(rows))]
+        # the first item is already embedded and must be left alone
+        copy_chunk(rows[-1]["id"], [row["id"] for row in rows], texts, vectors)
+
+        self.assertEqual(last_embedded_item_id(), rows[-1]["id"])
+        self.assertEqual(ItemEmbedding.objects.count(), 5)
+        copied = ItemEmbedding.objects.get(item_id=rows[3]["id"])
+        np.testing.assert_array_equal(copied.embedding, vectors[3])
+        self.assertEqual(copied.content_hash, content_hash(texts[3]))
+        self.assertIsNotNone(copied.issue_date)
+        self.assertEqual(
+            ItemEmbedding.objects.get(item_id=rows[0]["id"]).embedding[1], np.float32(0.1)
+        )
+
+
+class EmbeddingSearchTests(TestCase):
+    def test_hybrid_mode_finds_exact_product_names(self):
+        items = create_items(["Jogurt biely", "Jogurt jahoda", "Syr eidam", "Maslo", "Kofola"])
+        query_vector = np.zeros(384, dtype=np.float32)
+        query_vector[0] = 1
+        for n, item in enumerate(items):
+            # the Kofola item is the farthest from the query vector
+            vector = query_vector.copy()
+            vector[1] = n
+            ItemEmbedding.objects.create(
+                item=item, text_content=item_text_of(item), embedding=vector
+            )
+
+        # a question, not a bare name: its other words are in no item text
+        query = "How much did I spend on Kofola last month?"
+        vector_only = search_items(query, query_vector, 2, search_params(mode="vector"))
+        hybrid = search_items(query, query_vector, 2, search_params(mode="hybrid"))
+        self.assertNotIn(items[4].id, [hit.item_id for hit in vector_only])
+        self.assertEqual(hybrid[0].item_id, items[4].id)
+
+    def test_filters_are_applied_inside_the_search(self):
+        may = create_items(["Pivo Zlaty Bazant", "Pivo Smadny Mnich"])
+        june = create_items(
+            ["Pivo Corgon"], issue_date=datetime(2024, 6, 3, 18, 0, tzinfo=timezone.utc)
+        )
+        for item in may + june:
+            ItemEmbedding.objects.create(
+                item=item, text_content=item_text_of(item), embedding=np.ones(384)
+            )
+        # filter columns are copied from the item and its receipt by triggers
+        Item.objects.filter(id=may[0].id).update(ai_category="Beer")
+        embedding = ItemEmbedding.objects.get(item=may[0])
+        self.assertEqual(embedding.category, "Beer")
+        self.assertEqual(embedding.org_id, may[0].transaction.org_id)
+
+        def search(mode, **filters):
+            # default settings, also on servers without iterative scan (pgvector < 0.8)
+            params = search_params(mode=mode, filters=filters)
+            self.assertEqual(params["iterative_scan"], "relaxed_order")
+            return {hit.item_id for hit in search_items("Pivo", np.ones(384), 10, params)}
+
+        for mode in ("vector", "hybrid"):
+            self.assertEqual(
+                search(mode, start_date="2024-06-01", end_date="2024-06-30"), {june[0].id}
+            )
+            self.assertEqual(
+                search(mode, org_id=may[0].transaction.org_id), {may[0].id, may[1].id}
+            )
+            self.assertEqual(search(mode, category="Beer"), {may[0].id})
+
+    def test_moved_items_take_the_filters_of_their_new_receipt(self):
+        may = create_items(["Pivo Zlaty Bazant"])
+        june = create_items(
+            ["Pivo Corgon"], issue_date=datetime(2024, 6, 3, 18, 0, tzinfo=timezone.utc)
+        )
+        ItemEmbedding.objects.create(
+            item=may[0], text_content=item_text_of(may[0]), embedding=np.ones(384)
+        )
+        Item.objects.filter(id=may[0].id).update(transaction=june[0].transaction)
+        embedding = ItemEmbedding.objects.get(item=may[0])
+        self.assertEqual(embedding.issue_date, june[0].transaction.issue_date)
+        self.assertEqual(embedding.org_id, june[0].transaction.org_id)
+        self.assertEqual(embedding.unit_id, june[0].transaction.unit_id)
+
+    def test_receipts_mode_returns_distinct_receipts(self):
+        close = create_items(["Mlieko", "Maslo", "Syr"])
+        far = create_items(["Chlieb"])
+        query_vector = np.zeros(384, dtype=np.float32)
+        query_vector[0] = 1
+        for n, item in enumerate(close + far):
+            vector = query_vector.copy()
+            vector[1] = n
+            ItemEmbedding.objects.create(
+                item=item, text_content=item_text_of(item), embedding=vector
+            )
+
+        receipts = similar_receipts(query_vector, 2, search_params(mode="receipts"))
+        self.assertEqual(
+            [receipt["receipt_id"] for receipt in receipts],
+            [close[0].transaction_id, far[0].transaction_id],
+        )
+        items = receipts[0]["items"]
+        self.assertEqual([item["item_id"] for item in items], [item.id for item in close])
+        self.assertEqual(receipts[0]["distance"], items[0]["distance"])
+        self.assertIn("Mlieko", items[0]["text"])
+
+    def test_query_string_options_reach_the_search(self):
+        # the gateway forwards its query string to /api/rag/ next to the JSON body
+        may = create_items(["Pivo Zlaty Bazant"])
+        june = create_items(
+            ["Pivo Corgon"], issue_date=datetime(2024, 6, 3, 18, 0, tzinfo=timezone.utc)
+        )
+        for item in may + june:
+            ItemEmbedding.objects.create(
+                item=item, text_content=item_text_of(item), embedding=np.ones(384)
+            )
+        with mock.patch("api.views.get_embedding_model"), mock.patch(
+            "api.views.encode_query", return_value=np.ones(384)
+        ):
+            response = self.client.post(
+                "/api/rag/?mode=receipts&ef_search=100&start_date=2024-06-01&end_date=2024-06-30",
+                {"query": "pivo", "receipts_count": 5},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [receipt["receipt_id"] for receipt in response.json()["receipts"]],
+                [june[0].transaction_id],
+            )
+            response = self.client.post(
+                "/api/rag/?ef_search=0",
+                {"query": "pivo", "receipts_count": 5},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_filters_are_rejected(self):
+        with self.assertRaises(ValueError):
+            search_params(filters={"shop": "Lidl"})
+        with self.assertRaises(ValueError):
+            search_params(filters={"start_date": "last month"})
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            search_params(mode="magic")
+
+
+def item_text_of(item):
+    return f"Item purchased: {item.name}. Brand: {item.ai_brand}, Category: {item.ai_category}."
+
+
+class EmbeddingQueueTests(TestCase):
+    def fake_encode(self, texts):
+        return [np.full(384, 0.1, dtype=np.float32) for _ in texts]
+
+    def test_written_items_are_queued_and_embedded(self):
+        items = create_items(["Kofola", "Rozok", "Maslo"])
+        self.assertEqual(EmbeddingQueue.objects.count(), 3)
+
+        self.assertEqual(process_batch(self.fake_encode, 2), 2)
+        self.assertEqual(process_batch(self.fake_encode, 2), 1)
+        self.assertEqual(process_batch(self.fake_encode, 2), 0)
+        self.assertEqual(ItemEmbedding.objects.count(), 3)
+
+        # a correction of an embedded field queues the item again
+        Item.objects.filter(id=items[0].id).update(ai_brand="Kofola a.s.")
+        Item.objects.filter(id=items[1].id).update(ai_name_without_brand_and_quantity="x")
+        self.assertEqual(list(EmbeddingQueue.objects.values_list("item_id", flat=True)), [items[0].id])
+        process_batch(self.fake_encode, 10)
+        self.assertIn(
+            "Brand: Kofola a.s.", ItemEmbedding.objects.get(item=items[0]).text_content
+        )
+        self.assertEqual(ItemEmbedding.objects.count(), 3)
+
+    def test_receipt_changes_queue_the_items_of_the_receipt(self):
+        # the embedded text names the receipt id and its date
+        items = create_items(["Kofola", "Rozok"])
+        other = create_items(["Maslo"])
+        process_batch(self.fake_encode, 10)
+
+        Transaction.objects.filter(id=items[0].transaction_id).update(
+            issue_date=datetime(2024, 5, 2, 12, 0, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+            set(EmbeddingQueue.objects.values_list("item_id", flat=True)),
+            {items[0].id, items[1].id},
+        )
+        process_batch(self.fake_encode, 10)
+        self.assertIn("Date: 2024-05-02", ItemEmbedding.objects.get(item=items[0]).text_content)
+
+        Item.objects.filter(id=other[0].id).update(transaction_id=items[0].transaction_id)
+        self.assertEqual(
+            list(EmbeddingQueue.objects.values_list("item_id", flat=True)), [other[0].id]
+        )
+        process_batch(self.fake_encode, 10)
+        self.assertIn(
+            f"Receipt (Transaction) ID: {items[0].transaction_id}.",
+            ItemEmbedding.objects.get(item=other[0]).text_content,
+        )
+
+
+class ProductEmbeddingTests(TestCase):
+    def setUp(self):
+        self.encoded = []
+
+    def fake_encode(self, texts):
+        self.encoded.extend(texts)
+        return [np.full(384, len(self.encoded), dtype=np.float32) for _ in texts]
+
+    def link_all(self):
+        return sum(link_chunk(rows, self.fake_encode) for rows in unlinked_chunks(2))
+
+    def test_repeat_purchases_share_one_product(self):
+        items = create_items(["Jogurt biely", "JOGURT BIELY 150g", "Jogurt"])
+        create_items(["Jogurt"], brand=" RAJO ")
+        create_items(["Jogurt"], brand="Tami")
+
+        self.assertEqual(self.link_all(), 2)
+        self.assertEqual(len(self.encoded), 2)
+        self.assertEqual(list(unlinked_chunks(2)), [])
+
+        # new receipts of a known product don't encode anything
+        create_items(["Jogurt biely"])
+        self.assertEqual(self.link_all(), 0)
+        self.assertEqual(len(self.encoded), 2)
+
+        products = similar_products(
+            np.full(384, 1, dtype=np.float32), 5, search_params(mode="products", iterative_scan="off")
+        )
+        self.assertEqual(sorted(p["item_count"] for p in products), [1, 5])
+
+        # a corrected brand moves the item to another product
+        Item.objects.filter(id=items[0].id).update(ai_brand="Tami")
+        self.assertEqual(relink_changed(2), 1)
+        self.assertEqual(self.link_all(), 0)
+        self.assertEqual(ProductEmbedding.objects.get(items__item=items[0]).brand, "Tami")
+        self.assertEqual(prune_products(), 0)
+
+    def test_filters_are_rejected_in_products_mode(self):
+        with self.assertRaises(ValueError):
+            search_params(mode="products", filters={"category": "Dairy"})
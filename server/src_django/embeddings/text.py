@@ -0,0 +1,86 @@
+"""
+Text that gets embedded for an Item.
+
+Works on plain values() rows instead of model instances, so the embedding
+commands fetch only ITEM_COLUMNS and no unit/org joins.
+
+Bump TEMPLATE_VERSION whenever item_text() changes, then
+`generate_embedding --changed` re-encodes the items whose text differs.
+
+Products (ProductEmbedding) are identified by product_key(), so repeat
+purchases with other prices, receipts or spelling of the same product
+share one embedding.
+"""
+
+import hashlib
+import unicodedata
+
+TEMPLATE_VERSION = 1
+
+ITEM_COLUMNS = (
+    "id",
+    "name",
+    "price",
+    "quantity",
+    "ai_brand",
+    "ai_category",
+    "ai_quantity_value",
+    "ai_quantity_unit",
+    "transaction_id",
+    "transaction__issue_date",
+)
+
+
+def item_text(row):
+    """Embedded text of one ITEM_COLUMNS row."""
+    item_text = (
+        f"Item purchased: {row['name']} (ID: {row['id']}). "
+        f"Price: {row['price']} euros for {row['quantity']} units. "
+        f"Brand: {row['ai_brand']}, Category: {row['ai_category']}, "
+        f"Quantity Value: {row['ai_quantity_value']}, Unit: {row['ai_quantity_unit']}]."
+    )
+    trans_text = (
+        f"Receipt (Transaction) ID: {row['transaction_id']}. "
+        f"Date: {row['transaction__issue_date'].strftime('%Y-%m-%d %H:%M:%S')}."
+    )
+    return f"{item_text} Part of: {trans_text}"
+
+
+# words of the item_text() template, every text contains them so they match
+# everything and are dropped from full-text queries
+TEMPLATE_WORDS = (
+    "item", "purchased", "id", "price", "euros", "for", "units", "brand",
+    "category", "quantity", "value", "unit", "part", "of", "receipt",
+    "transaction", "date",
+)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+PRODUCT_COLUMNS = (
+    "id",
+    "ai_name_in_english_without_brand_and_quantity",
+    "ai_brand",
+    "ai_category",
+)
+
+
+def normalize_product_field(value):
+    """Case, unicode form and whitespace insensitive form of a product field."""
+    return " ".join(unicodedata.normalize("NFKC", value or "").casefold().split())
+
+
+def product_key(row):
+    """Dedup key of the product of one PRODUCT_COLUMNS row."""
+    fields = (row[column] for column in PRODUCT_COLUMNS[1:])
+    return content_hash("\x1f".join(normalize_product_field(value) for value in fields))
+
+
+def product_text(row):
+    """Embedded text of a product, nothing purchase specific."""
+    return (
+        f"Product: {row['ai_name_in_english_without_brand_and_quantity']}. "
+        f"Brand: {row['ai_brand']}, Category: {row['ai_category']}."
+    )
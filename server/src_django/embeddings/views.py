@@ -1,30 +1,36 @@
 import json
+
 import ollama
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from pgvector.django import CosineDistance
-from sentence_transformers import SentenceTransformer
 
 from .models import ItemEmbedding
+from .provider import get_embedding_model
 
 # INITIALIZATION
-try:
-    EMBEDDING_MODEL = SentenceTransformer(
-        "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
-    LLM_CLIENT = ollama.Client(host="http://localhost:11434")
-    LLM_CLIENT.list()  # checking for a connection
-    print("Models and Ollama client loaded successfully.")
-except Exception as e:
-    print(f"Failed to load models or connect to Ollama: {e}")
-    EMBEDDING_MODEL = None
-    LLM_CLIENT = None
+# the Ollama client is created (and checked) on the first request, the
+# embedding model comes from the shared lazy provider
+LLM_CLIENT = None
+
+
+def get_llm_client():
+    global LLM_CLIENT
+    if LLM_CLIENT is None:
+        client = ollama.Client(host="http://localhost:11434")
+        client.list()  # checking for a connection
+        LLM_CLIENT = client
+    return LLM_CLIENT
 
 
 @csrf_exempt
 def ask_rag_question(request):
     if request.method == "POST":
-        if not EMBEDDING_MODEL or not LLM_CLIENT:
+        try:
+            embedding_model = get_embedding_model()
+            llm_client = get_llm_client()
+        except Exception as e:
+            print(f"Failed to load models or connect to Ollama: {e}")
             return JsonResponse(
                 {"error": "Models or Ollama are not initialized."}, status=500
             )
@@ -39,7 +45,7 @@ def ask_rag_question(request):
             return JsonResponse({"error": "No query provided."}, status=400)
 
         try:
-            query_embedding = EMBEDDING_MODEL.encode(query)
+            query_embedding = embedding_model.encode(query)
 
             similar_items = (
                 ItemEmbedding.objects.annotate(
@@ -68,7 +74,7 @@ def ask_rag_question(request):
                 "Answer:"
             )
 
-            response = LLM_CLIENT.chat(  # MAKE CONNECTION WITH LM
+            response = llm_client.chat(  # MAKE CONNECTION WITH LM
                 model="llama3.1", messages=[{"role": "user", "content": prompt}]
             )
             answer = response["message"]["content"]
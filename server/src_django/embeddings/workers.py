@@ -0,0 +1,21 @@
+"""
+Encoding side of `generate_embedding --workers N`.
+
+Runs in spawned pool processes, each loads its own model copy once in
+init_worker(). Nothing here touches Django or the database, all reads and
+writes stay in the parent process.
+"""
+
+from .backends import load_model
+
+_model = None
+
+
+def init_worker(model_name, backend, onnx_file, threads):
+    global _model
+    # N processes x all cores each would oversubscribe the machine
+    _model = load_model(model_name, backend=backend, onnx_file=onnx_file, threads=threads)
+
+
+def encode_chunk(texts, batch_size):
+    return _model.encode(texts, batch_size=batch_size)
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from embeddings.provider import warm_up
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src_django.settings')
 
 application = get_asgi_application()
+
+# optional warm-up hook, the embedding model is otherwise loaded lazily
+if settings.EMBEDDING_WARMUP:
+    warm_up()
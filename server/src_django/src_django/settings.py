@@ -135,3 +135,83 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Receipts API
+# ?stream=1 on the receipts range endpoints streams the JSON array instead of
+# building it in memory, chunk size is the number of transactions fetched
+# from the server-side cursor at once
+
+RECEIPTS_STREAM_BY_DEFAULT = os.getenv("RECEIPTS_STREAM_BY_DEFAULT", "0") == "1"
+RECEIPTS_STREAM_CHUNK_SIZE = int(os.getenv("RECEIPTS_STREAM_CHUNK_SIZE", "500"))
+
+# ?page_size=N[&cursor=...] switches the range endpoints to keyset pagination,
+# larger page sizes are clamped to RECEIPTS_PAGE_SIZE_MAX
+RECEIPTS_PAGE_SIZE_DEFAULT = int(os.getenv("RECEIPTS_PAGE_SIZE_DEFAULT", "50"))
+RECEIPTS_PAGE_SIZE_MAX = int(os.getenv("RECEIPTS_PAGE_SIZE_MAX", "500"))
+
+# range listings concatenate the stored per-receipt JSON (api.ReceiptDocument)
+RECEIPTS_FROM_DOCUMENTS = os.getenv("RECEIPTS_FROM_DOCUMENTS", "1") == "1"
+
+# "orjson" (used if installed) or "django" (json + api.renderers.ApiJSONEncoder),
+# both write the same bytes
+API_JSON_ENCODER = os.getenv("API_JSON_ENCODER", "orjson")
+
+
+# Embeddings
+# the model is loaded lazily by embeddings.provider, EMBEDDING_WARMUP=1 loads
+# it when the WSGI/ASGI application starts
+
+EMBEDDING_MODEL_NAME = os.getenv(
+    "EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "0") == "1"
+
+# inference backend: "torch" or "onnx" (needs sentence-transformers[onnx]),
+# EMBEDDING_ONNX_FILE picks e.g. an int8 file (onnx/model_qint8_avx2.onnx),
+# EMBEDDING_THREADS=0 uses one thread per core
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# RAG query vectors cache: LRU size (0 disables it), TTL in seconds and an
+# optional CACHES alias (e.g. redis) shared by all workers
+EMBEDDING_QUERY_CACHE_SIZE = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+EMBEDDING_QUERY_CACHE_TTL = int(os.getenv("EMBEDDING_QUERY_CACHE_TTL", "3600"))
+EMBEDDING_QUERY_CACHE_SHARED_ALIAS = os.getenv("EMBEDDING_QUERY_CACHE_SHARED_ALIAS", "")
+
+# group concurrent RAG queries into one forward pass: up to
+# EMBEDDING_BATCH_MAX_SIZE queries arriving within EMBEDDING_BATCH_WAIT_MS
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "0") == "1"
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+# HNSW search defaults, a RAG request can override them (embeddings.search)
+EMBEDDING_HNSW_EF_SEARCH = int(os.getenv("EMBEDDING_HNSW_EF_SEARCH", "40"))
+EMBEDDING_HNSW_ITERATIVE_SCAN = os.getenv("EMBEDDING_HNSW_ITERATIVE_SCAN", "off")
+# used instead when a request has filters; servers before pgvector 0.8 have
+# no iterative scan, there the setting is skipped and filters may cut results
+EMBEDDING_HNSW_FILTERED_ITERATIVE_SCAN = os.getenv(
+    "EMBEDDING_HNSW_FILTERED_ITERATIVE_SCAN", "relaxed_order"
+)
+
+# index the RAG search runs on: "vector" (full precision), "halfvec" or
+# "binary" (compact indexes built by `manage.py embedding_index`, results are
+# re-ranked exactly over EMBEDDING_RERANK_FACTOR x more candidates)
+EMBEDDING_SEARCH_STORAGE = os.getenv("EMBEDDING_SEARCH_STORAGE", "vector")
+EMBEDDING_RERANK_FACTOR = int(os.getenv("EMBEDDING_RERANK_FACTOR", "4"))
+
+# default RAG search mode, "vector", "hybrid" (vector + full-text with rank
+# fusion), "receipts" (distinct receipts as JSON) or "products" (distinct
+# products from generate_product_embeddings as JSON), a request can pick its
+# own with "mode"
+EMBEDDING_SEARCH_MODE = os.getenv("EMBEDDING_SEARCH_MODE", "vector")
+# item candidates per requested receipt in the "receipts" mode, several hits
+# usually come from the same receipt
+EMBEDDING_RECEIPT_OVERFETCH = int(os.getenv("EMBEDDING_RECEIPT_OVERFETCH", "10"))
+
+# whole days of a statistics window are summed from the daily rollup tables
+# (db.DailyUnitRollup / db.DailyProductRollup) instead of the raw items
+RECEIPTS_STATISTICS_FROM_ROLLUPS = (
+    os.getenv("RECEIPTS_STATISTICS_FROM_ROLLUPS", "1") == "1"
+)
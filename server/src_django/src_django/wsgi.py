@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
+from embeddings.provider import warm_up
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src_django.settings')
 
 application = get_wsgi_application()
+
+# optional warm-up hook, the embedding model is otherwise loaded lazily
+if settings.EMBEDDING_WARMUP:
+    warm_up()
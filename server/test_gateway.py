@@ -0,0 +1,153 @@
+"""
+Tests of the in-process gateway path: proxy_backend() over
+StreamingASGITransport with toy ASGI apps instead of Django.
+
+    cd server && python -m unittest test_gateway
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi import HTTPException
+
+import main
+
+
+async def start(send, status=200):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+
+
+async def part(send, body, more_body=True):
+    await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+class InProcessGatewayTests(unittest.IsolatedAsyncioTestCase):
+    SLOTS = 2
+
+    def serve(self, asgi_app, buffer_chunks=2):
+        main.app.state.http = httpx.AsyncClient(
+            base_url="http://127.0.0.1",
+            transport=main.StreamingASGITransport(asgi_app, buffer_chunks),
+        )
+        main.app.state.backend_slots = asyncio.Semaphore(self.SLOTS)
+        self.addAsyncCleanup(main.app.state.http.aclose)
+
+    async def call(self):
+        return await main.proxy_backend("GET", "/api/x/", "receipts", "Django")
+
+    def free_slots(self):
+        return main.app.state.backend_slots._value
+
+    async def test_chunks_are_delivered_while_the_app_still_runs(self):
+        release = asyncio.Event()
+
+        async def asgi_app(scope, receive, send):
+            await start(send)
+            await part(send, b"first")
+            await release.wait()
+            await part(send, b"second", more_body=False)
+
+        self.serve(asgi_app)
+        response = await self.call()
+        self.assertEqual(response.status_code, 200)
+        body = response.body_iterator
+        self.assertEqual(await anext(body), b"first")
+        release.set()
+        self.assertEqual([chunk async for chunk in body], [b"second"])
+        self.assertEqual(self.free_slots(), self.SLOTS)
+
+    async def test_a_slow_client_holds_the_app_back(self):
+        sent = []
+
+        async def asgi_app(scope, receive, send):
+            await start(send)
+            for n in range(20):
+                await part(send, b"%d" % n)
+                sent.append(n)
+            await part(send, b"", more_body=False)
+
+        self.serve(asgi_app, buffer_chunks=2)
+        response = await self.call()
+        await asyncio.sleep(0.05)
+        # the queue holds 2 chunks, the third send blocks until the client reads
+        self.assertEqual(len(sent), 2)
+        chunks = [chunk async for chunk in response.body_iterator]
+        self.assertEqual(len(chunks), 20)
+
+    async def test_client_disconnect_cancels_the_app(self):
+        cancelled = asyncio.Event()
+
+        async def asgi_app(scope, receive, send):
+            await start(send)
+            try:
+                while True:
+                    await part(send, b"x")
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        self.serve(asgi_app)
+        response = await self.call()
+        body = response.body_iterator
+        await anext(body)
+        await body.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        self.assertEqual(self.free_slots(), self.SLOTS)
+
+    async def test_errors_before_the_response_release_the_slot(self):
+        async def asgi_app(scope, receive, send):
+            raise ValueError("boom")
+
+        self.serve(asgi_app)
+        # more failing calls than slots, none of them may block
+        for _ in range(self.SLOTS + 1):
+            with self.assertRaises(HTTPException) as raised:
+                await asyncio.wait_for(self.call(), 1)
+            self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(self.free_slots(), self.SLOTS)
+
+    async def test_errors_after_the_response_truncate_the_body(self):
+        async def asgi_app(scope, receive, send):
+            await start(send)
+            await part(send, b"[1, ")
+            raise ValueError("boom")
+
+        self.serve(asgi_app)
+        response = await self.call()
+        self.assertEqual([chunk async for chunk in response.body_iterator], [b"[1, "])
+        self.assertEqual(self.free_slots(), self.SLOTS)
+
+    async def test_route_timeouts_apply_in_process(self):
+        async def silent_app(scope, receive, send):
+            await asyncio.sleep(10)
+
+        async def stalling_app(scope, receive, send):
+            await start(send)
+            await part(send, b"[")
+            await asyncio.sleep(10)
+
+        with mock.patch.dict(main.ROUTE_TIMEOUTS, receipts=0.05):
+            self.serve(silent_app)
+            with self.assertRaises(HTTPException):
+                await asyncio.wait_for(self.call(), 1)
+            self.assertEqual(self.free_slots(), self.SLOTS)
+
+            self.serve(stalling_app)
+            response = await self.call()
+            body = response.body_iterator
+            self.assertEqual(await anext(body), b"[")
+            with self.assertRaises(httpx.ReadTimeout):
+                await asyncio.wait_for(anext(body), 1)
+        self.assertEqual(self.free_slots(), self.SLOTS)
+
+
+if __name__ == "__main__":
+    unittest.main()